@@ -0,0 +1,49 @@
+"""
+Gunicorn settings, picked up automatically from the working directory.
+
+The application is imported once in the master (``preload_app``) and warmed
+up there, so forked workers share the already imported PDF/QR/number
+libraries and compiled templates copy-on-write instead of each loading them
+on their first request. Command line flags (as in the Procfile and the
+systemd unit) override the values below.
+"""
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '127.0.0.1:8000')
+workers = int(os.environ.get('GUNICORN_WORKERS', 3))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 120))
+preload_app = os.environ.get('GUNICORN_PRELOAD', '1') == '1'
+wsgi_app = 'invoice.wsgi:application'
+
+
+def when_ready(server):
+    if not preload_app:
+        return
+    from invoices.warmup import warm_up
+    timings = warm_up()
+    server.log.info('Warm-up in master: %s', _format(timings))
+
+
+def post_fork(server, worker):
+    if not preload_app:
+        # Django is not even configured in the master then
+        return
+    # Database connections opened while warming up in the master must not be
+    # shared between processes.
+    from django.db import connections
+    connections.close_all()
+
+
+def post_worker_init(worker):
+    # Runs once the worker has loaded the application, with or without
+    # preload_app: cheap after a preloaded warm-up, the full cost without it
+    from invoices.warmup import warm_up
+    timings = warm_up()
+    worker.log.info('Worker %s warm-up: %s', worker.pid, _format(timings))
+
+
+def _format(timings):
+    return ', '.join(
+        f'{name} {"missing" if seconds is None else f"{seconds * 1000:.0f}ms"}'
+        for name, seconds in timings.items()
+    )
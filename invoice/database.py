@@ -0,0 +1,113 @@
+"""
+Environment-driven database configuration.
+
+``DATABASE_ENGINE`` selects the profile:
+
+* ``sqlite`` (default) - ``db.sqlite3`` next to ``manage.py`` (or
+  ``SQLITE_PATH``), tuned on every new connection with WAL journaling,
+  ``synchronous=NORMAL``, a busy timeout, memory-mapped I/O and a larger page
+  cache so that several gunicorn workers can share the file without
+  "database is locked" errors.
+* ``postgresql`` - ``DATABASE_NAME``, ``DATABASE_USER``, ``DATABASE_PASSWORD``,
+  ``DATABASE_HOST`` and ``DATABASE_PORT``, with persistent connections and
+  health checks. ``DATABASE_POOL_SIZE`` switches to psycopg's connection pool
+  (requires ``psycopg[pool]``).
+
+A read replica is added as the ``replica`` alias when ``DATABASE_REPLICA_HOST``
+(PostgreSQL) or ``SQLITE_REPLICA_PATH`` (a local SQLite stand-in) is set; see
+``invoice.routers`` for how reads are sent to it.
+
+``SQLITE_SOURCE_PATH`` adds a ``legacy`` alias pointing at an existing SQLite
+file so ``manage.py copy_database`` can move its data into PostgreSQL.
+"""
+import os
+
+SQLITE_PRAGMAS = {
+    'journal_mode': os.environ.get('SQLITE_JOURNAL_MODE', 'WAL'),
+    'synchronous': os.environ.get('SQLITE_SYNCHRONOUS', 'NORMAL'),
+    'busy_timeout': int(os.environ.get('SQLITE_BUSY_TIMEOUT_MS', 20000)),
+    'mmap_size': int(os.environ.get('SQLITE_MMAP_SIZE', 256 * 1024 * 1024)),
+    # Negative values are KiB rather than pages
+    'cache_size': int(os.environ.get('SQLITE_CACHE_SIZE', -64000)),
+    'temp_store': 'MEMORY',
+}
+
+
+def sqlite_config(path):
+    """Settings for a tuned SQLite database file"""
+    return {
+        'ENGINE': 'django.db.backends.sqlite3',
+        'NAME': path,
+        'OPTIONS': {
+            'timeout': SQLITE_PRAGMAS['busy_timeout'] / 1000,
+            # Take the write lock when a transaction starts instead of failing
+            # half-way through when another worker is writing.
+            'transaction_mode': 'IMMEDIATE',
+        },
+    }
+
+
+def postgresql_config():
+    """Settings for PostgreSQL with persistent or pooled connections"""
+    config = {
+        'ENGINE': 'django.db.backends.postgresql',
+        'NAME': os.environ.get('DATABASE_NAME', 'squarem'),
+        'USER': os.environ.get('DATABASE_USER', 'squarem'),
+        'PASSWORD': os.environ.get('DATABASE_PASSWORD', ''),
+        'HOST': os.environ.get('DATABASE_HOST', 'localhost'),
+        'PORT': os.environ.get('DATABASE_PORT', '5432'),
+        'CONN_MAX_AGE': int(os.environ.get('DATABASE_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': True,
+        'OPTIONS': {},
+    }
+    pool_size = int(os.environ.get('DATABASE_POOL_SIZE', 0))
+    if pool_size:
+        # The pool manages connection lifetime itself
+        config['CONN_MAX_AGE'] = 0
+        config['OPTIONS']['pool'] = {
+            'min_size': min(2, pool_size),
+            'max_size': pool_size,
+            'timeout': 10,
+        }
+    return config
+
+
+def replica_config(engine):
+    """Settings for the read replica, or None when no replica is configured"""
+    if engine == 'postgresql' and os.environ.get('DATABASE_REPLICA_HOST'):
+        config = postgresql_config()
+        config['HOST'] = os.environ['DATABASE_REPLICA_HOST']
+        config['PORT'] = os.environ.get('DATABASE_REPLICA_PORT', config['PORT'])
+    elif engine != 'postgresql' and os.environ.get('SQLITE_REPLICA_PATH'):
+        config = sqlite_config(os.environ['SQLITE_REPLICA_PATH'])
+    else:
+        return None
+    # Test runs read the primary through the replica alias
+    config['TEST'] = {'MIRROR': 'default'}
+    return config
+
+
+def database_config(base_dir):
+    """Build the DATABASES setting from the environment"""
+    engine = os.environ.get('DATABASE_ENGINE', 'sqlite')
+    if engine == 'postgresql':
+        databases = {'default': postgresql_config()}
+    else:
+        databases = {'default': sqlite_config(os.environ.get('SQLITE_PATH', base_dir / 'db.sqlite3'))}
+
+    replica = replica_config(engine)
+    if replica:
+        databases['replica'] = replica
+
+    if os.environ.get('SQLITE_SOURCE_PATH'):
+        databases['legacy'] = sqlite_config(os.environ['SQLITE_SOURCE_PATH'])
+    return databases
+
+
+def configure_sqlite_connection(sender, connection, **kwargs):
+    """connection_created hook applying SQLITE_PRAGMAS to new SQLite connections"""
+    if connection.vendor != 'sqlite':
+        return
+    with connection.cursor() as cursor:
+        for pragma, value in SQLITE_PRAGMAS.items():
+            cursor.execute(f'PRAGMA {pragma} = {value}')
@@ -0,0 +1,113 @@
+"""
+Read-replica routing.
+
+Views decorated with ``@read_replica`` send their reads to the ``replica``
+database alias; every write, and every read outside such a view, goes to the
+primary. A user who has just written something keeps reading from the
+primary for ``REPLICA_STICKY_SECONDS`` so they never see replication lag on
+their own changes.
+"""
+import time
+from contextvars import ContextVar
+from functools import wraps
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+REPLICA_ALIAS = 'replica'
+STICKY_COOKIE = 'primary_until'
+
+_read_alias = ContextVar('read_alias', default=None)
+
+
+class ReplicaRouter:
+    """Route reads to the alias chosen by @read_replica, writes to default"""
+
+    def db_for_read(self, model, **hints):
+        return _read_alias.get()
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # The replica is a copy of the primary, so objects may be related freely
+        return True
+
+    def allow_migrate(self, db, app_label, **hints):
+        # The replica's schema arrives through replication
+        return db != REPLICA_ALIAS
+
+
+def replica_available():
+    return REPLICA_ALIAS in settings.DATABASES
+
+
+def is_sticky(request):
+    """Whether the user wrote recently and must read from the primary"""
+    try:
+        return float(request.COOKIES.get(STICKY_COOKIE, 0)) > time.time()
+    except ValueError:
+        return False
+
+
+def read_replica(view):
+    """Run a read-only view (sync or async) against the replica database"""
+    if iscoroutinefunction(view):
+        @wraps(view)
+        async def async_wrapper(request, *args, **kwargs):
+            if not replica_available() or is_sticky(request):
+                return await view(request, *args, **kwargs)
+            # The async ORM copies this context into its worker thread
+            token = _read_alias.set(REPLICA_ALIAS)
+            try:
+                return await view(request, *args, **kwargs)
+            finally:
+                _read_alias.reset(token)
+        return async_wrapper
+
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        if not replica_available() or is_sticky(request):
+            return view(request, *args, **kwargs)
+        token = _read_alias.set(REPLICA_ALIAS)
+        try:
+            return view(request, *args, **kwargs)
+        finally:
+            _read_alias.reset(token)
+    return wrapper
+
+
+class StickyPrimaryMiddleware:
+    """Pin a user's reads to the primary for a while after a write request"""
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        response = self.get_response(request)
+        self.mark_sticky(request, response)
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        self.mark_sticky(request, response)
+        return response
+
+    def mark_sticky(self, request, response):
+        if request.method not in ('GET', 'HEAD', 'OPTIONS') and replica_available():
+            window = getattr(settings, 'REPLICA_STICKY_SECONDS', 10)
+            response.set_cookie(
+                STICKY_COOKIE,
+                str(time.time() + window),
+                max_age=window,
+                httponly=True,
+                samesite='Lax',
+                secure=settings.SESSION_COOKIE_SECURE,
+            )
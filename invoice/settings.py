@@ -10,8 +10,11 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/6.0/ref/settings/
 """
 
+import os
 from pathlib import Path
 
+from .database import database_config
+
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
 BASE_DIR = Path(__file__).resolve().parent.parent
 
@@ -54,6 +57,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'invoice.routers.StickyPrimaryMiddleware',
 ]
 
 ROOT_URLCONF = 'invoice.urls'
@@ -79,14 +83,53 @@ WSGI_APPLICATION = 'invoice.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/6.0/ref/settings/#databases
 
-DATABASES = {
+# Configured from the environment; see invoice/database.py for the variables.
+DATABASES = database_config(BASE_DIR)
+
+# Reads in @read_replica views go to the "replica" alias when one is configured.
+# After a write, the same user reads from the primary for this many seconds.
+DATABASE_ROUTERS = ['invoice.routers.ReplicaRouter']
+REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 10))
+
+
+# Serve the dashboard, invoice list/detail and PDFs from async views (for
+# uvicorn; see deployment/uvicorn.service). PDFs then render in a pool of
+# PDF_PROCESSES processes (default: one per CPU).
+ASYNC_VIEWS = os.environ.get('ASYNC_VIEWS') == '1'
+PDF_PROCESSES = int(os.environ.get('PDF_PROCESSES', 0)) or None
+
+
+# Cache
+# File-based so that every gunicorn worker sees the same entries and
+# invalidations (dashboard summary, etc.).
+
+CACHES = {
     'default': {
-        'ENGINE': 'django.db.backends.sqlite3',
-        'NAME': BASE_DIR / 'db.sqlite3',
+        'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+        'LOCATION': BASE_DIR / 'cache',
+        'TIMEOUT': 300,
+        'OPTIONS': {
+            'MAX_ENTRIES': 5000,
+        },
     }
 }
 
 
+# Sessions
+# "cached_db" (default) serves sessions from the shared cache and falls back
+# to the database; "signed_cookies" keeps them in the cookie itself, with no
+# server-side lookup, but a copied cookie stays valid until it expires even
+# after logout.
+SESSION_ENGINE = {
+    'db': 'django.contrib.sessions.backends.db',
+    'cached_db': 'django.contrib.sessions.backends.cached_db',
+    'signed_cookies': 'django.contrib.sessions.backends.signed_cookies',
+}[os.environ.get('SESSION_BACKEND', 'cached_db')]
+
+# request.user is served from a per-worker cache; see invoices/auth.py
+AUTHENTICATION_BACKENDS = ['invoices.auth.CachedModelBackend']
+
+
 # Password validation
 # https://docs.djangoproject.com/en/6.0/ref/settings/#auth-password-validators
 
@@ -139,6 +182,27 @@ STORAGES = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Where manage.py backup writes snapshots
+BACKUP_ROOT = Path(os.environ.get('BACKUP_DIR', BASE_DIR / 'backups'))
+
+# The change feed (/api/changes/) only serves entries this many seconds old,
+# so a write transaction that commits late is not skipped by a cursor
+CHANGES_SETTLE_SECONDS = int(os.environ.get('CHANGES_SETTLE_SECONDS', 10))
+
+# Outgoing email. Invoices and receipts are sent by the background worker
+# (manage.py run_worker). For local testing set EMAIL_BACKEND to
+# django.core.mail.backends.filebased.EmailBackend (writes to EMAIL_FILE_PATH)
+# or point EMAIL_HOST/EMAIL_PORT at an SMTP stand-in such as aiosmtpd.
+EMAIL_BACKEND = os.environ.get('EMAIL_BACKEND', 'django.core.mail.backends.smtp.EmailBackend')
+EMAIL_HOST = os.environ.get('EMAIL_HOST', 'localhost')
+EMAIL_PORT = int(os.environ.get('EMAIL_PORT', 25))
+EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
+EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
+EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS') == '1'
+EMAIL_TIMEOUT = 30
+EMAIL_FILE_PATH = os.environ.get('EMAIL_FILE_PATH', BASE_DIR / 'sent_emails')
+DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', 'invoices@squarem.in')
+
 # Login URLs
 LOGIN_URL = 'login'
 LOGIN_REDIRECT_URL = 'dashboard'
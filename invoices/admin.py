@@ -1,5 +1,20 @@
 from django.contrib import admin
-from .models import Company, Client, Invoice, InvoiceItem, PaymentInfo
+from .exports import EXPORT_LABELS, export_response
+from .jobs import queue_stats, retry_jobs
+from .emails import queue_invoice_emails
+from .models import (
+    ArchivedInvoice, Company, Client, EmailDelivery, ExchangeRate, ImportCheckpoint, Invoice, InvoiceItem, Job,
+    PaymentInfo, RecurringInvoice, RecurringInvoiceItem, RecurringRun,
+)
+
+
+def export_action(dataset, export_format):
+    """Admin action streaming an export of the selected invoices"""
+    def action(modeladmin, request, queryset):
+        return export_response(dataset, queryset, export_format)
+    action.__name__ = f'export_{dataset}_{export_format}'
+    action.short_description = f'Export {EXPORT_LABELS[dataset].lower()} of selected invoices ({export_format.upper()})'
+    return action
 
 
 class InvoiceItemInline(admin.TabularInline):
@@ -70,9 +85,16 @@ class InvoiceAdmin(admin.ModelAdmin):
     list_display = ['invoice_number', 'client', 'company', 'invoice_date', 'due_date', 'total', 'status', 'created_at']
     list_filter = ['status', 'currency', 'invoice_date', 'created_at']
     search_fields = ['invoice_number', 'client__name', 'company__name']
-    readonly_fields = ['invoice_number', 'subtotal', 'tax_amount', 'discount_amount', 'total', 'qr_code', 'created_at', 'updated_at']
+    readonly_fields = [
+        'invoice_number', 'subtotal', 'tax_amount', 'discount_amount', 'total',
+        'exchange_rate', 'total_base', 'amount_paid_base', 'qr_code', 'created_at', 'updated_at',
+    ]
     date_hierarchy = 'invoice_date'
     inlines = [InvoiceItemInline]
+    actions = ['email_invoices'] + [
+        export_action(dataset, export_format)
+        for dataset in EXPORT_LABELS for export_format in ('csv', 'xlsx')
+    ]
     
     fieldsets = (
         ('Invoice Details', {
@@ -81,6 +103,10 @@ class InvoiceAdmin(admin.ModelAdmin):
         ('Amounts', {
             'fields': ('subtotal', 'discount_amount', 'tax_amount', 'total', 'amount_paid')
         }),
+        ('In Rupees', {
+            'fields': ('exchange_rate', 'total_base', 'amount_paid_base'),
+            'classes': ('collapse',)
+        }),
         ('Additional Info', {
             'fields': ('notes', 'terms', 'qr_code'),
             'classes': ('collapse',)
@@ -97,6 +123,11 @@ class InvoiceAdmin(admin.ModelAdmin):
             obj.created_by = request.user
         super().save_model(request, obj, form, change)
 
+    @admin.action(description='Email selected invoices to their clients')
+    def email_invoices(self, request, queryset):
+        deliveries, skipped = queue_invoice_emails(queryset.select_related('client'), request.user)
+        self.message_user(request, f'{len(deliveries)} invoices queued for email, {len(skipped)} without an address.')
+
 
 @admin.register(InvoiceItem)
 class InvoiceItemAdmin(admin.ModelAdmin):
@@ -128,6 +159,121 @@ class PaymentInfoAdmin(admin.ModelAdmin):
     )
 
 
+@admin.register(ArchivedInvoice)
+class ArchivedInvoiceAdmin(admin.ModelAdmin):
+    """Read-only admin for invoices moved out by archive_invoices"""
+    list_display = ['invoice_number', 'client', 'company', 'invoice_date', 'fiscal_year', 'total', 'status', 'archived_at']
+    list_filter = ['fiscal_year', 'status', 'currency']
+    search_fields = ['invoice_number', 'client__name', 'company__name']
+    date_hierarchy = 'invoice_date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    # Revenue rollups are recomputed from archived invoices; restore one instead
+    def has_delete_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ImportCheckpoint)
+class ImportCheckpointAdmin(admin.ModelAdmin):
+    """Read-only progress of import_csv runs"""
+    list_display = ['filename', 'kind', 'rows_done', 'created', 'skipped', 'failed', 'finished', 'updated_at']
+    list_filter = ['kind', 'finished']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(EmailDelivery)
+class EmailDeliveryAdmin(admin.ModelAdmin):
+    """Delivery status of emailed invoices and receipts"""
+    list_display = ['invoice', 'kind', 'recipient', 'status', 'attempts', 'created_at', 'sent_at']
+    list_filter = ['status', 'kind']
+    search_fields = ['invoice__invoice_number', 'recipient', 'error']
+    list_select_related = ['invoice']
+    date_hierarchy = 'created_at'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    """Background jobs, with the queue depth above the list"""
+    list_display = ['task', 'status', 'priority', 'run_at', 'attempts', 'max_attempts', 'locked_by', 'created_at', 'finished_at']
+    list_filter = ['status', 'task']
+    search_fields = ['task', 'last_error']
+    date_hierarchy = 'created_at'
+    actions = ['retry']
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+    @admin.action(description='Retry selected failed jobs')
+    def retry(self, request, queryset):
+        count = retry_jobs(queryset)
+        self.message_user(request, f'{count} jobs queued again.')
+
+    def changelist_view(self, request, extra_context=None):
+        extra_context = {**(extra_context or {}), 'queue': queue_stats()}
+        return super().changelist_view(request, extra_context)
+
+
+
+class RecurringInvoiceItemInline(admin.TabularInline):
+    """Inline for recurring invoice items"""
+    model = RecurringInvoiceItem
+    extra = 1
+    fields = ['description', 'unit_type', 'quantity', 'rate', 'discount', 'tax_rate']
+
+
+@admin.register(RecurringInvoice)
+class RecurringInvoiceAdmin(admin.ModelAdmin):
+    """Admin interface for recurring invoice schedules"""
+    list_display = ['name', 'client', 'company', 'interval', 'next_run', 'last_run', 'end_date', 'auto_send', 'is_active']
+    list_filter = ['is_active', 'interval', 'auto_send', 'company']
+    search_fields = ['name', 'client__name']
+    list_select_related = ['client', 'company']
+    readonly_fields = ['last_run', 'created_by', 'created_at', 'updated_at']
+    inlines = [RecurringInvoiceItemInline]
+
+
+@admin.register(RecurringRun)
+class RecurringRunAdmin(admin.ModelAdmin):
+    """Read-only log of the invoices generated by recurring schedules"""
+    list_display = ['recurring_invoice', 'run_date', 'invoice', 'created_at']
+    search_fields = ['recurring_invoice__name', 'invoice__invoice_number']
+    list_select_related = ['recurring_invoice', 'invoice']
+    date_hierarchy = 'run_date'
+
+    def has_add_permission(self, request):
+        return False
+
+    def has_change_permission(self, request, obj=None):
+        return False
+
+
+@admin.register(ExchangeRate)
+class ExchangeRateAdmin(admin.ModelAdmin):
+    """Exchange rates for the rupee totals (bulk loads: load_exchange_rates)"""
+    list_display = ['currency', 'date', 'rate', 'updated_at']
+    list_filter = ['currency']
+    date_hierarchy = 'date'
+
+
 # Customize admin site header
 admin.site.site_header = "Squarem Invoice Administration"
 admin.site.site_title = "Squarem Invoice Admin"
@@ -0,0 +1,340 @@
+"""
+In-process columnar cache for ad-hoc pivot reports.
+
+Invoice, line item and payment facts are loaded once per worker into NumPy
+column arrays. Dimensions (month, client, company, status, currency, tax rate,
+...) are dictionary-encoded into small integer codes, and measures are stored
+as float64 columns, so a group-by/filter/sum is a handful of vectorised array
+operations instead of a database round trip. Clients and companies are stored
+by primary key and named through ``dimension_labels`` when a report is shown,
+so renaming one does not leave its old name in the cache.
+
+The cache refreshes incrementally: invoices and payments whose ``updated_at``
+moved past the last watermark are reloaded and replace their old rows.
+Deleted rows never move the watermark; when a table's row count differs from
+the database, its ids are compared with the database's and the invoices
+that lost rows are reloaded. A new ``analytics`` cache version, as left by
+``restore_backup`` clearing the shared cache, makes every worker reload
+from scratch, since the watermark says nothing about a restored database.
+"""
+import sys
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+import numpy as np
+from django.conf import settings
+from django.db.models import F
+
+from .caching import get_version
+from .companies import all_companies
+from .models import Client, Invoice, InvoiceItem, Payment
+
+# Re-read rows slightly older than the watermark so that transactions which
+# committed late with an earlier timestamp are not missed.
+WATERMARK_OVERLAP = timedelta(seconds=5)
+CHUNK_SIZE = 5000
+ANALYTICS_NAMESPACE = 'analytics'
+
+
+class FactTable:
+    """Dictionary-encoded dimension columns plus float measure columns"""
+
+    def __init__(self, name, dimensions, measures, key=None):
+        self.name = name
+        # Row field kept alongside invoice_id to tell rows apart, e.g. the payment pk
+        self.key = key
+        self.dimensions = list(dimensions)
+        self.measures = list(measures)
+        self.values = {dim: [] for dim in self.dimensions}
+        self.lookup = {dim: {} for dim in self.dimensions}
+        self.codes = {dim: np.empty(0, dtype=np.int32) for dim in self.dimensions}
+        self.columns = {measure: np.empty(0, dtype=np.float64) for measure in self.measures}
+        self.invoice_ids = np.empty(0, dtype=np.int64)
+        self.row_ids = np.empty(0, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.invoice_ids)
+
+    def _encode(self, dim, value):
+        lookup = self.lookup[dim]
+        code = lookup.get(value)
+        if code is None:
+            code = lookup[value] = len(self.values[dim])
+            self.values[dim].append(value)
+        return code
+
+    def replace(self, invoice_ids, rows):
+        """Drop rows of the given invoices and append freshly loaded ones"""
+        if len(invoice_ids) and len(self.invoice_ids):
+            keep = ~np.isin(self.invoice_ids, np.fromiter(invoice_ids, dtype=np.int64))
+            self.invoice_ids = self.invoice_ids[keep]
+            if self.key:
+                self.row_ids = self.row_ids[keep]
+            for dim in self.dimensions:
+                self.codes[dim] = self.codes[dim][keep]
+            for measure in self.measures:
+                self.columns[measure] = self.columns[measure][keep]
+        self.append(rows)
+
+    def append(self, rows):
+        """Append rows given as dicts with invoice_id, dimensions and measures"""
+        if not rows:
+            return
+        self.invoice_ids = np.concatenate([
+            self.invoice_ids, np.fromiter((row['invoice_id'] for row in rows), dtype=np.int64, count=len(rows))
+        ])
+        if self.key:
+            self.row_ids = np.concatenate([
+                self.row_ids, np.fromiter((row[self.key] for row in rows), dtype=np.int64, count=len(rows))
+            ])
+        for dim in self.dimensions:
+            new_codes = np.fromiter(
+                (self._encode(dim, row[dim]) for row in rows), dtype=np.int32, count=len(rows)
+            )
+            self.codes[dim] = np.concatenate([self.codes[dim], new_codes])
+        for measure in self.measures:
+            new_values = np.fromiter(
+                (float(row[measure] or 0) for row in rows), dtype=np.float64, count=len(rows)
+            )
+            self.columns[measure] = np.concatenate([self.columns[measure], new_values])
+
+    def query(self, group_by=(), filters=None, measures=None):
+        """Filter rows, group them by dimensions and sum measures.
+
+        ``filters`` maps a dimension to an iterable of allowed values. Returns
+        a list of dicts with the group values, ``count`` and one sum per
+        measure, largest first by the first measure.
+        """
+        measures = list(measures or self.measures)
+        for name in list(group_by) + list(filters or {}):
+            if name not in self.dimensions:
+                raise ValueError(f'Unknown dimension "{name}" for {self.name}')
+        for name in measures:
+            if name not in self.columns:
+                raise ValueError(f'Unknown measure "{name}" for {self.name}')
+
+        mask = np.ones(len(self), dtype=bool)
+        for dim, allowed in (filters or {}).items():
+            allowed_codes = [self.lookup[dim][value] for value in allowed if value in self.lookup[dim]]
+            mask &= np.isin(self.codes[dim], np.array(allowed_codes, dtype=np.int32))
+
+        if not group_by:
+            row = {'count': int(mask.sum())}
+            for measure in measures:
+                row[measure] = float(self.columns[measure][mask].sum())
+            return [row]
+
+        # Combine the group codes into one integer key per row
+        group_codes = [self.codes[dim][mask] for dim in group_by]
+        sizes = [max(len(self.values[dim]), 1) for dim in group_by]
+        keys = np.ravel_multi_index(group_codes, sizes)
+        unique_keys, inverse = np.unique(keys, return_inverse=True)
+
+        counts = np.bincount(inverse, minlength=len(unique_keys))
+        sums = {
+            measure: np.bincount(inverse, weights=self.columns[measure][mask], minlength=len(unique_keys))
+            for measure in measures
+        }
+
+        results = []
+        for index, group in enumerate(zip(*np.unravel_index(unique_keys, sizes))):
+            row = {dim: self.values[dim][code] for dim, code in zip(group_by, group)}
+            row['count'] = int(counts[index])
+            for measure in measures:
+                row[measure] = float(sums[measure][index])
+            results.append(row)
+        if measures:
+            results.sort(key=lambda row: row[measures[0]], reverse=True)
+        return results
+
+    def memory_usage(self):
+        """Approximate bytes held by the arrays and dimension dictionaries"""
+        total = self.invoice_ids.nbytes + self.row_ids.nbytes
+        total += sum(codes.nbytes for codes in self.codes.values())
+        total += sum(column.nbytes for column in self.columns.values())
+        for dim in self.dimensions:
+            total += sys.getsizeof(self.values[dim]) + sys.getsizeof(self.lookup[dim])
+            total += sum(sys.getsizeof(value) for value in self.values[dim])
+        return total
+
+
+def _month(day):
+    return day.strftime('%Y-%m')
+
+
+def dimension_labels(dim, values):
+    """{value: label} for showing dimension values; clients and companies by their current name"""
+    if dim == 'client':
+        names = dict(Client.objects.order_by().values_list('pk', 'name'))
+    elif dim == 'company':
+        names = {company.pk: company.name for company in all_companies()}
+    else:
+        return {value: value for value in values}
+    return {value: names.get(value, f'#{value}') for value in values}
+
+
+class AnalyticsCache:
+    """Per-worker fact tables for invoices, line items and payments"""
+
+    INVOICE_DIMENSIONS = ('month', 'client', 'company', 'status', 'currency', 'is_quotation')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.version = None
+        self.watermark = None
+        self.last_refresh = 0.0
+        self.refresh_seconds = getattr(settings, 'ANALYTICS_REFRESH_SECONDS', 2)
+        self.tables = self._build_tables()
+
+    def _build_tables(self):
+        return {
+            'invoices': FactTable('invoices', self.INVOICE_DIMENSIONS, ('total', 'amount_paid', 'balance')),
+            'items': FactTable(
+                'items', self.INVOICE_DIMENSIONS + ('tax_rate', 'unit_type'), ('quantity', 'taxable', 'tax', 'amount')
+            ),
+            'payments': FactTable(
+                'payments', ('month', 'client', 'company', 'currency', 'method'), ('amount',), key='pk'
+            ),
+        }
+
+    def refresh(self, force=False):
+        """Load rows changed since the watermark"""
+        with self.lock:
+            if not force and time.monotonic() - self.last_refresh < self.refresh_seconds:
+                return
+            version = get_version(ANALYTICS_NAMESPACE)
+            if version != self.version:
+                self.version = version
+                self.watermark = None
+                self.tables = self._build_tables()
+            if self.watermark is None:
+                self._load(None)
+            else:
+                self._load_changes()
+            self.last_refresh = time.monotonic()
+
+    def _load_changes(self):
+        since = self.watermark - WATERMARK_OVERLAP
+        invoice_ids = set(Invoice.objects.order_by().filter(updated_at__gte=since).values_list('pk', flat=True))
+        invoice_ids.update(
+            Payment.objects.order_by().filter(updated_at__gte=since).values_list('invoice_id', flat=True)
+        )
+        if invoice_ids:
+            self._load(invoice_ids)
+
+        # Deleted rows never show up past the watermark; notice them by count,
+        # then reload only the invoices that lost rows
+        invoices = self.tables['invoices']
+        if Invoice.objects.count() != len(invoices):
+            deleted = set(invoices.invoice_ids.tolist()) - set(Invoice.objects.values_list('pk', flat=True))
+            for table in self.tables.values():
+                table.replace(deleted, [])
+        payments = self.tables['payments']
+        if Payment.objects.count() != len(payments):
+            deleted = np.setdiff1d(
+                payments.row_ids, np.fromiter(Payment.objects.values_list('pk', flat=True), dtype=np.int64)
+            )
+            affected = set(payments.invoice_ids[np.isin(payments.row_ids, deleted)].tolist())
+            if affected:
+                self._load(affected)
+
+    def _load(self, invoice_ids):
+        invoices = Invoice.objects.order_by()
+        items = InvoiceItem.objects.order_by()
+        if invoice_ids is not None:
+            invoices = invoices.filter(pk__in=invoice_ids)
+            items = items.filter(invoice_id__in=invoice_ids)
+
+        invoice_rows = []
+        watermark = self.watermark
+        for row in invoices.values(
+            'pk', 'invoice_date', 'client_id', 'company_id', 'status', 'currency',
+            'is_quotation', 'total', 'amount_paid', 'updated_at',
+        ).iterator(chunk_size=CHUNK_SIZE):
+            invoice_rows.append({
+                'invoice_id': row['pk'],
+                'month': _month(row['invoice_date']),
+                'client': row['client_id'],
+                'company': row['company_id'],
+                'status': row['status'],
+                'currency': row['currency'],
+                'is_quotation': row['is_quotation'],
+                'total': row['total'],
+                'amount_paid': row['amount_paid'],
+                'balance': row['total'] - row['amount_paid'],
+            })
+            if watermark is None or row['updated_at'] > watermark:
+                watermark = row['updated_at']
+
+        item_rows = []
+        for row in items.values(
+            'invoice_id', 'invoice__invoice_date', 'invoice__client_id', 'invoice__company_id',
+            'invoice__status', 'invoice__currency', 'invoice__is_quotation',
+            'tax_rate', 'unit_type', 'quantity', 'rate', 'discount', 'amount',
+        ).iterator(chunk_size=CHUNK_SIZE):
+            taxable = row['quantity'] * row['rate'] * (1 - row['discount'] / 100)
+            item_rows.append({
+                'invoice_id': row['invoice_id'],
+                'month': _month(row['invoice__invoice_date']),
+                'client': row['invoice__client_id'],
+                'company': row['invoice__company_id'],
+                'status': row['invoice__status'],
+                'currency': row['invoice__currency'],
+                'is_quotation': row['invoice__is_quotation'],
+                'tax_rate': f"{row['tax_rate'].normalize():f}%",
+                'unit_type': row['unit_type'],
+                'quantity': row['quantity'],
+                'taxable': taxable,
+                'tax': taxable * row['tax_rate'] / 100,
+                'amount': row['amount'],
+            })
+
+        payment_rows = list(self._payment_rows(invoice_ids))
+        for row in payment_rows:
+            if watermark is None or row['updated_at'] > watermark:
+                watermark = row['updated_at']
+
+        ids = invoice_ids if invoice_ids is not None else set()
+        self.tables['invoices'].replace(ids, invoice_rows)
+        self.tables['items'].replace(ids, item_rows)
+        self.tables['payments'].replace(ids, payment_rows)
+        self.watermark = watermark or self.watermark or datetime(1970, 1, 1, tzinfo=timezone.utc)
+
+    def _payment_rows(self, invoice_ids):
+        payments = Payment.objects.order_by()
+        if invoice_ids is not None:
+            payments = payments.filter(invoice_id__in=invoice_ids)
+        for row in payments.values(
+            'pk', 'invoice_id', 'paid_on', 'method', 'amount', 'updated_at',
+            client=F('invoice__client_id'),
+            company=F('invoice__company_id'),
+            currency=F('invoice__currency'),
+        ).iterator(chunk_size=CHUNK_SIZE):
+            row['month'] = _month(row.pop('paid_on'))
+            yield row
+
+    def query(self, table, group_by=(), filters=None, measures=None):
+        """Refresh if due, then run a group-by/filter/sum on one fact table"""
+        self.refresh()
+        if table not in self.tables:
+            raise ValueError(f'Unknown fact table "{table}"')
+        return self.tables[table].query(group_by, filters, measures)
+
+    def memory_usage(self):
+        """Approximate bytes held per fact table"""
+        return {name: table.memory_usage() for name, table in self.tables.items()}
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_analytics_cache():
+    """Get this worker's analytics cache, creating it on first use"""
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = AnalyticsCache()
+    return _cache
@@ -0,0 +1,73 @@
+"""
+JSON API for integrations.
+
+Requests authenticate with a session or HTTP Basic credentials (see
+``invoices.auth.api_login_required``) and always get JSON back.
+"""
+import json
+
+from django.http import JsonResponse
+from django.views.decorators.csrf import csrf_exempt
+
+from invoice.routers import read_replica
+
+from .auth import api_login_required
+from .bulk import MAX_BATCH_SIZE, BatchError, create_invoices
+from .changes import PAGE_SIZE, CursorError, read_changes
+
+
+def read_json(request):
+    """The decoded request body; raises BatchError if it is not a JSON object"""
+    try:
+        payload = json.loads(request.body)
+    except (UnicodeDecodeError, ValueError):
+        raise BatchError('Request body is not valid JSON.')
+    if not isinstance(payload, dict):
+        raise BatchError('Request body must be a JSON object.')
+    return payload
+
+
+@csrf_exempt
+@api_login_required
+def invoice_bulk_create(request):
+    """Create a batch of invoices with nested items and payments.
+
+    Body: ``{"invoices": [...], "all_or_nothing": false}``, each invoice
+    holding the invoice form fields plus ``items``, ``payments`` and an
+    optional ``reference`` echoed back in its result.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    try:
+        payload = read_json(request)
+        all_or_nothing = bool(payload.get('all_or_nothing'))
+        results = create_invoices(payload.get('invoices'), request.user, all_or_nothing)
+    except BatchError as e:
+        return JsonResponse({'error': str(e), 'max_batch_size': MAX_BATCH_SIZE}, status=400)
+
+    created = sum(1 for result in results if 'id' in result)
+    failed = sum(1 for result in results if not result['ok'])
+    status = 400 if failed and (all_or_nothing or not created) else 200
+    return JsonResponse({'created': created, 'failed': failed, 'results': results}, status=status)
+
+
+@csrf_exempt
+@api_login_required
+@read_replica
+def changes(request):
+    """Invoices, items, payments and clients changed or deleted since ``cursor``.
+
+    Pass the returned ``cursor`` back on the next call; keep calling while
+    ``has_more`` is true. Without a cursor the feed starts at the beginning.
+    """
+    if request.method != 'GET':
+        return JsonResponse({'error': 'GET required'}, status=405)
+    try:
+        limit = int(request.GET.get('limit', PAGE_SIZE))
+    except ValueError:
+        return JsonResponse({'error': 'limit must be a number.'}, status=400)
+    try:
+        page = read_changes(request.GET.get('cursor'), limit)
+    except CursorError as e:
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse(page)
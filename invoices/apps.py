@@ -3,3 +3,11 @@ from django.apps import AppConfig
 
 class InvoicesConfig(AppConfig):
     name = 'invoices'
+
+    def ready(self):
+        from django.db.backends.signals import connection_created
+
+        from invoice.database import configure_sqlite_connection
+        from . import signals  # noqa: F401
+
+        connection_created.connect(configure_sqlite_connection)
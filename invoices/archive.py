@@ -0,0 +1,147 @@
+"""
+Archiving of settled invoices from closed fiscal years.
+
+Fully paid and cancelled invoices dated before a cutoff are moved, in
+batches, from the invoice, item, payment, payment info and email delivery
+tables into
+``ArchivedInvoice`` rows holding a serialized snapshot. The hot tables shrink
+so lists, searches and aggregates stop scanning years of settled invoices,
+while ``invoice_detail`` and ``invoice_pdf`` still render archived invoices
+read-only from the snapshot.
+
+Revenue rollups are left as they were: the deletes run with rollup
+maintenance suspended and ``compute_rollups`` includes archived invoices.
+Archiving and restoring run inside ``archiving()`` so that signal handlers
+can tell a move into or out of the archive from a real edit or delete.
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+
+from django.core import serializers
+from django.db import transaction
+from django.db.models import F, Q
+
+from . import rollups
+from .models import ArchivedInvoice, EmailDelivery, Invoice, InvoiceItem, Payment, PaymentInfo
+from .reports import fiscal_year_start
+from .stats import invalidate_dashboard_summary
+
+ARCHIVE_BATCH_SIZE = 500
+
+_archiving = ContextVar('archiving', default=False)
+
+
+@contextmanager
+def archiving():
+    """Mark the invoice writes in this block as archive moves; rollups are suspended too"""
+    token = _archiving.set(True)
+    try:
+        with rollups.suspended():
+            yield
+    finally:
+        _archiving.reset(token)
+
+
+def is_archiving():
+    return _archiving.get()
+
+
+def archive_cutoff(today=None, keep_years=1):
+    """Start of the oldest fiscal year that stays in the hot tables.
+
+    ``keep_years`` closed fiscal years are kept besides the current one.
+    """
+    start = fiscal_year_start(today or date.today())
+    return start.replace(year=start.year - keep_years)
+
+
+def archivable_invoices(before):
+    """Fully paid or cancelled invoices dated before ``before``"""
+    return Invoice.objects.filter(invoice_date__lt=before).filter(
+        Q(status='cancelled') | Q(status='paid', amount_paid__gte=F('total'))
+    )
+
+
+def snapshot(invoice, items, payments, payment_info, deliveries=()):
+    """ArchivedInvoice for an invoice and its related rows (not saved)"""
+    return ArchivedInvoice(
+        original_id=invoice.pk,
+        invoice_number=invoice.invoice_number,
+        company_id=invoice.company_id,
+        client_id=invoice.client_id,
+        fiscal_year=fiscal_year_start(invoice.invoice_date).year,
+        invoice_date=invoice.invoice_date,
+        status=invoice.status,
+        currency=invoice.currency,
+        is_quotation=invoice.is_quotation,
+        total=invoice.total,
+        amount_paid=invoice.amount_paid,
+        payload={
+            'invoice': serializers.serialize('python', [invoice]),
+            'items': serializers.serialize('python', items),
+            'payments': serializers.serialize('python', payments),
+            'payment_info': serializers.serialize('python', payment_info),
+            'email_deliveries': serializers.serialize('python', deliveries),
+        },
+    )
+
+
+def archive_batch(pks, before):
+    """Move one batch of invoices into the archive; returns the number moved"""
+    with transaction.atomic():
+        # Lock and re-check the rows so a concurrent edit cannot slip through
+        invoices = list(archivable_invoices(before).filter(pk__in=pks).select_for_update().order_by('pk'))
+        if not invoices:
+            return 0
+        pks = [invoice.pk for invoice in invoices]
+        items, payments, payment_info, deliveries = {}, {}, {}, {}
+        related = (
+            (InvoiceItem, items), (Payment, payments), (PaymentInfo, payment_info), (EmailDelivery, deliveries),
+        )
+        for model, grouped in related:
+            for obj in model.objects.filter(invoice_id__in=pks).order_by('pk'):
+                grouped.setdefault(obj.invoice_id, []).append(obj)
+
+        ArchivedInvoice.objects.bulk_create([
+            snapshot(
+                invoice,
+                items.get(invoice.pk, []),
+                payments.get(invoice.pk, []),
+                payment_info.get(invoice.pk, []),
+                deliveries.get(invoice.pk, []),
+            )
+            for invoice in invoices
+        ])
+        with archiving():
+            Invoice.objects.filter(pk__in=pks).delete()
+    return len(invoices)
+
+
+def archive_invoices(before, batch_size=ARCHIVE_BATCH_SIZE):
+    """Archive every eligible invoice dated before ``before``.
+
+    Yields the running total after each batch so callers can report progress.
+    """
+    queryset = archivable_invoices(before).order_by('pk').values_list('pk', flat=True)
+    last_pk = 0
+    archived = 0
+    while True:
+        pks = list(queryset.filter(pk__gt=last_pk)[:batch_size])
+        if not pks:
+            break
+        archived += archive_batch(pks, before)
+        last_pk = pks[-1]
+        yield archived
+    if archived:
+        invalidate_dashboard_summary()
+
+
+def restore_invoice(archived):
+    """Move an archived invoice back into the hot tables"""
+    with transaction.atomic(), archiving():
+        for key in ('invoice', 'items', 'payments', 'payment_info', 'email_deliveries'):
+            for obj in serializers.deserialize('python', archived.payload.get(key) or []):
+                obj.save()
+        archived.delete()
+    invalidate_dashboard_summary()
@@ -0,0 +1,145 @@
+"""
+Async versions of the read-heavy views, used when running under ASGI.
+
+``invoice.urls`` routes the dashboard, invoice list, invoice detail and the
+PDF endpoints here when ``ASYNC_VIEWS`` is on (the uvicorn profile in
+``deployment/``). Queries use the async ORM API and PDF rendering runs in
+the process pool from ``invoices.pdf``.
+
+Templates are still rendered through ``sync_to_async`` because the context
+processors and ``base.html`` read the session, user and messages lazily,
+which may query the database.
+"""
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.contrib import messages
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse
+from django.shortcuts import aget_object_or_404, redirect, render
+from django.template.loader import get_template
+
+from invoice.routers import read_replica
+
+from .companies import all_companies, get_company
+from .exports import EXPORT_LABELS
+from .filters import active_filters, filter_invoices
+from .fragments import fragment_versions
+from .models import ArchivedInvoice, Client, Invoice, Payment, PaymentInfo
+from .pdf import PdfError, ahtml_to_pdf
+from .stats import get_dashboard_summary
+
+arender = sync_to_async(render)
+# Reads the shared cache and, on a miss, the database
+aget_company = sync_to_async(get_company)
+
+
+def pdf_response(request, content, filename):
+    response = HttpResponse(content, content_type='application/pdf')
+    disposition = 'attachment' if request.GET.get('download') else 'inline'
+    response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+    return response
+
+
+async def load_invoice(pk):
+    """Invoice, items, payments and payment info, falling back to the archive"""
+    invoice = await Invoice.objects.select_related('client').filter(pk=pk).afirst()
+    if invoice is None:
+        archived = await aget_object_or_404(ArchivedInvoice.objects.select_related('client'), original_id=pk)
+        archived.company = await aget_company(archived.company_id)
+        return archived, *archived.unpack()
+    invoice.company = await aget_company(invoice.company_id)
+    # Evaluated while rendering, which runs in a thread, so the detail page
+    # only queries items when its item table fragment is not cached
+    items = invoice.items.all()
+    payments = invoice.payments.all()
+    payment_info, created = await PaymentInfo.objects.aget_or_create(invoice=invoice)
+    return None, invoice, items, payments, payment_info
+
+
+@login_required
+@read_replica
+async def dashboard(request):
+    """Main dashboard with statistics"""
+    context = dict(await sync_to_async(get_dashboard_summary)(request.user))
+    context['recent_invoices'] = [
+        invoice async for invoice in Invoice.objects.select_related('client').order_by('-created_at')[:10]
+    ]
+    return await arender(request, 'invoices/dashboard.html', context)
+
+
+@login_required
+@read_replica
+async def invoice_list(request):
+    """List all invoices"""
+    invoices = filter_invoices(Invoice.objects.select_related('client', 'company').all(), request.GET)
+    filters = active_filters(request.GET)
+
+    return await arender(request, 'invoices/invoice_list.html', {
+        'invoices': [invoice async for invoice in invoices],
+        'companies': await sync_to_async(all_companies)(),
+        'clients': [client async for client in Client.objects.only('pk', 'name')],
+        'active_filters': filters,
+        'export_query': urlencode(filters),
+        'export_datasets': EXPORT_LABELS.items(),
+    })
+
+
+@login_required
+@read_replica
+async def invoice_detail(request, pk):
+    """View invoice details in printable format"""
+    archived, invoice, items, payments, payment_info = await load_invoice(pk)
+    return await arender(request, 'invoices/invoice_detail.html', {
+        'invoice': invoice,
+        'items': items,
+        'payment_info': payment_info,
+        'payments': payments,
+        'pdf_url': request.build_absolute_uri(f'/invoices/{pk}/pdf/'),
+        'archived': archived,
+        'fragments': await sync_to_async(fragment_versions)(invoice, archived),
+        'deliveries': [] if archived else invoice.email_deliveries.all()[:5],
+    })
+
+
+@login_required
+@read_replica
+async def invoice_pdf(request, pk):
+    """Generate PDF from invoice"""
+    archived, invoice, items, payments, payment_info = await load_invoice(pk)
+    html = await sync_to_async(get_template('invoices/invoice_pdf.html').render)({
+        'invoice': invoice,
+        'items': items,
+        'payment_info': payment_info,
+    })
+    try:
+        content = await ahtml_to_pdf(html)
+    except ImportError:
+        messages.error(request, 'xhtml2pdf is not installed. Please install it to generate PDFs.')
+    except PdfError:
+        messages.error(request, 'Error generating PDF.')
+    else:
+        return pdf_response(request, content, f'invoice_{invoice.invoice_number}.pdf')
+    return redirect('invoice_detail', pk=pk)
+
+
+@login_required
+@read_replica
+async def payment_receipt_pdf(request, pk):
+    """Generate PDF receipt for a specific payment"""
+    payment = await aget_object_or_404(Payment.objects.select_related('invoice__client'), pk=pk)
+    invoice = payment.invoice
+    invoice.company = await aget_company(invoice.company_id)
+    html = await sync_to_async(get_template('invoices/payment_receipt_pdf.html').render)({
+        'payment': payment,
+        'invoice': invoice,
+    })
+    try:
+        content = await ahtml_to_pdf(html)
+    except ImportError:
+        messages.error(request, 'xhtml2pdf is not installed. Please install it to generate PDFs.')
+    except PdfError:
+        messages.error(request, 'Error generating receipt PDF.')
+    else:
+        return pdf_response(request, content, f'receipt_{invoice.invoice_number}_{payment.pk}.pdf')
+    return redirect('invoice_detail', pk=invoice.pk)
@@ -0,0 +1,116 @@
+"""
+Per-worker cache of authenticated users.
+
+``django.contrib.auth`` loads ``request.user`` from ``auth_user`` on every
+request. ``CachedModelBackend`` keeps recently seen users in process memory
+instead and only checks a per-user version in the shared cache, which the
+signal handlers bump whenever the user row changes or they log out. A
+password change therefore reaches every worker on the next request, so
+sessions using the old password hash are rejected. Group and permission
+lookups are not cached and still hit the database.
+
+``api_login_required`` guards the JSON API, which integrations call with
+HTTP Basic credentials instead of a session.
+"""
+import base64
+import binascii
+import copy
+import threading
+from collections import OrderedDict
+from functools import wraps
+
+from django.contrib.auth import authenticate
+from django.contrib.auth.backends import ModelBackend
+from django.http import JsonResponse
+from django.middleware.csrf import CsrfViewMiddleware
+
+from .caching import bump_version, get_version
+
+USER_CACHE_SIZE = 256
+
+# Attributes ModelBackend caches permissions in; never carried across requests
+PERMISSION_CACHES = ('_perm_cache', '_user_perm_cache', '_group_perm_cache')
+
+_users = OrderedDict()
+_lock = threading.Lock()
+
+
+def user_namespace(user_id):
+    return f'user:{user_id}'
+
+
+def get_cached_user(user_id, load):
+    """The user with ``user_id`` from this worker's cache, or ``load(user_id)``"""
+    version = get_version(user_namespace(user_id))
+    with _lock:
+        entry = _users.get(user_id)
+        if entry and entry[0] == version:
+            _users.move_to_end(user_id)
+            return copy.copy(entry[1])
+
+    user = load(user_id)
+    if user is None:
+        return None
+    for attribute in PERMISSION_CACHES:
+        user.__dict__.pop(attribute, None)
+    with _lock:
+        _users[user_id] = (version, user)
+        _users.move_to_end(user_id)
+        while len(_users) > USER_CACHE_SIZE:
+            _users.popitem(last=False)
+    return copy.copy(user)
+
+
+def invalidate_user(user_id):
+    """Make every worker reload the user on their next request"""
+    bump_version(user_namespace(user_id))
+    with _lock:
+        _users.pop(user_id, None)
+
+
+def clear_user_cache():
+    """Forget every user this worker has cached"""
+    with _lock:
+        _users.clear()
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend whose get_user() is served from the per-worker cache"""
+
+    def get_user(self, user_id):
+        return get_cached_user(user_id, super().get_user)
+
+
+def basic_auth_user(request):
+    """The active user named by an HTTP Basic Authorization header, if any"""
+    scheme, _, credentials = request.META.get('HTTP_AUTHORIZATION', '').partition(' ')
+    if scheme.lower() != 'basic':
+        return None
+    try:
+        username, _, password = base64.b64decode(credentials).decode('utf-8').partition(':')
+    except (binascii.Error, UnicodeDecodeError):
+        return None
+    return authenticate(request, username=username, password=password)
+
+
+def api_login_required(view):
+    """Require a session or HTTP Basic login and answer 401 with JSON.
+
+    The view must be ``csrf_exempt``: Basic requests carry no CSRF token, so
+    the CSRF check is applied here to session-authenticated requests only.
+    """
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        user = basic_auth_user(request)
+        if user is not None:
+            request.user = user
+        elif request.user.is_authenticated:
+            rejected = CsrfViewMiddleware(view).process_view(request, None, (), {})
+            if rejected is not None:
+                return rejected
+        else:
+            response = JsonResponse({'error': 'Authentication required'}, status=401)
+            response['WWW-Authenticate'] = 'Basic realm="invoices"'
+            return response
+        return view(request, *args, **kwargs)
+    return wrapper
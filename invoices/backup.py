@@ -0,0 +1,375 @@
+"""
+Online backups of the database and uploaded media.
+
+A snapshot is a directory under ``BACKUP_ROOT/snapshots`` holding the
+compressed database and a ``manifest.json`` with checksums. SQLite is copied
+with the online backup API a few pages at a time from its own connection, so
+gunicorn workers keep reading and writing while it runs; a write from another
+connection restarts the copy, and after ``BACKUP_MAX_RESTARTS`` of those the
+backup gives up rather than chase a busy database forever. PostgreSQL is
+dumped with ``pg_dump``.
+
+Media files are stored once per content hash under ``BACKUP_ROOT/objects``,
+so each backup only copies files that changed since the previous one. Files
+whose size and modification time match the previous manifest are not even
+re-hashed.
+"""
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import sqlite3
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+from pathlib import Path
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connections
+
+from .auth import clear_user_cache
+from .companies import invalidate_companies
+from .exchange_rates import invalidate_rates
+
+MANIFEST_NAME = 'manifest.json'
+MANIFEST_VERSION = 1
+CHUNK_SIZE = 1024 * 1024
+# SQLite pages copied per backup step and pause between steps
+BACKUP_PAGES = 256
+BACKUP_SLEEP = 0.005
+BACKUP_MAX_RESTARTS = 20
+
+
+class BackupError(Exception):
+    pass
+
+
+def backup_root():
+    return Path(getattr(settings, 'BACKUP_ROOT', Path(settings.BASE_DIR) / 'backups'))
+
+
+def snapshots_dir(root=None):
+    return (root or backup_root()) / 'snapshots'
+
+
+def objects_dir(root=None):
+    return (root or backup_root()) / 'objects'
+
+
+def object_path(digest, root=None):
+    return objects_dir(root) / digest[:2] / digest
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as handle:
+        while chunk := handle.read(CHUNK_SIZE):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def list_snapshots(root=None):
+    """Snapshot directories with a manifest, oldest first"""
+    directory = snapshots_dir(root)
+    if not directory.exists():
+        return []
+    return sorted(path for path in directory.iterdir() if (path / MANIFEST_NAME).exists())
+
+
+def read_manifest(snapshot):
+    try:
+        with open(Path(snapshot) / MANIFEST_NAME) as handle:
+            manifest = json.load(handle)
+    except (OSError, ValueError) as exc:
+        raise BackupError(f'Cannot read manifest of {snapshot}: {exc}')
+    if manifest.get('version') != MANIFEST_VERSION:
+        raise BackupError(f'Unsupported manifest version in {snapshot}')
+    return manifest
+
+
+# Database
+
+def copy_sqlite(source_path, target_path, pages=BACKUP_PAGES, sleep=BACKUP_SLEEP,
+                max_restarts=BACKUP_MAX_RESTARTS):
+    """Copy a live SQLite database using the online backup API"""
+    source = sqlite3.connect(source_path, timeout=30)
+    target = sqlite3.connect(target_path)
+    restarts = 0
+    last_remaining = None
+
+    def progress(status, remaining, total):
+        nonlocal restarts, last_remaining
+        # A write to the source starts the copy over, so more pages remain than before
+        if last_remaining is not None and remaining > last_remaining:
+            restarts += 1
+            if restarts > max_restarts:
+                raise BackupError(
+                    f'The database kept changing: the copy restarted {restarts} times. '
+                    f'Try again when it is quieter or with more pages per step.'
+                )
+        last_remaining = remaining
+
+    try:
+        source.backup(target, pages=pages, progress=progress, sleep=sleep)
+    finally:
+        target.close()
+        source.close()
+
+
+def check_sqlite(path):
+    connection = sqlite3.connect(path)
+    try:
+        result = connection.execute('PRAGMA integrity_check').fetchone()[0]
+    finally:
+        connection.close()
+    if result != 'ok':
+        raise BackupError(f'Integrity check failed for {path}: {result}')
+
+
+def compress(source_path, target_path):
+    """Gzip a file and return the SHA-256 of the compressed output"""
+    with open(source_path, 'rb') as source, gzip.open(target_path, 'wb', compresslevel=6) as target:
+        shutil.copyfileobj(source, target, CHUNK_SIZE)
+    return file_digest(target_path)
+
+
+def pg_environment(config):
+    env = dict(os.environ)
+    if config.get('PASSWORD'):
+        env['PGPASSWORD'] = config['PASSWORD']
+    return env
+
+
+def pg_arguments(config):
+    arguments = []
+    for option, key in (('--host', 'HOST'), ('--port', 'PORT'), ('--username', 'USER')):
+        if config.get(key):
+            arguments += [option, str(config[key])]
+    return arguments
+
+
+def run_pg(arguments, config=None, **kwargs):
+    """Run a PostgreSQL client program, raising BackupError if it fails"""
+    env = pg_environment(config) if config is not None else None
+    try:
+        subprocess.run(arguments, env=env, check=True, **kwargs)
+    except FileNotFoundError:
+        raise BackupError(f'{arguments[0]} is not installed or not on PATH')
+    except subprocess.CalledProcessError as exc:
+        raise BackupError(f'{arguments[0]} failed with exit status {exc.returncode}')
+
+
+def backup_database(snapshot, alias='default', pages=BACKUP_PAGES):
+    """Write the database into the snapshot directory; returns its manifest entry"""
+    connection = connections[alias]
+    config = connection.settings_dict
+    if connection.vendor == 'sqlite':
+        with tempfile.TemporaryDirectory(dir=snapshot) as scratch:
+            copy = Path(scratch) / 'database.sqlite3'
+            copy_sqlite(str(config['NAME']), str(copy), pages=pages)
+            check_sqlite(copy)
+            name = 'database.sqlite3.gz'
+            digest = compress(copy, snapshot / name)
+    elif connection.vendor == 'postgresql':
+        name = 'database.dump'
+        # The custom format is compressed and can be listed to verify it
+        run_pg(
+            ['pg_dump', '--format=custom', '--no-owner', '--file', str(snapshot / name)]
+            + pg_arguments(config) + [config['NAME']],
+            config,
+        )
+        digest = file_digest(snapshot / name)
+    else:
+        raise BackupError(f'Backups are not supported for {connection.vendor}')
+    return {
+        'engine': connection.vendor,
+        'file': name,
+        'sha256': digest,
+        'size': (snapshot / name).stat().st_size,
+    }
+
+
+def restore_database(snapshot, entry, alias='default'):
+    """Replace the contents of the database with the snapshot"""
+    connection = connections[alias]
+    config = connection.settings_dict
+    if entry['engine'] != connection.vendor:
+        raise BackupError(f'Snapshot holds a {entry["engine"]} database but "{alias}" is {connection.vendor}')
+    connection.close()
+    if connection.vendor == 'sqlite':
+        with tempfile.TemporaryDirectory() as scratch:
+            copy = Path(scratch) / 'database.sqlite3'
+            with gzip.open(snapshot / entry['file'], 'rb') as source, open(copy, 'wb') as target:
+                shutil.copyfileobj(source, target, CHUNK_SIZE)
+            check_sqlite(copy)
+            # Writing through the backup API keeps the live file's WAL and
+            # locks consistent, unlike replacing the file under the workers.
+            copy_sqlite(str(copy), str(config['NAME']), pages=-1)
+    else:
+        run_pg(
+            ['pg_restore', '--clean', '--if-exists', '--no-owner', '--single-transaction',
+             '--dbname', config['NAME']] + pg_arguments(config) + [str(snapshot / entry['file'])],
+            config,
+        )
+
+
+def reset_caches():
+    """Forget everything cached about the data a restore replaced.
+
+    Clearing the shared cache drops the dashboard summary, the invoice and
+    client fragments and every version key. Versions come back as new
+    timestamps, so the memos other workers hold (companies, exchange rates,
+    users, the analytics cache) reload on their next use; this process's own
+    memos are reset here.
+    """
+    cache.clear()
+    invalidate_companies()
+    invalidate_rates()
+    clear_user_cache()
+
+
+def verify_database(snapshot, entry):
+    path = snapshot / entry['file']
+    if not path.exists():
+        raise BackupError(f'{path} is missing')
+    if file_digest(path) != entry['sha256']:
+        raise BackupError(f'{path} does not match its checksum')
+    if entry['engine'] == 'sqlite':
+        with tempfile.TemporaryDirectory() as scratch:
+            copy = Path(scratch) / 'database.sqlite3'
+            with gzip.open(path, 'rb') as source, open(copy, 'wb') as target:
+                shutil.copyfileobj(source, target, CHUNK_SIZE)
+            check_sqlite(copy)
+    elif shutil.which('pg_restore'):
+        run_pg(['pg_restore', '--list', str(path)], stdout=subprocess.DEVNULL)
+
+
+# Media
+
+def backup_media(media_root, previous=None, root=None):
+    """Store new or changed media files by content hash.
+
+    Returns ``(files, copied)`` where ``files`` maps relative paths to
+    ``{'sha256', 'size', 'mtime'}`` and ``copied`` counts new objects.
+    """
+    media_root = Path(media_root)
+    previous = previous or {}
+    files = {}
+    copied = 0
+    if not media_root.exists():
+        return files, copied
+    for path in sorted(media_root.rglob('*')):
+        if not path.is_file():
+            continue
+        relative = path.relative_to(media_root).as_posix()
+        stat = path.stat()
+        known = previous.get(relative)
+        if known and known['size'] == stat.st_size and known['mtime'] == stat.st_mtime_ns:
+            digest = known['sha256']
+        else:
+            digest = file_digest(path)
+        target = object_path(digest, root)
+        # A size mismatch means a damaged object; replace it
+        if not target.exists() or target.stat().st_size != stat.st_size:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            # Copy under a temporary name so an interrupted backup leaves no
+            # truncated object behind
+            partial = target.with_suffix('.partial')
+            shutil.copyfile(path, partial)
+            os.replace(partial, target)
+            copied += 1
+        files[relative] = {'sha256': digest, 'size': stat.st_size, 'mtime': stat.st_mtime_ns}
+    return files, copied
+
+
+def verify_media(files, root=None):
+    """Checksums of every media object referenced by a manifest"""
+    problems = []
+    for digest in sorted({entry['sha256'] for entry in files.values()}):
+        path = object_path(digest, root)
+        if not path.exists():
+            problems.append(f'missing object {digest}')
+        elif file_digest(path) != digest:
+            problems.append(f'corrupt object {digest}')
+    return problems
+
+
+def restore_media(files, media_root, root=None):
+    """Write media files that are missing or differ; returns the number written"""
+    media_root = Path(media_root)
+    written = 0
+    for relative, entry in files.items():
+        target = media_root / relative
+        if target.exists() and target.stat().st_size == entry['size'] and file_digest(target) == entry['sha256']:
+            continue
+        target.parent.mkdir(parents=True, exist_ok=True)
+        shutil.copyfile(object_path(entry['sha256'], root), target)
+        written += 1
+    return written
+
+
+# Snapshots
+
+def create_snapshot(root=None, alias='default', include_media=True, pages=BACKUP_PAGES):
+    """Back up the database and media; returns the snapshot directory"""
+    root = root or backup_root()
+    started = time.monotonic()
+    name = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+    snapshot = snapshots_dir(root) / name
+    snapshot.mkdir(parents=True)
+
+    existing = list_snapshots(root)
+    previous = read_manifest(existing[-1])['media'] if existing and existing[-1] != snapshot else {}
+    try:
+        database = backup_database(snapshot, alias, pages=pages)
+        media, copied = backup_media(settings.MEDIA_ROOT, previous, root) if include_media else ({}, 0)
+    except Exception:
+        shutil.rmtree(snapshot, ignore_errors=True)
+        raise
+
+    manifest = {
+        'version': MANIFEST_VERSION,
+        'created': datetime.now(timezone.utc).isoformat(),
+        'seconds': round(time.monotonic() - started, 3),
+        'database': database,
+        'media': media,
+        'media_copied': copied,
+    }
+    # The manifest is written last: a snapshot without one is incomplete
+    with open(snapshot / (MANIFEST_NAME + '.tmp'), 'w') as handle:
+        json.dump(manifest, handle, indent=1, sort_keys=True)
+    os.replace(snapshot / (MANIFEST_NAME + '.tmp'), snapshot / MANIFEST_NAME)
+    return snapshot
+
+
+def verify_snapshot(snapshot, root=None):
+    """Raise BackupError unless the database and every media object check out"""
+    snapshot = Path(snapshot)
+    manifest = read_manifest(snapshot)
+    verify_database(snapshot, manifest['database'])
+    problems = verify_media(manifest['media'], root)
+    if problems:
+        raise BackupError(f'{len(problems)} media problems: {", ".join(problems[:5])}')
+    return manifest
+
+
+def prune_snapshots(keep, root=None):
+    """Delete all but the newest ``keep`` snapshots and unreferenced objects"""
+    root = root or backup_root()
+    snapshots = list_snapshots(root)
+    removed = snapshots[:-keep] if keep else []
+    for snapshot in removed:
+        shutil.rmtree(snapshot)
+
+    referenced = set()
+    for snapshot in snapshots[len(removed):]:
+        referenced.update(entry['sha256'] for entry in read_manifest(snapshot)['media'].values())
+    directory = objects_dir(root)
+    if directory.exists():
+        for path in directory.glob('*/*'):
+            if path.name not in referenced:
+                path.unlink()
+    return len(removed)
@@ -0,0 +1,186 @@
+"""
+Bulk creation of invoices from the JSON API.
+
+Each record is validated with the same forms as the invoice pages
+(``InvoiceForm``, ``InvoiceItemForm`` and ``PaymentForm``), totals are
+computed in Python, and the valid records of a batch are written with
+``bulk_create`` in a single transaction: one insert per table instead of a
+dozen queries per invoice. Invoice numbers are allocated as one block.
+
+``bulk_create`` sends no signals, so this module applies what the signal
+handlers would have done: revenue rollups (aggregated per bucket), the
+change log and the dashboard cache. QR codes are generated by a background
+job (see ``invoices.jobs``).
+"""
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+
+from . import rollups
+from .archive import is_archiving
+from .changes import record_changes
+from .forms import InvoiceForm, InvoiceItemForm, PaymentForm
+from .jobs import enqueue
+from .models import Invoice, InvoiceItem, Payment
+from .stats import invalidate_dashboard_summary
+
+MAX_BATCH_SIZE = 1000
+# Attempts at a batch whose number block was taken by a concurrent writer
+NUMBER_ATTEMPTS = 3
+
+
+class BatchError(Exception):
+    """The request body is not a batch of invoices"""
+
+
+def with_defaults(form_class, data):
+    """Fill in model defaults the HTML forms always submit but API callers may omit"""
+    data = dict(data)
+    for name in form_class.base_fields:
+        field = form_class._meta.model._meta.get_field(name)
+        if name not in data and field.has_default():
+            data[name] = field.get_default()
+    return data
+
+
+def form_errors(form):
+    return {field: [str(error) for error in errors] for field, errors in form.errors.items()}
+
+
+def validate_record(record):
+    """(invoice, items, payments, None) for a valid record, or (None, None, None, errors)"""
+    if not isinstance(record, dict):
+        return None, None, None, {'__all__': ['Expected an object.']}
+    errors = {}
+    form = InvoiceForm(with_defaults(InvoiceForm, record))
+    if not form.is_valid():
+        errors.update(form_errors(form))
+
+    nested = {}
+    for key, form_class in (('items', InvoiceItemForm), ('payments', PaymentForm)):
+        rows = record.get(key) or []
+        if not isinstance(rows, list):
+            errors[key] = ['Expected a list.']
+            continue
+        nested[key] = []
+        for index, row in enumerate(rows):
+            row_form = form_class(with_defaults(form_class, row) if isinstance(row, dict) else {})
+            if row_form.is_valid():
+                nested[key].append(row_form.save(commit=False))
+            else:
+                errors[f'{key}[{index}]'] = form_errors(row_form)
+    if errors:
+        return None, None, None, errors
+
+    invoice = form.save(commit=False)
+    items, payments = nested['items'], nested['payments']
+    for order, item in enumerate(items):
+        item.order = order
+        item.calculate_amount()
+    invoice.calculate_totals(items)
+    # Same rule as Payment.update_invoice_totals
+    invoice.amount_paid = sum((payment.amount for payment in payments), Decimal('0'))
+    if invoice.total and invoice.amount_paid >= invoice.total:
+        invoice.status = 'paid'
+    return invoice, items, payments, None
+
+
+def insert_invoices(records, user=None):
+    """Write validated (index, invoice, items, payments) records in one transaction.
+
+    Invoices without an ``invoice_number`` get one from a freshly allocated
+    block. If the transaction fails the instances are reset, so the batch
+    can be retried.
+    """
+    unnumbered = [invoice for index, invoice, items, payments in records if not invoice.invoice_number]
+    try:
+        with transaction.atomic():
+            for invoice, number in zip(unnumbered, Invoice.allocate_invoice_numbers(len(unnumbered))):
+                invoice.invoice_number = number
+            invoices = []
+            for index, invoice, items, payments in records:
+                invoice.created_by = user
+                invoice.convert_to_base()
+                invoices.append(invoice)
+            Invoice.objects.bulk_create(invoices)
+
+            all_items, all_payments = [], []
+            for index, invoice, items, payments in records:
+                for row in items + payments:
+                    row.invoice = invoice
+                all_items.extend(items)
+                all_payments.extend(payments)
+            InvoiceItem.objects.bulk_create(all_items)
+            Payment.objects.bulk_create(all_payments)
+
+            if not rollups.is_suspended():
+                states = {invoice.pk: rollups.invoice_state(invoice) for invoice in invoices}
+                contributions = [rollups.invoice_contribution(state) for state in states.values()]
+                contributions += [
+                    rollups.payment_contribution(
+                        {field: getattr(payment, field) for field in rollups.PAYMENT_FIELDS},
+                        states[payment.invoice_id],
+                    )
+                    for payment in all_payments
+                ]
+                rollups.apply_contributions(filter(None, contributions))
+            # Like the signal handlers, only a move into the archive skips the change log
+            if not is_archiving():
+                record_changes(invoices + all_items + all_payments)
+            queue_qr_codes(invoices)
+            transaction.on_commit(invalidate_dashboard_summary)
+    except IntegrityError:
+        for index, invoice, items, payments in records:
+            invoice.pk = None
+            for row in items + payments:
+                row.pk = None
+        for invoice in unnumbered:
+            invoice.invoice_number = ''
+        raise
+    return invoices
+
+
+def queue_qr_codes(invoices):
+    """Generate the new invoices' QR codes, which Invoice.save would have made, in the background"""
+    invoice_ids = [invoice.pk for invoice in invoices if invoice.company.upi_id]
+    if invoice_ids:
+        enqueue('generate_qr_codes', invoice_ids=invoice_ids)
+
+
+def create_invoices(batch, user=None, all_or_nothing=False):
+    """Validate and insert a batch of invoice records; returns per-record results.
+
+    Invalid records are reported and skipped, unless ``all_or_nothing`` is set,
+    in which case nothing is written if any record is invalid.
+    """
+    if not isinstance(batch, list):
+        raise BatchError('"invoices" must be a list.')
+    if len(batch) > MAX_BATCH_SIZE:
+        raise BatchError(f'At most {MAX_BATCH_SIZE} invoices per request.')
+
+    results = []
+    valid = []
+    for index, record in enumerate(batch):
+        invoice, items, payments, errors = validate_record(record)
+        reference = record.get('reference') if isinstance(record, dict) else None
+        results.append({'index': index, 'reference': reference, 'ok': errors is None})
+        if errors:
+            results[index]['errors'] = errors
+        else:
+            valid.append((index, invoice, items, payments))
+
+    if not valid or (all_or_nothing and len(valid) < len(batch)):
+        return results
+
+    for attempt in range(NUMBER_ATTEMPTS):
+        try:
+            invoices = insert_invoices(valid, user)
+            break
+        except IntegrityError:
+            # A concurrent writer took numbers from the block
+            if attempt == NUMBER_ATTEMPTS - 1:
+                raise
+
+    for (index, *_), invoice in zip(valid, invoices):
+        results[index].update(id=invoice.pk, invoice_number=invoice.invoice_number)
+    return results
@@ -0,0 +1,34 @@
+"""
+Small helpers for versioned cache keys.
+
+Instead of deleting every cached entry when data changes, each cached area
+has a version number stored in the cache. Cached entries embed that version
+in their key, so bumping the version makes all old entries unreachable and
+they simply expire.
+"""
+import time
+
+from django.core.cache import cache
+
+
+def get_version(namespace):
+    """Get the current version for a cache namespace"""
+    key = f'version:{namespace}'
+    version = cache.get(key)
+    if version is None:
+        # A fresh timestamp (not a counter) so a culled version key can never
+        # bring stale entries back to life.
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(namespace):
+    """Invalidate every entry stored under a cache namespace"""
+    cache.set(f'version:{namespace}', time.time_ns(), None)
+
+
+def versioned_key(namespace, *parts):
+    """Build a cache key tied to the current namespace version"""
+    suffix = ':'.join(str(part) for part in parts)
+    return f'{namespace}:{get_version(namespace)}:{suffix}'
@@ -0,0 +1,146 @@
+"""
+Change feed for incremental sync.
+
+Every save or delete of an invoice, invoice item, payment or client appends
+a ``ChangeLog`` row. ``read_changes`` pages through the log after an opaque
+cursor and returns the current state of each changed row, or a tombstone if
+it was deleted, so integrations only download what changed since their last
+sync. Several writes to the same row within a page collapse into one entry.
+
+Entries are only served once they are ``CHANGES_SETTLE_SECONDS`` old. On
+PostgreSQL an entry with a lower id can commit after one with a higher id,
+and a cursor already past it would miss it; the delay covers the longest
+write transaction (a bulk API batch). SQLite serialises writers, so it has
+no such gaps.
+
+Archiving and restoring invoices are not recorded: an archived invoice still
+exists, it has only moved out of the hot tables.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core import signing
+from django.db.models import Max
+from django.utils import timezone
+
+from .models import ChangeLog, Client, Invoice, InvoiceItem, Payment
+
+PAGE_SIZE = 500
+MAX_PAGE_SIZE = 2000
+CURSOR_SALT = 'invoices.changes'
+
+# Synced models, their key in the response and the fields sent for them
+FEEDS = {
+    'invoice': ('invoices', Invoice, (
+        'id', 'invoice_number', 'company_id', 'client_id', 'invoice_date', 'due_date',
+        'status', 'currency', 'is_quotation', 'subtotal', 'tax_amount', 'discount_amount',
+        'total', 'amount_paid', 'notes', 'terms', 'updated_at',
+    )),
+    'item': ('items', InvoiceItem, (
+        'id', 'invoice_id', 'order', 'description', 'unit_type', 'quantity', 'rate',
+        'discount', 'tax_rate', 'amount',
+    )),
+    'payment': ('payments', Payment, (
+        'id', 'invoice_id', 'amount', 'is_advance', 'method', 'reference', 'note',
+        'paid_on', 'updated_at',
+    )),
+    'client': ('clients', Client, (
+        'id', 'name', 'company_name', 'email', 'phone',
+        'billing_address', 'billing_city', 'billing_state', 'billing_country', 'billing_postal_code',
+        'shipping_address', 'shipping_city', 'shipping_state', 'shipping_country', 'shipping_postal_code',
+        'gstin', 'updated_at',
+    )),
+}
+KINDS = {model: kind for kind, (key, model, fields) in FEEDS.items()}
+
+
+class CursorError(Exception):
+    """The cursor was not issued by this server"""
+
+
+def encode_cursor(last_id):
+    return signing.dumps(last_id, salt=CURSOR_SALT, compress=True)
+
+
+def decode_cursor(cursor):
+    if not cursor:
+        return 0
+    try:
+        last_id = signing.loads(cursor, salt=CURSOR_SALT)
+    except signing.BadSignature:
+        raise CursorError('Invalid cursor.')
+    if not isinstance(last_id, int):
+        raise CursorError('Invalid cursor.')
+    return last_id
+
+
+def record_change(instance, deleted=False):
+    """Append a log entry for a saved or deleted synced instance"""
+    ChangeLog.objects.create(kind=KINDS[type(instance)], object_id=instance.pk, deleted=deleted)
+
+
+def record_changes(instances):
+    """Append log entries for rows created in bulk"""
+    ChangeLog.objects.bulk_create(
+        [ChangeLog(kind=KINDS[type(instance)], object_id=instance.pk) for instance in instances],
+        batch_size=1000,
+    )
+
+
+def read_changes(cursor=None, limit=PAGE_SIZE):
+    """One page of changes after ``cursor``.
+
+    Returns ``{'changes': {...}, 'deleted': {...}, 'cursor': ..., 'has_more': ...}``
+    where ``changes`` maps each feed to the current rows and ``deleted`` to
+    the ids deleted since the cursor.
+    """
+    last_id = decode_cursor(cursor)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    settled = timezone.now() - timedelta(seconds=settings.CHANGES_SETTLE_SECONDS)
+    entries = list(
+        ChangeLog.objects.filter(pk__gt=last_id, changed_at__lte=settled)
+        .order_by('pk')
+        .values_list('pk', 'kind', 'object_id', 'deleted')[:limit + 1]
+    )
+    has_more = len(entries) > limit
+    entries = entries[:limit]
+
+    # The last entry per row wins
+    latest = {}
+    for pk, kind, object_id, deleted in entries:
+        latest[kind, object_id] = deleted
+    # kind -> ([changed ids], [deleted ids])
+    grouped = {kind: ([], []) for kind in FEEDS}
+    for (kind, object_id), deleted in latest.items():
+        grouped[kind][deleted].append(object_id)
+
+    changes, tombstones = {}, {}
+    for kind, (key, model, fields) in FEEDS.items():
+        changed, removed = grouped[kind]
+        # A row deleted since its entry was written is missing here; its
+        # tombstone comes in a later page
+        rows = model.objects.filter(pk__in=changed).order_by('pk').values(*fields) if changed else []
+        changes[key] = list(rows)
+        tombstones[key] = sorted(removed)
+
+    return {
+        'changes': changes,
+        'deleted': tombstones,
+        'cursor': encode_cursor(entries[-1][0] if entries else last_id),
+        'has_more': has_more,
+    }
+
+
+def compact_changes(before=None):
+    """Drop entries superseded by a later entry for the same row.
+
+    Safe for every cursor: a client behind the dropped entry still reads the
+    later one. ``before`` limits compaction to entries older than a datetime.
+    Returns the number of entries deleted.
+    """
+    latest = ChangeLog.objects.order_by().values('kind', 'object_id').annotate(last=Max('pk'))
+    superseded = ChangeLog.objects.exclude(pk__in=latest.values('last'))
+    if before is not None:
+        superseded = superseded.filter(changed_at__lt=before)
+    deleted, _ = superseded.delete()
+    return deleted
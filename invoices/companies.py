@@ -0,0 +1,81 @@
+"""
+Cached repository for ``Company`` reference data.
+
+There are only a handful of companies and they rarely change, yet every
+invoice page, PDF and invoice form needs them. The whole table is cached
+under a versioned key in the shared cache and memoised per worker for as
+long as the version stays the same; ``invoices.signals`` bumps the version
+whenever a company is saved or deleted.
+
+Callers get copies, so a view editing a company never changes the cached
+instance.
+"""
+import copy
+import threading
+from collections import Counter
+
+from django.core.cache import cache
+
+from .caching import bump_version, get_version
+from .models import Company
+
+COMPANY_NAMESPACE = 'company'
+COMPANY_CACHE_TIMEOUT = 60 * 60 * 24
+
+_local = {'version': None, 'companies': {}}
+_lock = threading.Lock()
+# local_hits: served from this worker's memo; shared_hits: from the shared
+# cache; misses: loaded from the database
+stats = Counter(local_hits=0, shared_hits=0, misses=0)
+
+
+def _load():
+    version = get_version(COMPANY_NAMESPACE)
+    with _lock:
+        if _local['version'] == version:
+            stats['local_hits'] += 1
+            return _local['companies']
+
+    key = f'{COMPANY_NAMESPACE}:{version}:all'
+    companies = cache.get(key)
+    if companies is None:
+        companies = {company.pk: company for company in Company.objects.all()}
+        cache.set(key, companies, COMPANY_CACHE_TIMEOUT)
+        stats['misses'] += 1
+    else:
+        stats['shared_hits'] += 1
+    with _lock:
+        _local['version'] = version
+        _local['companies'] = companies
+    return companies
+
+
+def all_companies():
+    """Every company, in the model's default ordering"""
+    return [copy.copy(company) for company in _load().values()]
+
+
+def get_company(pk):
+    """One company by primary key; raises Company.DoesNotExist"""
+    company = _load().get(pk)
+    if company is None:
+        return Company.objects.get(pk=pk)
+    return copy.copy(company)
+
+
+def company_choices():
+    """(pk, label) pairs for a company select without a query"""
+    return [(company.pk, str(company)) for company in _load().values()]
+
+
+def invalidate_companies():
+    bump_version(COMPANY_NAMESPACE)
+    with _lock:
+        _local['version'] = None
+
+
+def company_cache_stats():
+    """This worker's hit/miss counters and hit ratio"""
+    total = sum(stats.values())
+    hits = stats['local_hits'] + stats['shared_hits']
+    return {**stats, 'hit_ratio': round(hits / total, 3) if total else None}
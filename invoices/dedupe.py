@@ -0,0 +1,225 @@
+"""
+Finding and merging duplicate clients.
+
+Comparing every client with every other is quadratic, so clients are first
+grouped into blocks by cheap keys: normalised GSTIN, email and phone number,
+and the trigrams of the normalised name. Only two clients sharing a block
+are scored. Blocks larger than ``MAX_BLOCK_SIZE`` are skipped: a trigram
+like "ent" or a placeholder phone shared by hundreds of clients says
+nothing about any one pair. Neither does a single shared trigram, so a pair
+found only through the names must share ``MIN_SHARED_GRAMS`` of them.
+
+Each candidate pair is scored from the keys it shares and the trigram
+similarity of the names; two different GSTINs count strongly against it.
+
+``merge_clients`` moves the invoices, archived invoices and recurring
+schedules of the duplicates to the client kept, with one ``UPDATE`` per
+table, merges their revenue rollup rows and deletes the duplicates.
+"""
+import re
+from collections import Counter, defaultdict, namedtuple
+from itertools import combinations
+
+from django.db import transaction
+from django.db.models import Count
+from django.utils import timezone
+
+from .changes import record_changes
+from .fragments import invalidate_client_fragments
+from .models import ArchivedInvoice, Client, Invoice, RecurringInvoice, RevenueRollup
+from .rollups import MEASURES
+
+MAX_BLOCK_SIZE = 50
+# Name trigram blocks a pair must share to be scored on its names alone
+MIN_SHARED_GRAMS = 3
+MIN_SCORE = 0.6
+# Name similarity (trigram Jaccard) below which names are no evidence
+NAME_THRESHOLD = 0.5
+
+# Evidence weights, combined as independent signals: 1 - prod(1 - weight)
+WEIGHTS = {'gstin': 0.95, 'email': 0.8, 'phone': 0.7, 'name': 0.85}
+# Factor applied when both clients have a GSTIN and they differ
+GSTIN_CONFLICT = 0.3
+
+# Words that do not tell businesses apart
+NAME_STOPWORDS = frozenset({
+    'm', 's', 'ms', 'mr', 'mrs', 'the', 'and', 'co', 'company', 'pvt', 'private', 'ltd',
+    'limited', 'llp', 'inc', 'corp', 'corporation',
+})
+
+# Blank fields of the client kept that a merge fills in from the duplicates
+FILL_FIELDS = ('company_name', 'email', 'phone', 'gstin', 'billing_city', 'billing_postal_code')
+
+CLIENT_FIELDS = ('pk', 'name', 'company_name', 'email', 'phone', 'gstin', 'billing_city')
+
+Candidate = namedtuple('Candidate', 'score first second reasons')
+
+
+def normalize_gstin(value):
+    value = re.sub(r'[^0-9A-Z]', '', (value or '').upper())
+    return value if len(value) == 15 else ''
+
+
+def normalize_email(value):
+    return (value or '').strip().lower()
+
+
+def normalize_phone(value):
+    """The last ten digits, which drops +91 and trunk prefixes"""
+    digits = re.sub(r'\D', '', value or '')
+    return digits[-10:] if len(digits) >= 10 else ''
+
+
+def normalize_name(value):
+    words = re.findall(r'[a-z0-9]+', (value or '').lower())
+    return ' '.join(word for word in words if word not in NAME_STOPWORDS)
+
+
+def trigrams(name):
+    padded = f'  {name} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def client_keys(row):
+    """Normalised values and blocking keys for a client's values() row"""
+    gstin, email, phone = normalize_gstin(row['gstin']), normalize_email(row['email']), normalize_phone(row['phone'])
+    name = normalize_name(row['name'])
+    grams = trigrams(name) if name else set()
+    keys = {('gram', gram) for gram in grams}
+    for kind, value in (('gstin', gstin), ('email', email), ('phone', phone)):
+        if value:
+            keys.add((kind, value))
+    return {'gstin': gstin, 'email': email, 'phone': phone, 'grams': grams}, keys
+
+
+def score_pair(a, b):
+    """(score, reasons) for two clients' normalised values"""
+    reasons, miss = [], 1.0
+    for kind in ('gstin', 'email', 'phone'):
+        if a[kind] and a[kind] == b[kind]:
+            reasons.append(f'same {kind.upper() if kind == "gstin" else kind}')
+            miss *= 1 - WEIGHTS[kind]
+    if a['grams'] and b['grams']:
+        similarity = len(a['grams'] & b['grams']) / len(a['grams'] | b['grams'])
+        if similarity >= NAME_THRESHOLD:
+            reasons.append(f'name {similarity:.0%} alike')
+            miss *= 1 - WEIGHTS['name'] * similarity
+    score = 1 - miss
+    if a['gstin'] and b['gstin'] and a['gstin'] != b['gstin']:
+        reasons.append('different GSTIN')
+        score *= GSTIN_CONFLICT
+    return score, reasons
+
+
+def candidate_pairs(keys_by_client):
+    """Pairs of client ids worth scoring.
+
+    A pair qualifies by sharing a GSTIN, email or phone block, or at least
+    ``MIN_SHARED_GRAMS`` name trigram blocks; blocks larger than
+    ``MAX_BLOCK_SIZE`` are ignored.
+    """
+    blocks = defaultdict(list)
+    for pk, keys in keys_by_client.items():
+        for key in keys:
+            blocks[key].append(pk)
+    exact, shared_grams = set(), Counter()
+    for (kind, value), members in blocks.items():
+        if 1 < len(members) <= MAX_BLOCK_SIZE:
+            pairs = combinations(sorted(members), 2)
+            if kind == 'gram':
+                shared_grams.update(pairs)
+            else:
+                exact.update(pairs)
+    return exact.union(pair for pair, count in shared_grams.items() if count >= MIN_SHARED_GRAMS)
+
+
+def find_duplicates(min_score=MIN_SCORE, limit=None):
+    """Likely duplicate pairs, the most likely first.
+
+    Each ``Candidate`` holds the score, both clients' values rows (with an
+    ``invoice_count``) and the reasons for the score.
+    """
+    rows = {row['pk']: row for row in Client.objects.order_by().values(*CLIENT_FIELDS)}
+    normalized, keys_by_client = {}, {}
+    for pk, row in rows.items():
+        normalized[pk], keys_by_client[pk] = client_keys(row)
+
+    candidates = []
+    for first, second in candidate_pairs(keys_by_client):
+        score, reasons = score_pair(normalized[first], normalized[second])
+        if score >= min_score:
+            candidates.append(Candidate(round(score, 3), rows[first], rows[second], reasons))
+    candidates.sort(key=lambda candidate: (-candidate.score, candidate.first['pk'], candidate.second['pk']))
+    if limit:
+        candidates = candidates[:limit]
+
+    client_ids = {row['pk'] for candidate in candidates for row in (candidate.first, candidate.second)}
+    counts = dict(
+        Invoice.objects.filter(client_id__in=client_ids).order_by()
+        .values_list('client_id').annotate(Count('pk'))
+    )
+    for pk in client_ids:
+        rows[pk]['invoice_count'] = counts.get(pk, 0)
+    return candidates
+
+
+def merge_rollups(target_id, duplicate_ids):
+    """Fold the duplicates' revenue rollup rows into the target's"""
+    client_ids = [target_id, *duplicate_ids]
+    merged = defaultdict(lambda: dict.fromkeys(MEASURES, 0))
+    for row in RevenueRollup.objects.filter(client_id__in=client_ids).values(
+        'period', 'bucket', 'company_id', 'currency', *MEASURES
+    ):
+        key = (row['period'], row['bucket'], row['company_id'], row['currency'])
+        for field in MEASURES:
+            merged[key][field] += row[field]
+    RevenueRollup.objects.filter(client_id__in=client_ids).delete()
+    RevenueRollup.objects.bulk_create([
+        RevenueRollup(
+            period=period, bucket=bucket, company_id=company_id, client_id=target_id, currency=currency,
+            **measures,
+        )
+        for (period, bucket, company_id, currency), measures in merged.items()
+    ], batch_size=1000)
+
+
+def merge_clients(target, duplicates):
+    """Move everything billed to ``duplicates`` onto ``target`` and delete them.
+
+    Blank contact and tax fields of the target are filled in from the
+    duplicates. Returns the number of invoices moved.
+    """
+    duplicate_ids = [client.pk for client in duplicates if client.pk != target.pk]
+    if not duplicate_ids:
+        return 0
+    with transaction.atomic():
+        # Locked so no invoice can be added to a duplicate while it is merged
+        list(Client.objects.select_for_update().filter(pk__in=[target.pk, *duplicate_ids]))
+        moved = list(Invoice.objects.filter(client_id__in=duplicate_ids).values_list('pk', flat=True))
+        # updated_at moves so the analytics cache reloads the invoices
+        Invoice.objects.filter(client_id__in=duplicate_ids).update(client_id=target.pk, updated_at=timezone.now())
+        RecurringInvoice.objects.filter(client_id__in=duplicate_ids).update(client_id=target.pk)
+
+        # The archived snapshot is restored as saved, so it must name the new client too
+        archived = list(ArchivedInvoice.objects.filter(client_id__in=duplicate_ids))
+        for invoice in archived:
+            invoice.client_id = target.pk
+            for obj in invoice.payload.get('invoice', []):
+                obj['fields']['client'] = target.pk
+        ArchivedInvoice.objects.bulk_update(archived, ['client_id', 'payload'])
+
+        merge_rollups(target.pk, duplicate_ids)
+
+        filled = False
+        for client in duplicates:
+            for field in FILL_FIELDS:
+                if not getattr(target, field) and getattr(client, field):
+                    setattr(target, field, getattr(client, field))
+                    filled = True
+        if filled:
+            target.save()
+
+        record_changes(Invoice(pk=pk) for pk in moved)
+        Client.objects.filter(pk__in=duplicate_ids).delete()
+        transaction.on_commit(lambda: invalidate_client_fragments(target.pk))
+    return len(moved)
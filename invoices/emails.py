@@ -0,0 +1,149 @@
+"""
+Emailing invoices and payment receipts to clients.
+
+``queue_invoice_emails`` and ``queue_receipt_email`` record an
+``EmailDelivery`` per message and queue ``send_emails`` jobs of up to
+``EMAIL_BATCH_SIZE`` deliveries, so the request only writes a few rows. The
+worker renders each PDF attachment and sends a job's messages over one
+connection from ``get_connection``, instead of logging in to the SMTP server
+once per message.
+
+A message the server rejects (a bad address, say) marks its delivery
+failed. Any other error, such as losing the connection, fails the job; the
+queue retries it later and only the deliveries still queued are sent again.
+Every try counts in the delivery's ``attempts``, and the error that cut one
+short is kept in ``error`` until the delivery is sent. When the job runs
+out of retries, ``fail_deliveries`` marks the deliveries it never sent
+failed, so none is left queued with nothing to send it.
+"""
+import smtplib
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.template.loader import get_template, render_to_string
+from django.utils import timezone
+
+from .companies import get_company
+from .jobs import enqueue
+from .models import EmailDelivery, PaymentInfo
+from .pdf import PdfError, html_to_pdf
+
+EMAIL_BATCH_SIZE = 50
+
+# Errors about one message rather than the connection
+MESSAGE_ERRORS = (smtplib.SMTPRecipientsRefused, smtplib.SMTPSenderRefused, smtplib.SMTPDataError, PdfError)
+
+
+def queue_deliveries(deliveries):
+    with transaction.atomic():
+        EmailDelivery.objects.bulk_create(deliveries)
+        for start in range(0, len(deliveries), EMAIL_BATCH_SIZE):
+            batch = deliveries[start:start + EMAIL_BATCH_SIZE]
+            enqueue('send_emails', delivery_ids=[delivery.pk for delivery in batch])
+    return deliveries
+
+
+def queue_invoice_emails(invoices, user=None, recipient=None):
+    """Queue an email per invoice to ``recipient`` or its client's address.
+
+    Returns the deliveries queued and the invoices skipped for want of an
+    address.
+    """
+    deliveries, skipped = [], []
+    for invoice in invoices:
+        address = recipient or invoice.client.email
+        if address:
+            deliveries.append(EmailDelivery(kind='invoice', invoice=invoice, recipient=address, created_by=user))
+        else:
+            skipped.append(invoice)
+    return queue_deliveries(deliveries), skipped
+
+
+def queue_receipt_email(payment, user=None, recipient=None):
+    """Queue a payment receipt email, or return None if there is no address"""
+    address = recipient or payment.invoice.client.email
+    if not address:
+        return None
+    delivery = EmailDelivery(
+        kind='receipt', invoice=payment.invoice, payment=payment, recipient=address, created_by=user,
+    )
+    return queue_deliveries([delivery])[0]
+
+
+def render_invoice_pdf(invoice):
+    payment_info, created = PaymentInfo.objects.get_or_create(invoice=invoice)
+    return html_to_pdf(get_template('invoices/invoice_pdf.html').render({
+        'invoice': invoice,
+        'items': invoice.items.all(),
+        'payment_info': payment_info,
+    }))
+
+
+def render_receipt_pdf(payment):
+    return html_to_pdf(get_template('invoices/payment_receipt_pdf.html').render({
+        'payment': payment,
+        'invoice': payment.invoice,
+    }))
+
+
+def build_message(delivery):
+    """The email for a delivery, with its PDF attached"""
+    invoice = delivery.invoice
+    context = {'invoice': invoice, 'company': invoice.company, 'client': invoice.client, 'payment': delivery.payment}
+    if delivery.kind == 'receipt':
+        subject = f'Payment receipt for invoice {invoice.invoice_number}'
+        filename = f'receipt_{invoice.invoice_number}_{delivery.payment_id}.pdf'
+        attachment = render_receipt_pdf(delivery.payment)
+    else:
+        subject = f'Invoice {invoice.invoice_number} from {invoice.company.name}'
+        filename = f'invoice_{invoice.invoice_number}.pdf'
+        attachment = render_invoice_pdf(invoice)
+    message = EmailMessage(
+        subject=subject,
+        body=render_to_string(f'invoices/emails/{delivery.kind}.txt', context),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        to=[delivery.recipient],
+        reply_to=[invoice.company.email] if invoice.company.email else None,
+    )
+    message.attach(filename, attachment, 'application/pdf')
+    return message
+
+
+def send_deliveries(delivery_ids):
+    """Send the queued deliveries among ``delivery_ids`` over one connection"""
+    deliveries = list(
+        EmailDelivery.objects.filter(pk__in=delivery_ids, status='queued')
+        .select_related('invoice__client', 'payment__invoice').order_by('pk')
+    )
+    if not deliveries:
+        return
+    with get_connection() as connection:
+        for delivery in deliveries:
+            invoice = delivery.invoice
+            invoice.company = get_company(invoice.company_id)
+            if delivery.payment:
+                delivery.payment.invoice = invoice
+            attempted = EmailDelivery.objects.filter(pk=delivery.pk)
+            try:
+                connection.send_messages([build_message(delivery)])
+            except MESSAGE_ERRORS as e:
+                attempted.update(status='failed', error=str(e), attempts=F('attempts') + 1)
+                continue
+            except Exception as e:
+                # Still queued; the job's retry sends it again
+                attempted.update(error=str(e), attempts=F('attempts') + 1)
+                raise
+            attempted.update(status='sent', sent_at=timezone.now(), error='', attempts=F('attempts') + 1)
+            if delivery.kind == 'invoice' and invoice.status == 'draft':
+                invoice.status = 'sent'
+                invoice.save(update_fields=['status', 'updated_at'])
+
+
+def fail_deliveries(error, delivery_ids):
+    """Mark the deliveries of a job that gave up failed; on_give_up for send_emails"""
+    queued = EmailDelivery.objects.filter(pk__in=delivery_ids, status='queued')
+    # Keep the error of the attempt that was cut short, if there was one
+    queued.filter(error='').update(error=error.strip().splitlines()[-1] if error.strip() else 'Not sent')
+    queued.update(status='failed')
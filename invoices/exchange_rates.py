@@ -0,0 +1,150 @@
+"""
+Exchange rates for reporting across currencies.
+
+Every invoice stores its total and amount paid converted to rupees
+(``total_base`` and ``amount_paid_base``) at the rate in force on its invoice
+date, set by ``Invoice.save``. Reports can then add up invoices of any
+currency with a plain ``SUM`` instead of converting row by row.
+
+Rates are kept in the ``ExchangeRate`` table and loaded from a CSV file with
+``manage.py load_exchange_rates``; nothing is fetched over the network. The
+table is small, so it is cached whole under a versioned key and memoised per
+worker like the companies (``invoices.companies``), and converting an
+invoice costs no query. After loading rates, ``manage.py
+convert_invoice_totals`` recomputes the stored amounts of existing invoices.
+"""
+import bisect
+import csv
+import threading
+from datetime import date
+from decimal import Decimal, InvalidOperation
+
+from django.core.cache import cache
+from django.db import transaction
+
+from .caching import bump_version, get_version
+from .models import BASE_FIELDS, ExchangeRate, Invoice
+
+BASE_CURRENCY = 'INR'
+RATE_NAMESPACE = 'exchange_rate'
+RATE_CACHE_TIMEOUT = 60 * 60 * 24
+CONVERT_BATCH_SIZE = 1000
+
+CENT = Decimal('0.01')
+
+_local = {'version': None, 'rates': {}}
+_lock = threading.Lock()
+
+
+class RateFileError(Exception):
+    """The rate file cannot be loaded"""
+
+
+def _load():
+    """{currency: (dates, rates)} with the dates in ascending order"""
+    version = get_version(RATE_NAMESPACE)
+    with _lock:
+        if _local['version'] == version:
+            return _local['rates']
+
+    key = f'{RATE_NAMESPACE}:{version}:all'
+    rates = cache.get(key)
+    if rates is None:
+        rates = {}
+        for currency, day, rate in ExchangeRate.objects.order_by('currency', 'date').values_list('currency', 'date', 'rate'):
+            dates, values = rates.setdefault(currency, ([], []))
+            dates.append(day)
+            values.append(rate)
+        cache.set(key, rates, RATE_CACHE_TIMEOUT)
+    with _lock:
+        _local['version'] = version
+        _local['rates'] = rates
+    return rates
+
+
+def invalidate_rates():
+    bump_version(RATE_NAMESPACE)
+    with _lock:
+        _local['version'] = None
+
+
+def rate_for(currency, day):
+    """Rupees per unit of ``currency`` on ``day``, or None if no rate is known yet"""
+    if currency == BASE_CURRENCY:
+        return Decimal('1')
+    dates, values = _load().get(currency, ((), ()))
+    index = bisect.bisect_right(dates, day)
+    return values[index - 1] if index else None
+
+
+def to_base(amount, rate):
+    if rate is None or amount is None:
+        return None
+    return (amount * rate).quantize(CENT)
+
+
+def read_rate_file(path):
+    """ExchangeRate rows from a CSV file with currency, date and rate columns"""
+    currencies = {code for code, label in Invoice.CURRENCY_CHOICES} - {BASE_CURRENCY}
+    rows, errors = {}, []
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing = {'currency', 'date', 'rate'} - set(reader.fieldnames or ())
+        if missing:
+            raise RateFileError(f'Missing columns: {", ".join(sorted(missing))}')
+        for row in reader:
+            currency = (row['currency'] or '').strip().upper()
+            try:
+                if currency not in currencies:
+                    raise ValueError(f'unknown currency "{currency}"')
+                day = date.fromisoformat((row['date'] or '').strip())
+                rate = Decimal((row['rate'] or '').strip())
+                if not rate > 0:
+                    raise ValueError('the rate must be positive')
+            except (ValueError, InvalidOperation) as e:
+                errors.append(f'line {reader.line_num}: {e or "invalid rate"}')
+                continue
+            # A later line for the same day wins
+            rows[currency, day] = ExchangeRate(currency=currency, date=day, rate=rate)
+    if errors:
+        raise RateFileError('\n'.join(errors))
+    return list(rows.values())
+
+
+def load_rates(path):
+    """Insert or update the rates in a file; returns how many were read"""
+    rates = read_rate_file(path)
+    with transaction.atomic():
+        ExchangeRate.objects.bulk_create(
+            rates, update_conflicts=True, unique_fields=['currency', 'date'], update_fields=['rate', 'updated_at'],
+        )
+    transaction.on_commit(invalidate_rates)
+    return len(rates)
+
+
+def convert_invoices(currency=None, batch_size=CONVERT_BATCH_SIZE):
+    """Recompute the rupee amounts of every invoice (of one currency) in batches.
+
+    Only invoices whose amounts change are written, with one ``bulk_update``
+    per batch. Yields the running (checked, updated) counts after each batch.
+    """
+    invoices = Invoice.objects.order_by('pk').only('pk', 'currency', 'invoice_date', 'total', 'amount_paid', *BASE_FIELDS)
+    if currency:
+        invoices = invoices.filter(currency=currency)
+    checked = updated = 0
+    last_pk = 0
+    while True:
+        batch = list(invoices.filter(pk__gt=last_pk)[:batch_size])
+        if not batch:
+            return
+        changed = []
+        for invoice in batch:
+            before = [getattr(invoice, field) for field in BASE_FIELDS]
+            invoice.convert_to_base()
+            if [getattr(invoice, field) for field in BASE_FIELDS] != before:
+                changed.append(invoice)
+        Invoice.objects.bulk_update(changed, BASE_FIELDS)
+        checked += len(batch)
+        updated += len(changed)
+        last_pk = batch[-1].pk
+        yield checked, updated
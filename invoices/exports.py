@@ -0,0 +1,277 @@
+"""
+Streaming CSV, JSON and XLSX helpers, and the invoice, item and payment
+exports built on them.
+
+Rows are written one at a time into a pseudo-buffer and yielded straight to
+``StreamingHttpResponse``, so exports start immediately and use constant
+memory regardless of how many rows the queryset returns.
+
+XLSX files are zip archives of XML parts. ``xlsx_chunks`` writes the
+worksheet into a zip entry as rows arrive and yields the compressed bytes,
+so spreadsheets stream the same way without a spreadsheet library.
+"""
+import csv
+import json
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from xml.sax.saxutils import escape
+
+from django.db.models import DecimalField, ExpressionWrapper, F
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from .models import Invoice, InvoiceItem, Payment
+
+EXPORT_CHUNK_SIZE = 2000
+
+
+class Echo:
+    """File-like object that returns what is written instead of storing it"""
+
+    def write(self, value):
+        return value
+
+
+def csv_rows(header, rows):
+    """Yield CSV-encoded lines for a header and an iterable of rows"""
+    writer = csv.writer(Echo())
+    yield writer.writerow(header)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+def stream_csv(filename, header, rows):
+    """Build a streaming CSV download response"""
+    response = StreamingHttpResponse(csv_rows(header, rows), content_type='text/csv')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+def json_rows(rows, default=str):
+    """Yield a JSON array one element at a time"""
+    yield '['
+    for index, row in enumerate(rows):
+        yield (',' if index else '') + json.dumps(row, default=default)
+    yield ']'
+
+
+def stream_json(filename, rows):
+    """Build a streaming JSON download response for an iterable of dicts"""
+    response = StreamingHttpResponse(json_rows(rows), content_type='application/json')
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# XLSX
+
+XLSX_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+MAIN_NS = 'http://schemas.openxmlformats.org/spreadsheetml/2006/main'
+REL_NS = 'http://schemas.openxmlformats.org/officeDocument/2006/relationships'
+PACKAGE_REL_NS = 'http://schemas.openxmlformats.org/package/2006/relationships'
+XML_HEADER = '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+
+XLSX_PARTS = {
+    '[Content_Types].xml': (
+        '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+        '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+        '<Default Extension="xml" ContentType="application/xml"/>'
+        '<Override PartName="/xl/workbook.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+        '<Override PartName="/xl/worksheets/sheet1.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+        '<Override PartName="/xl/styles.xml" '
+        'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.styles+xml"/>'
+        '</Types>'
+    ),
+    '_rels/.rels': (
+        f'<Relationships xmlns="{PACKAGE_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{REL_NS}/officeDocument" Target="xl/workbook.xml"/>'
+        '</Relationships>'
+    ),
+    'xl/_rels/workbook.xml.rels': (
+        f'<Relationships xmlns="{PACKAGE_REL_NS}">'
+        f'<Relationship Id="rId1" Type="{REL_NS}/worksheet" Target="worksheets/sheet1.xml"/>'
+        f'<Relationship Id="rId2" Type="{REL_NS}/styles" Target="styles.xml"/>'
+        '</Relationships>'
+    ),
+    # Cell styles: 0 default, 1 date, 2 bold header, 3 amount, 4 date and time
+    'xl/styles.xml': (
+        f'<styleSheet xmlns="{MAIN_NS}">'
+        '<fonts count="2"><font><sz val="11"/><name val="Calibri"/></font>'
+        '<font><b/><sz val="11"/><name val="Calibri"/></font></fonts>'
+        '<fills count="2"><fill><patternFill patternType="none"/></fill>'
+        '<fill><patternFill patternType="gray125"/></fill></fills>'
+        '<borders count="1"><border><left/><right/><top/><bottom/><diagonal/></border></borders>'
+        '<cellStyleXfs count="1"><xf numFmtId="0" fontId="0" fillId="0" borderId="0"/></cellStyleXfs>'
+        '<cellXfs count="5">'
+        '<xf numFmtId="0" fontId="0" fillId="0" borderId="0" xfId="0"/>'
+        '<xf numFmtId="14" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="0" fontId="1" fillId="0" borderId="0" xfId="0" applyFont="1"/>'
+        '<xf numFmtId="4" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '<xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+        '</cellXfs>'
+        '<cellStyles count="1"><cellStyle name="Normal" xfId="0" builtinId="0"/></cellStyles>'
+        '</styleSheet>'
+    ),
+}
+
+EXCEL_EPOCH = datetime(1899, 12, 30)
+# Characters XML 1.0 does not allow
+ILLEGAL_XML_CHARS = re.compile('[\x00-\x08\x0b\x0c\x0e-\x1f]')
+XLSX_FLUSH_BYTES = 64 * 1024
+XLSX_ROWS_PER_WRITE = 500
+
+
+class Pipe:
+    """Unseekable file-like object collecting what zipfile writes until drained"""
+
+    def __init__(self):
+        self.chunks = []
+        self.size = 0
+
+    def write(self, data):
+        self.chunks.append(bytes(data))
+        self.size += len(data)
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self.chunks)
+        self.chunks, self.size = [], 0
+        return data
+
+
+def xlsx_cell(value, style=None):
+    """One <c> element; cells carry no reference, so empty ones are kept"""
+    if value is None or value == '':
+        return '<c/>'
+    if isinstance(value, bool):
+        return f'<c t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float, Decimal)):
+        style = style or (3 if isinstance(value, Decimal) else None)
+        return f'<c s="{style}"><v>{value}</v></c>' if style else f'<c><v>{value}</v></c>'
+    if isinstance(value, datetime):
+        if timezone.is_aware(value):
+            value = timezone.make_naive(value)
+        serial = (value - EXCEL_EPOCH).total_seconds() / 86400
+        return f'<c s="4"><v>{serial:.6f}</v></c>'
+    if isinstance(value, date):
+        return f'<c s="1"><v>{(value - EXCEL_EPOCH.date()).days}</v></c>'
+    text = escape(ILLEGAL_XML_CHARS.sub('', str(value)))
+    style = f' s="{style}"' if style else ''
+    return f'<c t="inlineStr"{style}><is><t xml:space="preserve">{text}</t></is></c>'
+
+
+def xlsx_chunks(header, rows, sheet_name='Sheet1'):
+    """Yield the bytes of a one-sheet XLSX file for a header and rows"""
+    pipe = Pipe()
+    with zipfile.ZipFile(pipe, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, xml in XLSX_PARTS.items():
+            archive.writestr(name, XML_HEADER + xml)
+        archive.writestr('xl/workbook.xml', (
+            f'{XML_HEADER}<workbook xmlns="{MAIN_NS}" xmlns:r="{REL_NS}"><sheets>'
+            f'<sheet name="{escape(sheet_name[:31])}" sheetId="1" r:id="rId1"/>'
+            '</sheets></workbook>'
+        ))
+        yield pipe.drain()
+
+        with archive.open('xl/worksheets/sheet1.xml', 'w') as sheet:
+            sheet.write(f'{XML_HEADER}<worksheet xmlns="{MAIN_NS}"><sheetData>'.encode())
+            lines = ['<row>' + ''.join(xlsx_cell(value, 2) for value in header) + '</row>']
+            for row in rows:
+                lines.append('<row>' + ''.join(xlsx_cell(value) for value in row) + '</row>')
+                if len(lines) >= XLSX_ROWS_PER_WRITE:
+                    sheet.write(''.join(lines).encode())
+                    lines = []
+                    if pipe.size >= XLSX_FLUSH_BYTES:
+                        yield pipe.drain()
+            sheet.write((''.join(lines) + '</sheetData></worksheet>').encode())
+    yield pipe.drain()
+
+
+def stream_xlsx(filename, header, rows, sheet_name='Sheet1'):
+    """Build a streaming XLSX download response"""
+    response = StreamingHttpResponse(xlsx_chunks(header, rows, sheet_name), content_type=XLSX_CONTENT_TYPE)
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+
+# Invoice exports
+
+# dataset -> (model, lookup to the invoice, ordering, extra annotations, [(field, header)])
+EXPORTS = {
+    'invoices': (Invoice, 'pk', ('pk',), {'balance_due': ExpressionWrapper(
+        F('total') - F('amount_paid'), output_field=DecimalField(max_digits=12, decimal_places=2),
+    )}, [
+        ('invoice_number', 'Invoice #'),
+        ('is_quotation', 'Quotation'),
+        ('invoice_date', 'Invoice Date'),
+        ('due_date', 'Due Date'),
+        ('company__name', 'Company'),
+        ('client__name', 'Client'),
+        ('client__gstin', 'Client GSTIN'),
+        ('status', 'Status'),
+        ('currency', 'Currency'),
+        ('subtotal', 'Subtotal'),
+        ('discount_amount', 'Discount'),
+        ('tax_amount', 'GST'),
+        ('total', 'Total'),
+        ('amount_paid', 'Paid'),
+        ('balance_due', 'Balance Due'),
+    ]),
+    'items': (InvoiceItem, 'invoice', ('invoice_id', 'order', 'id'), {}, [
+        ('invoice__invoice_number', 'Invoice #'),
+        ('invoice__invoice_date', 'Invoice Date'),
+        ('invoice__client__name', 'Client'),
+        ('description', 'Description'),
+        ('unit_type', 'Unit'),
+        ('quantity', 'Quantity'),
+        ('rate', 'Rate'),
+        ('discount', 'Discount %'),
+        ('tax_rate', 'GST %'),
+        ('amount', 'Amount'),
+    ]),
+    'payments': (Payment, 'invoice', ('invoice_id', '-paid_on', '-created_at'), {}, [
+        ('invoice__invoice_number', 'Invoice #'),
+        ('invoice__client__name', 'Client'),
+        ('paid_on', 'Paid On'),
+        ('amount', 'Amount'),
+        ('invoice__currency', 'Currency'),
+        ('method', 'Method'),
+        ('is_advance', 'Advance'),
+        ('reference', 'Reference'),
+        ('note', 'Note'),
+    ]),
+}
+EXPORT_FORMATS = ('csv', 'xlsx')
+EXPORT_LABELS = {'invoices': 'Invoices', 'items': 'Line Items', 'payments': 'Payments'}
+
+
+def export_rows(dataset, invoices, using=None):
+    """Header and a lazily streamed row iterator for one export dataset.
+
+    ``using`` pins the database: the rows are read after the view has
+    returned, outside any ``@read_replica`` block.
+    """
+    model, invoice_lookup, ordering, annotations, columns = EXPORTS[dataset]
+    if invoice_lookup == 'pk':
+        rows = invoices
+    else:
+        rows = model.objects.filter(**{f'{invoice_lookup}__in': invoices.order_by().values('pk')})
+    if using:
+        rows = rows.using(using)
+    rows = rows.annotate(**annotations).order_by(*ordering).values_list(*(field for field, header in columns))
+    return [header for field, header in columns], rows.iterator(chunk_size=EXPORT_CHUNK_SIZE)
+
+
+def export_response(dataset, invoices, export_format='csv', using=None):
+    """Streaming download of an export dataset for the given invoices"""
+    header, rows = export_rows(dataset, invoices, using)
+    filename = f'{dataset}_{date.today():%Y%m%d}.{export_format}'
+    if export_format == 'xlsx':
+        return stream_xlsx(filename, header, rows, sheet_name=dataset.title())
+    return stream_csv(filename, header, rows)
@@ -0,0 +1,59 @@
+"""
+Invoice list filters, shared by the invoice list pages and the exports.
+"""
+from datetime import date
+
+from django.db.models import Q
+
+# Query string parameters understood by filter_invoices
+FILTER_PARAMS = ('q', 'status', 'date_from', 'date_to', 'client', 'company', 'kind')
+
+
+def parse_date(value):
+    try:
+        return date.fromisoformat(value) if value else None
+    except ValueError:
+        return None
+
+
+def parse_id(value):
+    return int(value) if value and value.isdigit() else None
+
+
+def filter_invoices(invoices, params):
+    """Apply the list filters in ``params`` (usually request.GET) to a queryset.
+
+    Unparseable values are ignored, as an empty filter would be.
+    """
+    status = params.get('status')
+    if status:
+        invoices = invoices.filter(status=status)
+
+    search_query = params.get('q')
+    if search_query:
+        invoices = invoices.filter(
+            Q(invoice_number__icontains=search_query) |
+            Q(client__name__icontains=search_query)
+        )
+
+    date_from, date_to = parse_date(params.get('date_from')), parse_date(params.get('date_to'))
+    if date_from:
+        invoices = invoices.filter(invoice_date__gte=date_from)
+    if date_to:
+        invoices = invoices.filter(invoice_date__lte=date_to)
+
+    client_id, company_id = parse_id(params.get('client')), parse_id(params.get('company'))
+    if client_id:
+        invoices = invoices.filter(client_id=client_id)
+    if company_id:
+        invoices = invoices.filter(company_id=company_id)
+
+    kind = params.get('kind')
+    if kind in ('invoice', 'quotation'):
+        invoices = invoices.filter(is_quotation=kind == 'quotation')
+    return invoices
+
+
+def active_filters(params):
+    """The filter parameters that are set, for keeping them in export links"""
+    return {name: params[name] for name in FILTER_PARAMS if params.get(name)}
@@ -1,6 +1,8 @@
 from django import forms
 from django.forms import inlineformset_factory
-from .models import Company, Client, Invoice, InvoiceItem, PaymentInfo, Payment
+from .models import (
+    Company, Client, Invoice, InvoiceItem, PaymentInfo, Payment, RecurringInvoice, RecurringInvoiceItem,
+)
 
 
 class CompanyForm(forms.ModelForm):
@@ -75,6 +77,9 @@ class InvoiceForm(forms.ModelForm):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # Render the company select from the cached company list
+        from .companies import company_choices
+        self.fields['company'].choices = [('', self.fields['company'].empty_label)] + company_choices()
         # Set initial date to today if creating new invoice
         if not self.instance.pk:
             from datetime import date, timedelta
@@ -150,3 +155,69 @@ class PaymentForm(forms.ModelForm):
             'note': forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Notes (optional)'}),
             'paid_on': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
         }
+
+
+class RecurringInvoiceForm(forms.ModelForm):
+    """Schedule of a recurring invoice"""
+
+    class Meta:
+        model = RecurringInvoice
+        fields = [
+            'name', 'company', 'client', 'currency', 'interval', 'start_date', 'next_run',
+            'end_date', 'due_days', 'auto_send', 'is_active', 'notes', 'terms',
+        ]
+        widgets = {
+            'name': forms.TextInput(attrs={'class': 'form-control'}),
+            'company': forms.Select(attrs={'class': 'form-control'}),
+            'client': forms.Select(attrs={'class': 'form-control'}),
+            'currency': forms.Select(attrs={'class': 'form-control'}),
+            'interval': forms.Select(attrs={'class': 'form-control'}),
+            'start_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'next_run': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'end_date': forms.DateInput(attrs={'class': 'form-control', 'type': 'date'}),
+            'due_days': forms.NumberInput(attrs={'class': 'form-control', 'min': '0'}),
+            'auto_send': forms.CheckboxInput(attrs={'class': 'form-check-input', 'role': 'switch'}),
+            'is_active': forms.CheckboxInput(attrs={'class': 'form-check-input', 'role': 'switch'}),
+            'notes': forms.Textarea(attrs={'rows': 2, 'class': 'form-control'}),
+            'terms': forms.Textarea(attrs={'rows': 2, 'class': 'form-control'}),
+        }
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        from .companies import company_choices
+        self.fields['company'].choices = [('', self.fields['company'].empty_label)] + company_choices()
+        if not self.instance.pk:
+            # A new schedule's first invoice is its start date
+            del self.fields['next_run']
+
+    def clean(self):
+        cleaned_data = super().clean()
+        first = cleaned_data.get('next_run') or cleaned_data.get('start_date')
+        end_date = cleaned_data.get('end_date')
+        if first and end_date and end_date < first:
+            self.add_error('end_date', 'The end date is before the next invoice date.')
+        last_run = self.instance.last_run
+        if cleaned_data.get('next_run') and last_run and cleaned_data['next_run'] <= last_run:
+            self.add_error('next_run', f'Invoices were already generated up to {last_run:%d %b %Y}.')
+        return cleaned_data
+
+
+class RecurringInvoiceItemForm(InvoiceItemForm):
+    """Line item of a recurring invoice"""
+
+    class Meta(InvoiceItemForm.Meta):
+        model = RecurringInvoiceItem
+
+
+def recurring_item_formset(extra=1):
+    """Formset class for a schedule's items with ``extra`` blank (or initial) forms"""
+    return inlineformset_factory(
+        RecurringInvoice,
+        RecurringInvoiceItem,
+        form=RecurringInvoiceItemForm,
+        extra=extra,
+        can_delete=True,
+    )
+
+
+RecurringInvoiceItemFormSet = recurring_item_formset()
@@ -0,0 +1,48 @@
+"""
+Versions for the cached fragments of the invoice detail page.
+
+``invoice_detail.html`` caches the company header, the client addresses,
+the item table, the payment method and amount in words, the totals and the
+footer with ``{% cache %}``, each fragment one complete element, keyed on the
+versions returned by ``fragment_versions``. ``invoices.signals`` bumps the
+invoice version when the invoice, its items or its payment info change, and
+the client version when the client changes; company changes already bump
+the version from ``invoices.companies``.
+
+Recording a payment only touches ``amount_paid`` (and its rupee amount) and
+``status``, which the cached fragments do not show, so it leaves the version
+alone: the status header, balance due and payment history are rendered on
+every request.
+"""
+from .caching import bump_version, get_version
+from .companies import COMPANY_NAMESPACE
+
+FRAGMENT_TIMEOUT = 60 * 60 * 24
+
+# Invoice fields only rendered outside the cached fragments
+UNCACHED_FIELDS = frozenset({
+    'amount_paid', 'status', 'updated_at', 'exchange_rate', 'total_base', 'amount_paid_base',
+})
+
+
+def fragment_versions(invoice, archived=None):
+    """Cache key parts for the detail page fragments of an invoice"""
+    if archived is not None:
+        # Archived snapshots never change
+        revision = f'archived.{archived.archived_at.timestamp()}'
+    else:
+        revision = get_version(f'invoice:{invoice.pk}')
+    return {
+        'timeout': FRAGMENT_TIMEOUT,
+        'invoice': revision,
+        'client': get_version(f'client:{invoice.client_id}'),
+        'company': get_version(COMPANY_NAMESPACE),
+    }
+
+
+def invalidate_invoice_fragments(invoice_pk):
+    bump_version(f'invoice:{invoice_pk}')
+
+
+def invalidate_client_fragments(client_pk):
+    bump_version(f'client:{client_pk}')
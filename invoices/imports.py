@@ -0,0 +1,283 @@
+"""
+CSV import of clients and historical invoices.
+
+Files are read row by row and processed in chunks. Each chunk is validated
+with the same forms as the web pages and inserted with ``bulk_create`` in one
+transaction, which also advances the file's ``ImportCheckpoint``. A failed
+or interrupted import therefore resumes after the last committed chunk when
+it is run again on the same file.
+
+Clients are deduplicated by GSTIN, then by email, against the database and
+the rows already imported. The invoice file has one row per line item; rows
+of the same invoice are consecutive and share its ``invoice_number``, and
+the invoice columns are read from its first row. Invoice totals are
+computed once per invoice from its items, and an ``amount_paid`` column
+becomes a single payment. Invoices whose number already exists are skipped.
+"""
+import csv
+import hashlib
+from collections import namedtuple
+from itertools import groupby, islice
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.functions import Lower, Upper
+
+from .bulk import form_errors, insert_invoices, validate_record, with_defaults
+from .changes import record_changes
+from .companies import all_companies
+from .forms import ClientForm
+from .models import Client, ImportCheckpoint, Invoice
+
+CHUNK_SIZE = 500
+
+INVOICE_COLUMNS = (
+    'invoice_date', 'due_date', 'status', 'currency', 'is_quotation', 'notes', 'terms',
+)
+ITEM_COLUMNS = ('description', 'unit_type', 'quantity', 'rate', 'discount', 'tax_rate')
+
+# A rejected row (or invoice): CSV line number, what it was, error messages
+RowError = namedtuple('RowError', 'line record messages')
+
+
+class ImportFileError(Exception):
+    """The file cannot be imported at all"""
+
+
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for block in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def read_rows(path, required):
+    """Yield (line number, row) with blank values dropped, skipping empty rows"""
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        reader = csv.DictReader(f)
+        missing = set(required) - set(reader.fieldnames or ())
+        if missing:
+            raise ImportFileError(f'Missing columns: {", ".join(sorted(missing))}')
+        for row in reader:
+            values = {
+                key.strip(): value.strip() for key, value in row.items()
+                if key and value and value.strip()
+            }
+            if values:
+                yield reader.line_num, values
+
+
+def flatten_errors(errors, prefix=''):
+    """Error dicts (possibly nested per item) as 'field: message' strings"""
+    for field, value in errors.items():
+        name = field if field != '__all__' else ''
+        name = f'{prefix}.{name}' if prefix and name else prefix or name
+        if isinstance(value, dict):
+            yield from flatten_errors(value, name)
+        else:
+            for message in value:
+                yield f'{name}: {message}' if name else message
+
+
+def client_keys(gstin, email):
+    """Deduplication keys of a client, strongest first"""
+    keys = []
+    if gstin:
+        keys.append(('gstin', gstin.upper()))
+    if email:
+        keys.append(('email', email.lower()))
+    return keys
+
+
+def existing_clients(gstins=(), emails=(), names=()):
+    """{(key type, key): client pk} for clients matching any of the given keys"""
+    query = Q()
+    if gstins:
+        query |= Q(gstin_key__in=gstins)
+    if emails:
+        query |= Q(email_key__in=emails)
+    if names:
+        query |= Q(name_key__in=names)
+    if not query:
+        return {}
+    rows = Client.objects.annotate(
+        gstin_key=Upper('gstin'), email_key=Lower('email'), name_key=Lower('name'),
+    ).filter(query).order_by('pk').values_list('pk', 'gstin_key', 'email_key', 'name_key')
+    found = {}
+    for pk, gstin, email, name in rows:
+        for key in (('gstin', gstin), ('email', email), ('name', name)):
+            if key[1]:
+                found.setdefault(key, pk)
+    return found
+
+
+def import_client_chunk(rows, user=None):
+    """Validate, deduplicate and insert a chunk of client rows"""
+    errors, valid = [], []
+    for line, row in rows:
+        form = ClientForm(with_defaults(ClientForm, row))
+        if form.is_valid():
+            valid.append((line, form.save(commit=False)))
+        else:
+            errors.append(RowError(line, row.get('name', ''), list(flatten_errors(form_errors(form)))))
+
+    keys = [client_keys(client.gstin, client.email) for line, client in valid]
+    known = existing_clients(
+        gstins={value for client in keys for kind, value in client if kind == 'gstin'},
+        emails={value for client in keys for kind, value in client if kind == 'email'},
+    )
+    new, skipped = [], 0
+    for (line, client), client_key in zip(valid, keys):
+        if any(key in known for key in client_key):
+            skipped += 1
+            continue
+        client.created_by = user
+        new.append(client)
+        # Later rows in this chunk are duplicates of this one
+        known.update((key, None) for key in client_key)
+    Client.objects.bulk_create(new)
+    record_changes(new)
+    return len(new), skipped, errors
+
+
+def client_chunks(rows, size):
+    while chunk := list(islice(rows, size)):
+        yield len(chunk), chunk
+
+
+def invoice_groups(rows):
+    """(invoice_number, [(line, row), ...]) for consecutive rows of one invoice"""
+    for number, group in groupby(rows, key=lambda line_row: line_row[1].get('invoice_number', '')):
+        yield number, list(group)
+
+
+def invoice_chunks(rows, size):
+    """Chunks of whole invoices holding about ``size`` rows each"""
+    chunk, count = [], 0
+    for number, group in invoice_groups(rows):
+        chunk.append((number, group))
+        count += len(group)
+        if count >= size:
+            yield count, chunk
+            chunk, count = [], 0
+    if chunk:
+        yield count, chunk
+
+
+def resolve_company(value, companies):
+    """Company pk for an id or name column, or the only company if blank"""
+    if not value:
+        return companies[0].pk if len(companies) == 1 else None
+    for company in companies:
+        if value == str(company.pk) or value.lower() == company.name.lower():
+            return company.pk
+    return None
+
+
+def invoice_record(head, group, company_id, client_id):
+    """The bulk API record for one invoice's rows"""
+    record = {column: head[column] for column in INVOICE_COLUMNS if column in head}
+    record.update(company=company_id, client=client_id)
+    record['items'] = [
+        {column: row[column] for column in ITEM_COLUMNS if column in row}
+        for line, row in group
+    ]
+    if head.get('amount_paid'):
+        record['payments'] = [{
+            'amount': head['amount_paid'],
+            'paid_on': head.get('paid_on') or head.get('invoice_date'),
+            'method': 'other',
+            'is_advance': False,
+            'note': 'Imported',
+        }]
+    return record
+
+
+def import_invoice_chunk(groups, user=None):
+    """Validate and insert a chunk of invoices (lists of item rows)"""
+    heads = [(group[0][0], group[0][1]) for number, group in groups]
+    known = existing_clients(
+        gstins={row['client_gstin'].upper() for line, row in heads if row.get('client_gstin')},
+        emails={row['client_email'].lower() for line, row in heads if row.get('client_email')},
+        names={row['client_name'].lower() for line, row in heads if row.get('client_name')},
+    )
+    existing = set(Invoice.objects.filter(
+        invoice_number__in=[number for number, group in groups if number]
+    ).values_list('invoice_number', flat=True))
+    companies = all_companies()
+
+    errors, valid, skipped, seen = [], [], 0, set()
+    for number, group in groups:
+        line, head = group[0]
+        if not number:
+            errors.append(RowError(line, '', ['invoice_number: This field is required.']))
+            continue
+        if number in existing or number in seen:
+            skipped += 1
+            continue
+        seen.add(number)
+        client_id = next((
+            known[key] for key in (
+                ('gstin', head.get('client_gstin', '').upper()),
+                ('email', head.get('client_email', '').lower()),
+                ('name', head.get('client_name', '').lower()),
+            ) if key[1] and key in known
+        ), None)
+        company_id = resolve_company(head.get('company'), companies)
+        if client_id is None or company_id is None:
+            messages = []
+            if client_id is None:
+                messages.append('client: No client matches client_gstin, client_email or client_name.')
+            if company_id is None:
+                messages.append('company: Unknown company.')
+            errors.append(RowError(line, number, messages))
+            continue
+        invoice, items, payments, record_errors = validate_record(invoice_record(head, group, company_id, client_id))
+        if record_errors:
+            errors.append(RowError(line, number, list(flatten_errors(record_errors))))
+            continue
+        invoice.invoice_number = number
+        valid.append((line, invoice, items, payments))
+
+    invoices = insert_invoices(valid, user) if valid else []
+    return len(invoices), skipped, errors
+
+
+IMPORTERS = {
+    'clients': (('name', 'billing_address'), client_chunks, import_client_chunk),
+    'invoices': (('invoice_number', 'invoice_date', 'description'), invoice_chunks, import_invoice_chunk),
+}
+
+
+def get_checkpoint(kind, path, restart=False):
+    """The checkpoint of this file's import, reset to the start if ``restart``"""
+    checkpoint, created = ImportCheckpoint.objects.get_or_create(
+        kind=kind, digest=file_digest(path), defaults={'filename': str(path)[-255:]},
+    )
+    if restart and not created:
+        checkpoint.rows_done = checkpoint.created = checkpoint.skipped = checkpoint.failed = 0
+        checkpoint.finished = False
+        checkpoint.save()
+    return checkpoint
+
+
+def run_import(checkpoint, path, chunk_size=CHUNK_SIZE, user=None):
+    """Import the rows after the checkpoint, chunk by chunk.
+
+    Yields ``(checkpoint, errors)`` after each committed chunk.
+    """
+    required, chunker, import_chunk = IMPORTERS[checkpoint.kind]
+    rows = islice(read_rows(path, required), checkpoint.rows_done, None)
+    for row_count, chunk in chunker(rows, chunk_size):
+        with transaction.atomic():
+            created, skipped, errors = import_chunk(chunk, user)
+            checkpoint.rows_done += row_count
+            checkpoint.created += created
+            checkpoint.skipped += skipped
+            checkpoint.failed += len(errors)
+            checkpoint.save()
+        yield checkpoint, errors
+
+    checkpoint.finished = True
+    checkpoint.save(update_fields=['finished', 'updated_at'])
@@ -0,0 +1,163 @@
+"""
+Background jobs stored in the database.
+
+``enqueue`` adds a ``Job`` row naming a task registered with ``@task``
+(see ``invoices.tasks``) and its keyword arguments, which must be JSON
+serialisable. Enqueued inside a transaction, the job only becomes visible
+to workers when that transaction commits, so a task never runs against rows
+that were rolled back.
+
+``manage.py run_worker`` claims due jobs by priority. On PostgreSQL a
+claim is ``SELECT ... FOR UPDATE SKIP LOCKED``, so concurrent workers skip
+each other's rows instead of waiting on them. SQLite has no row locks and
+serialises writers; there a claim is a conditional ``UPDATE`` that only one
+worker can win. A job that raises is retried with exponential backoff until
+``max_attempts``, then marked failed with its traceback, and the task's
+``on_give_up`` handler (if any) cleans up after it. A job left running by
+a worker that died is requeued after ``JOB_TIMEOUT``.
+"""
+import traceback
+from datetime import timedelta
+
+from django.db import connections, router, transaction
+from django.db.models import Count, F, Min
+from django.utils import timezone
+
+from .models import Job
+
+# Seconds before the first retry; each further retry waits four times longer
+RETRY_DELAY = 30
+# A running job whose worker has not finished it in this long is requeued
+JOB_TIMEOUT = timedelta(minutes=30)
+# Due jobs a SQLite worker tries per claim before giving up to a competitor
+CLAIM_CANDIDATES = 5
+
+TASKS = {}
+# Called with the error and the job's kwargs once a job of the task has failed for good
+GIVE_UP_HANDLERS = {}
+
+
+def task(func=None, *, on_give_up=None):
+    """Register a function as a task under its name.
+
+    Use as ``@task`` or ``@task(on_give_up=handler)``; ``handler(error,
+    **kwargs)`` runs when one of its jobs runs out of attempts.
+    """
+    def register(func):
+        TASKS[func.__name__] = func
+        if on_give_up is not None:
+            GIVE_UP_HANDLERS[func.__name__] = on_give_up
+        return func
+    return register(func) if func is not None else register
+
+
+def give_up(job, error):
+    """Run the task's handler for a job that will not be retried"""
+    from . import tasks  # noqa: F401  registers the tasks
+    handler = GIVE_UP_HANDLERS.get(job.task)
+    if handler is not None:
+        handler(error, **job.kwargs)
+
+
+def enqueue(task_name, priority=0, run_at=None, delay=None, max_attempts=3, **kwargs):
+    """Queue ``task_name(**kwargs)``; ``run_at`` or ``delay`` schedule it for later"""
+    if run_at is None:
+        run_at = timezone.now() + (delay or timedelta())
+    return Job.objects.create(
+        task=task_name, kwargs=kwargs, priority=priority, run_at=run_at, max_attempts=max_attempts,
+    )
+
+
+def due_jobs():
+    return Job.objects.filter(status='queued', run_at__lte=timezone.now()).order_by('-priority', 'run_at', 'pk')
+
+
+def claim_job(worker_id):
+    """Mark the next due job as running for this worker and return it, or None"""
+    now = timezone.now()
+    claimed = {'status': 'running', 'locked_by': worker_id, 'locked_at': now}
+    connection = connections[router.db_for_write(Job)]
+    if connection.features.has_select_for_update_skip_locked:
+        with transaction.atomic(using=connection.alias):
+            job = due_jobs().select_for_update(skip_locked=True).first()
+            if job is None:
+                return None
+            Job.objects.filter(pk=job.pk).update(attempts=F('attempts') + 1, **claimed)
+    else:
+        for pk in due_jobs().values_list('pk', flat=True)[:CLAIM_CANDIDATES]:
+            if Job.objects.filter(pk=pk, status='queued').update(attempts=F('attempts') + 1, **claimed):
+                break
+        else:
+            return None
+        job = Job(pk=pk)
+    job.refresh_from_db()
+    return job
+
+
+def retry_delay(attempts):
+    return timedelta(seconds=RETRY_DELAY * 4 ** (attempts - 1))
+
+
+def run_job(job):
+    """Run a claimed job and record the outcome; returns True if it succeeded"""
+    from . import tasks  # noqa: F401  registers the tasks
+    try:
+        func = TASKS.get(job.task)
+        if func is None:
+            raise LookupError(f'Unknown task "{job.task}".')
+        func(**job.kwargs)
+    except Exception:
+        fail_job(job, traceback.format_exc())
+        return False
+    Job.objects.filter(pk=job.pk).update(status='done', finished_at=timezone.now(), last_error='')
+    return True
+
+
+def fail_job(job, error):
+    """Requeue a failed attempt with backoff, or give up after max_attempts"""
+    retry = job.attempts < job.max_attempts
+    if retry:
+        update = {'status': 'queued', 'run_at': timezone.now() + retry_delay(job.attempts)}
+    else:
+        update = {'status': 'failed', 'finished_at': timezone.now()}
+    Job.objects.filter(pk=job.pk).update(last_error=error, locked_by='', locked_at=None, **update)
+    if not retry:
+        give_up(job, error)
+
+
+def requeue_stale(timeout=JOB_TIMEOUT):
+    """Release jobs left running by a worker that died; returns how many"""
+    stale = Job.objects.filter(status='running', locked_at__lt=timezone.now() - timeout)
+    error = 'The worker stopped before finishing the job.'
+    exhausted = list(stale.filter(attempts__gte=F('max_attempts')))
+    failed = Job.objects.filter(pk__in=[job.pk for job in exhausted], status='running').update(
+        status='failed', finished_at=timezone.now(), last_error=error, locked_by='', locked_at=None,
+    )
+    for job in exhausted:
+        give_up(job, error)
+    requeued = stale.update(status='queued', last_error=error, locked_by='', locked_at=None)
+    return failed + requeued
+
+
+def purge_jobs(before):
+    """Delete jobs that finished successfully before a datetime"""
+    deleted, _ = Job.objects.filter(status='done', finished_at__lt=before).delete()
+    return deleted
+
+
+def retry_jobs(jobs):
+    """Queue failed jobs again, with a fresh set of attempts"""
+    return jobs.filter(status='failed').update(
+        status='queued', run_at=timezone.now(), attempts=0, finished_at=None,
+    )
+
+
+def queue_stats():
+    """Job counts per status, due jobs waiting and the oldest due job's run_at"""
+    counts = dict(Job.objects.order_by().values_list('status').annotate(n=Count('pk')))
+    due = due_jobs().order_by().aggregate(count=Count('pk'), oldest=Min('run_at'))
+    return {
+        'counts': {status: counts.get(status, 0) for status, label in Job.STATUS_CHOICES},
+        'due': due['count'],
+        'oldest_due': due['oldest'],
+    }
@@ -0,0 +1,49 @@
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.archive import ARCHIVE_BATCH_SIZE, archivable_invoices, archive_cutoff, archive_invoices, restore_invoice
+from invoices.models import ArchivedInvoice
+
+
+class Command(BaseCommand):
+    help = (
+        'Move fully paid and cancelled invoices from closed fiscal years, with their '
+        'items, payments and payment info, out of the hot tables into the archive.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--keep-years', type=int, default=1,
+            help='Closed fiscal years to keep in the hot tables besides the current one',
+        )
+        parser.add_argument(
+            '--before', type=date.fromisoformat,
+            help='Archive invoices dated before this day (YYYY-MM-DD) instead of using --keep-years',
+        )
+        parser.add_argument('--batch-size', type=int, default=ARCHIVE_BATCH_SIZE)
+        parser.add_argument('--dry-run', action='store_true', help='Only count the invoices that would be archived')
+        parser.add_argument('--restore', metavar='INVOICE_NUMBER', help='Move one archived invoice back')
+
+    def handle(self, *args, **options):
+        if options['restore']:
+            archived = ArchivedInvoice.objects.filter(invoice_number=options['restore']).first()
+            if archived is None:
+                raise CommandError(f'No archived invoice "{options["restore"]}".')
+            restore_invoice(archived)
+            self.stdout.write(self.style.SUCCESS(f'Restored {options["restore"]}.'))
+            return
+
+        before = options['before'] or archive_cutoff(keep_years=options['keep_years'])
+        if before > archive_cutoff(keep_years=0):
+            raise CommandError(f'{before} is inside the current fiscal year.')
+
+        if options['dry_run']:
+            count = archivable_invoices(before).count()
+            self.stdout.write(f'{count} invoices dated before {before} would be archived.')
+            return
+
+        archived = 0
+        for archived in archive_invoices(before, batch_size=options['batch_size']):
+            self.stdout.write(f'Archived {archived} invoices...')
+        self.stdout.write(self.style.SUCCESS(f'Archived {archived} invoices dated before {before}.'))
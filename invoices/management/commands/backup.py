@@ -0,0 +1,41 @@
+from pathlib import Path
+
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.backup import BACKUP_PAGES, BackupError, backup_root, create_snapshot, prune_snapshots, verify_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        'Take an online snapshot of the database and media without blocking the '
+        'running application. Media is copied incrementally by content hash.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', type=Path, help='Backup directory (default: BACKUP_ROOT)')
+        parser.add_argument('--database', default='default', help='Database alias to back up')
+        parser.add_argument('--no-media', action='store_true', help='Only back up the database')
+        parser.add_argument('--pages', type=int, default=BACKUP_PAGES, help='SQLite pages copied per step')
+        parser.add_argument('--keep', type=int, default=0, help='Keep only the newest N snapshots (0 keeps all)')
+
+    def handle(self, *args, **options):
+        root = options['output'] or backup_root()
+        try:
+            snapshot = create_snapshot(
+                root, alias=options['database'], include_media=not options['no_media'], pages=options['pages'],
+            )
+            manifest = verify_snapshot(snapshot, root)
+        except BackupError as exc:
+            raise CommandError(str(exc))
+
+        database = manifest['database']
+        self.stdout.write(
+            f'Database: {database["file"]} ({database["size"]} bytes), '
+            f'media: {len(manifest["media"])} files, {manifest["media_copied"]} new, '
+            f'{manifest["seconds"]}s'
+        )
+        if options['keep']:
+            removed = prune_snapshots(options['keep'], root)
+            if removed:
+                self.stdout.write(f'Removed {removed} old snapshots.')
+        self.stdout.write(self.style.SUCCESS(f'Backup written to {snapshot}'))
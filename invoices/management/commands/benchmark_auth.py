@@ -0,0 +1,77 @@
+import time
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+PROFILES = [
+    ('database sessions, uncached user', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.db',
+        'AUTHENTICATION_BACKENDS': ['django.contrib.auth.backends.ModelBackend'],
+    }),
+    ('cached_db sessions, cached user', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.cached_db',
+        'AUTHENTICATION_BACKENDS': ['invoices.auth.CachedModelBackend'],
+    }),
+    ('signed cookie sessions, cached user', {
+        'SESSION_ENGINE': 'django.contrib.sessions.backends.signed_cookies',
+        'AUTHENTICATION_BACKENDS': ['invoices.auth.CachedModelBackend'],
+    }),
+]
+
+AUTH_TABLES = ('"django_session"', '"auth_user"')
+
+
+class Command(BaseCommand):
+    help = (
+        'Request pages as a logged-in user under each session/auth configuration and '
+        'report the queries per request, separating session and user lookups.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--username', help='User to log in as (default: the first superuser)')
+        parser.add_argument('--requests', type=int, default=50, help='Requests per page and profile')
+        parser.add_argument('--path', action='append', dest='paths', help='Page to request (repeatable)')
+
+    def handle(self, *args, **options):
+        if options['username']:
+            user = User.objects.filter(username=options['username']).first()
+        else:
+            user = User.objects.filter(is_superuser=True).order_by('pk').first()
+        if user is None:
+            raise CommandError('No user to log in as; pass --username.')
+        paths = options['paths'] or ['/', '/invoices/', '/clients/']
+
+        # The test client sends requests for the "testserver" host
+        with override_settings(ALLOWED_HOSTS=[*settings.ALLOWED_HOSTS, 'testserver']):
+            for label, overrides in PROFILES:
+                with override_settings(**overrides):
+                    self.stdout.write(self.style.MIGRATE_HEADING(label))
+                    for path in paths:
+                        self.run_profile(user, path, options['requests'])
+
+    def run_profile(self, user, path, count):
+        client = Client()
+        client.force_login(user)
+        response = client.get(path)  # warm caches
+        if response.status_code != 200:
+            raise CommandError(f'{path} returned {response.status_code}')
+
+        queries = auth_queries = 0
+        started = time.perf_counter()
+        for _ in range(count):
+            with CaptureQueriesContext(connection) as captured:
+                client.get(path)
+            queries += len(captured)
+            auth_queries += sum(
+                1 for query in captured.captured_queries
+                if any(table in query['sql'] for table in AUTH_TABLES)
+            )
+        elapsed = (time.perf_counter() - started) / count * 1000
+        self.stdout.write(
+            f'  {path:<20} {queries / count:5.1f} queries/request '
+            f'({auth_queries / count:.1f} session/user), {elapsed:6.1f} ms'
+        )
@@ -0,0 +1,80 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.test import AsyncRequestFactory, RequestFactory
+
+from invoices import async_views, views
+from invoices.models import Invoice
+
+
+class Command(BaseCommand):
+    help = (
+        'Compare PDF throughput under concurrent load: the sync invoice_pdf view on a '
+        'thread pool (as under gunicorn threads) against the async view rendering '
+        'in the process pool (as under uvicorn).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoice', type=int, help='Invoice to render (default: the newest)')
+        parser.add_argument('--requests', type=int, default=24)
+        parser.add_argument('--concurrency', type=int, default=8)
+
+    def handle(self, *args, **options):
+        invoice = Invoice.objects.filter(pk=options['invoice']).first() if options['invoice'] else (
+            Invoice.objects.order_by('-pk').first()
+        )
+        user = User.objects.filter(is_superuser=True).order_by('pk').first()
+        if invoice is None or user is None:
+            raise CommandError('Needs at least one invoice and one superuser.')
+        count, concurrency = options['requests'], options['concurrency']
+
+        sync_seconds = self.run_sync(user, invoice.pk, count, concurrency)
+        async_seconds = asyncio.run(self.run_async(user, invoice.pk, count, concurrency))
+
+        for label, seconds in (('sync, threads', sync_seconds), ('async, process pool', async_seconds)):
+            self.stdout.write(
+                f'{label:<22} {count / seconds:6.1f} PDFs/s  '
+                f'({seconds:.2f}s for {count} requests, {concurrency} concurrent)'
+            )
+        self.stdout.write(self.style.SUCCESS(f'Speed-up: {sync_seconds / async_seconds:.1f}x'))
+
+    def run_sync(self, user, pk, count, concurrency):
+        factory = RequestFactory()
+
+        def fetch(_):
+            request = factory.get(f'/invoices/{pk}/pdf/')
+            request.user = user
+            response = views.invoice_pdf(request, pk=pk)
+            if response.status_code != 200:
+                raise CommandError(f'Sync view returned {response.status_code}')
+
+        fetch(None)  # warm-up
+        started = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as pool:
+            list(pool.map(fetch, range(count)))
+        return time.perf_counter() - started
+
+    async def run_async(self, user, pk, count, concurrency):
+        factory = AsyncRequestFactory()
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def auser():
+            return user
+
+        async def fetch():
+            async with semaphore:
+                request = factory.get(f'/invoices/{pk}/pdf/')
+                request.user = user
+                request.auser = auser
+                response = await async_views.invoice_pdf(request, pk=pk)
+                if response.status_code != 200:
+                    raise CommandError(f'Async view returned {response.status_code}')
+
+        # Start every pool process before timing
+        await asyncio.gather(*(fetch() for _ in range(concurrency)))
+        started = time.perf_counter()
+        await asyncio.gather(*(fetch() for _ in range(count)))
+        return time.perf_counter() - started
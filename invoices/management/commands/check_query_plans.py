@@ -0,0 +1,141 @@
+import re
+from contextlib import contextmanager
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from invoices.models import Client, Company, Invoice, InvoiceItem, Payment
+
+
+def hot_queries():
+    """The filter/sort queries behind the busiest views, by name"""
+    today = date.today()
+    invoice = Invoice.objects.order_by('pk').first()
+    prefix = f'INV-{today:%Y%m}'
+    return [
+        ('invoice_list', Invoice.objects.select_related('client', 'company')[:50]),
+        ('dashboard_recent', Invoice.objects.select_related('client').order_by('-created_at')[:10]),
+        ('overdue_invoices', Invoice.objects.filter(
+            status__in=['draft', 'sent'], due_date__lt=today,
+        ).values('pk')),
+        ('next_invoice_number', Invoice.objects.filter(
+            invoice_number__gte=f'{prefix}-', invoice_number__lt=f'{prefix}.',
+        ).order_by('-invoice_number')[:1]),
+        ('invoice_items', InvoiceItem.objects.filter(invoice=invoice)),
+        ('invoice_payments', Payment.objects.filter(invoice=invoice)),
+        # AnalyticsCache._load_changes, which clears the default ordering
+        ('changed_invoices', Invoice.objects.order_by().filter(
+            updated_at__gte=invoice.updated_at,
+        ).values_list('pk', flat=True)),
+        ('changed_payments', Payment.objects.order_by().filter(
+            updated_at__gte=invoice.updated_at,
+        ).values_list('invoice_id', flat=True)),
+    ]
+
+
+class Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Seed a large dataset into a throwaway test database, capture the query '
+        'plan of each hot query and fail if any of them scans a table or sorts '
+        'with a temporary B-tree.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--invoices', type=int, default=20000, help='Number of invoices to seed')
+        parser.add_argument('--verbose-plans', action='store_true', help='Print every plan, not only failures')
+        parser.add_argument(
+            '--current-database', action='store_true',
+            help='Seed the configured database inside a rolled-back transaction instead of a test '
+                 'database; only for databases nothing else is using, e.g. under the test runner',
+        )
+
+    @contextmanager
+    def scratch_database(self, current):
+        """Point the default connection at a freshly migrated test database for the block"""
+        if current:
+            yield
+            return
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+        try:
+            yield
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    def handle(self, *args, **options):
+        with self.scratch_database(options['current_database']):
+            failures = self.check_plans(options)
+
+        if failures:
+            raise CommandError(f'{len(failures)} hot queries regressed: {", ".join(failures)}')
+        self.stdout.write(self.style.SUCCESS('All hot queries use indexes.'))
+
+    def check_plans(self, options):
+        """Seed, explain every hot query and roll back; returns the names of those that regressed"""
+        failures = []
+        try:
+            with transaction.atomic():
+                self.seed(options['invoices'])
+                with connection.cursor() as cursor:
+                    cursor.execute('ANALYZE')
+                for name, queryset in hot_queries():
+                    plan = queryset.explain()
+                    problems = self.find_problems(plan)
+                    if problems:
+                        failures.append(name)
+                    if problems or options['verbose_plans']:
+                        self.stdout.write(f'--- {name}')
+                        self.stdout.write(plan)
+                    status = self.style.ERROR('FAIL: ' + '; '.join(problems)) if problems else self.style.SUCCESS('ok')
+                    self.stdout.write(f'{name}: {status}')
+                raise Rollback
+        except Rollback:
+            pass
+        return failures
+
+    def find_problems(self, plan):
+        """Plan lines that indicate a full scan or an unindexed sort"""
+        if connection.vendor == 'postgresql':
+            return re.findall(r'Seq Scan on \w+', plan)
+        problems = re.findall(r'SCAN (\w+)(?! USING)(?=\s|$)', plan)
+        problems = [f'SCAN {table}' for table in problems]
+        problems += re.findall(r'USE TEMP B-TREE FOR [A-Z ]+', plan)
+        return problems
+
+    def seed(self, count):
+        """Bulk insert a realistic spread of invoices, items and payments"""
+        companies = Company.objects.bulk_create([
+            Company(name=f'Company {n}', address='-') for n in range(5)
+        ])
+        clients = Client.objects.bulk_create([
+            Client(name=f'Client {n}', billing_address='-') for n in range(max(count // 20, 1))
+        ])
+        start = date.today() - timedelta(days=3 * 365)
+        statuses = ['draft', 'sent', 'paid', 'paid', 'cancelled']
+        invoices = Invoice.objects.bulk_create([
+            Invoice(
+                invoice_number=f'SEED-{n:08d}',
+                company=companies[n % len(companies)],
+                client=clients[n % len(clients)],
+                invoice_date=start + timedelta(days=n % 1095),
+                due_date=start + timedelta(days=n % 1095 + 30),
+                status=statuses[n % len(statuses)],
+                total=Decimal('1180.00'),
+            )
+            for n in range(count)
+        ], batch_size=1000)
+        InvoiceItem.objects.bulk_create([
+            InvoiceItem(invoice=invoice, description='Seed item', quantity=1, rate=1000,
+                        tax_rate=18, amount=Decimal('1180.00'), order=line)
+            for invoice in invoices for line in range(3)
+        ], batch_size=1000)
+        Payment.objects.bulk_create([
+            Payment(invoice=invoice, amount=Decimal('590.00'), paid_on=invoice.invoice_date)
+            for invoice in invoices[::2]
+        ], batch_size=1000)
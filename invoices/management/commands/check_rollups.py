@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.rollups import check_rollups, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Verify the revenue rollup tables against the invoice and payment tables'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--fix', action='store_true', help='Rebuild the rollups if they are inconsistent')
+        parser.add_argument('--limit', type=int, default=20, help='Number of mismatches to print')
+
+    def handle(self, *args, **options):
+        mismatches = check_rollups()
+        if not mismatches:
+            self.stdout.write(self.style.SUCCESS('Rollups are consistent.'))
+            return
+
+        for (period, bucket, company_id, client_id, currency), stored, expected in mismatches[:options['limit']]:
+            self.stdout.write(
+                f'{period} {bucket} company={company_id} client={client_id} {currency}: '
+                f'stored={stored} expected={expected}'
+            )
+
+        if options['fix']:
+            count = rebuild_rollups()
+            self.stdout.write(self.style.WARNING(
+                f'{len(mismatches)} mismatched buckets; rebuilt {count} rollup rows.'
+            ))
+            return
+        raise CommandError(f'{len(mismatches)} rollup buckets are inconsistent. Run with --fix to rebuild.')
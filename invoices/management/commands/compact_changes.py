@@ -0,0 +1,17 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from invoices.changes import compact_changes
+
+
+class Command(BaseCommand):
+    help = 'Delete change log entries superseded by a later change to the same row'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=1, help='Only compact entries older than this')
+
+    def handle(self, *args, **options):
+        count = compact_changes(before=timezone.now() - timedelta(days=options['days']))
+        self.stdout.write(self.style.SUCCESS(f'Deleted {count} superseded change log entries.'))
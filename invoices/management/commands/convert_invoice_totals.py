@@ -0,0 +1,39 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.exchange_rates import CONVERT_BATCH_SIZE, convert_invoices
+from invoices.models import Invoice, ExchangeRate
+from invoices.stats import invalidate_dashboard_summary
+
+
+class Command(BaseCommand):
+    help = (
+        'Recompute the rupee total and amount paid stored on each invoice from the '
+        'exchange rates. Run after loading or correcting rates; safe to rerun.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--currency', choices=[code for code, label in Invoice.CURRENCY_CHOICES],
+            help='Only invoices in this currency',
+        )
+        parser.add_argument('--batch-size', type=int, default=CONVERT_BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        if options['batch_size'] < 1:
+            raise CommandError('--batch-size must be positive.')
+
+        checked = updated = 0
+        for checked, updated in convert_invoices(options['currency'], batch_size=options['batch_size']):
+            self.stdout.write(f'Checked {checked} invoices...')
+        invalidate_dashboard_summary()
+        self.stdout.write(self.style.SUCCESS(f'Checked {checked} invoices, updated {updated}.'))
+
+        missing = (
+            Invoice.objects.filter(total_base__isnull=True).order_by()
+            .values_list('currency').distinct()
+        )
+        for (currency,) in missing:
+            first = ExchangeRate.objects.filter(currency=currency).order_by('date').first()
+            hint = f'the first {currency} rate is for {first.date}' if first else f'there are no {currency} rates'
+            count = Invoice.objects.filter(total_base__isnull=True, currency=currency).count()
+            self.stderr.write(f'{count} {currency} invoices have no rate: {hint}.')
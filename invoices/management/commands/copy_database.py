@@ -0,0 +1,103 @@
+from django.apps import apps
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connections, transaction
+
+
+class Command(BaseCommand):
+    help = (
+        'Copy every table from one database alias to another in batches, '
+        'e.g. from the legacy SQLite file (SQLITE_SOURCE_PATH) into PostgreSQL.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--source', default='legacy', help='Database alias to read from')
+        parser.add_argument('--target', default='default', help='Database alias to write to (must be migrated)')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--no-flush', action='store_true', help='Do not empty the target tables first')
+
+    def handle(self, *args, **options):
+        source, target = options['source'], options['target']
+        batch_size = options['batch_size']
+        for alias in (source, target):
+            if alias not in connections.settings:
+                raise CommandError(
+                    f'Unknown database alias "{alias}". Set SQLITE_SOURCE_PATH to configure "legacy".'
+                )
+        if source == target:
+            raise CommandError('Source and target must be different databases.')
+
+        if not options['no_flush']:
+            # Drops the content types and permissions created by migrate so
+            # that the source's primary keys can be copied unchanged.
+            call_command('flush', database=target, interactive=False, inhibit_post_migrate=True)
+
+        copied_models = []
+        for model in self.get_models():
+            total = self.copy_model(model, source, target, batch_size)
+            copied_models.append(model)
+            self.stdout.write(f'{model._meta.label}: {total} rows')
+
+        self.reset_sequences(target, copied_models)
+        self.verify_counts(source, target, copied_models)
+        self.stdout.write(self.style.SUCCESS(f'Copied {len(copied_models)} tables from "{source}" to "{target}".'))
+
+    def get_models(self):
+        """Concrete models ordered so that foreign key targets come first"""
+        pending = []
+        for model in apps.get_models():
+            if model._meta.managed and not model._meta.proxy:
+                pending.append(model)
+                for field in model._meta.local_many_to_many:
+                    if field.remote_field.through._meta.auto_created:
+                        pending.append(field.remote_field.through)
+
+        ordered = []
+        while pending:
+            for model in pending:
+                dependencies = {
+                    field.related_model._meta.concrete_model
+                    for field in model._meta.concrete_fields
+                    if field.is_relation and field.related_model is not model
+                }
+                if not dependencies.intersection(pending):
+                    break
+            else:
+                raise CommandError(f'Circular foreign keys between {", ".join(m._meta.label for m in pending)}')
+            pending.remove(model)
+            ordered.append(model)
+        return ordered
+
+    def copy_model(self, model, source, target, batch_size):
+        """Copy one table using keyset pagination on the primary key"""
+        manager = model._base_manager
+        queryset = manager.using(source).order_by('pk')
+        last_pk = None
+        total = 0
+        while True:
+            batch_queryset = queryset if last_pk is None else queryset.filter(pk__gt=last_pk)
+            batch = list(batch_queryset[:batch_size])
+            if not batch:
+                return total
+            with transaction.atomic(using=target):
+                manager.using(target).bulk_create(batch, batch_size=batch_size)
+            last_pk = batch[-1].pk
+            total += len(batch)
+
+    def reset_sequences(self, target, models):
+        """Move auto-increment sequences past the copied primary keys"""
+        connection = connections[target]
+        statements = connection.ops.sequence_reset_sql(no_style(), models)
+        if statements:
+            with connection.cursor() as cursor:
+                for sql in statements:
+                    cursor.execute(sql)
+
+    def verify_counts(self, source, target, models):
+        mismatched = [
+            model._meta.label for model in models
+            if model._base_manager.using(source).count() != model._base_manager.using(target).count()
+        ]
+        if mismatched:
+            raise CommandError(f'Row counts differ after copying: {", ".join(mismatched)}')
@@ -0,0 +1,46 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.dedupe import MIN_SCORE, find_duplicates, merge_clients
+from invoices.models import Client
+
+
+class Command(BaseCommand):
+    help = (
+        'List likely duplicate clients, the most likely first, or merge duplicates '
+        'into one client with --merge KEEP_ID DUPLICATE_ID [DUPLICATE_ID ...].'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--min-score', type=float, default=MIN_SCORE, help='Lowest score listed (0-1)')
+        parser.add_argument('--limit', type=int, default=100, help='Pairs listed (0 for all)')
+        parser.add_argument('--merge', type=int, nargs='+', metavar='ID', help='Client to keep, then its duplicates')
+
+    def handle(self, *args, **options):
+        if options['merge']:
+            self.merge(*options['merge'])
+            return
+
+        candidates = find_duplicates(options['min_score'], options['limit'] or None)
+        for candidate in candidates:
+            self.stdout.write(
+                f'{candidate.score:.2f}  #{candidate.first["pk"]} {candidate.first["name"]} '
+                f'({candidate.first["invoice_count"]} invoices)  ~  '
+                f'#{candidate.second["pk"]} {candidate.second["name"]} '
+                f'({candidate.second["invoice_count"]} invoices)  [{", ".join(candidate.reasons)}]'
+            )
+        self.stdout.write(f'{len(candidates)} candidate pairs.')
+
+    def merge(self, keep_id, *duplicate_ids):
+        if not duplicate_ids:
+            raise CommandError('Give the client to keep and at least one duplicate.')
+        clients = Client.objects.in_bulk([keep_id, *duplicate_ids])
+        missing = [pk for pk in (keep_id, *duplicate_ids) if pk not in clients]
+        if missing:
+            raise CommandError(f'No client with id {", ".join(map(str, missing))}.')
+        if keep_id in duplicate_ids:
+            raise CommandError('The client to keep cannot also be a duplicate.')
+        target = clients[keep_id]
+        moved = merge_clients(target, [clients[pk] for pk in duplicate_ids])
+        self.stdout.write(self.style.SUCCESS(
+            f'Merged {len(duplicate_ids)} clients into "{target.name}", moving {moved} invoices.'
+        ))
@@ -0,0 +1,44 @@
+from datetime import date
+
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.recurring import billing_dates, due_schedules, generate_due_invoices
+
+
+class Command(BaseCommand):
+    help = (
+        'Create the invoices due from every active recurring schedule, including any '
+        'dates missed since the last run. Safe to rerun: no date is billed twice.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--date', type=date.fromisoformat,
+            help='Generate the invoices due by this day (YYYY-MM-DD) instead of today',
+        )
+        parser.add_argument('--dry-run', action='store_true', help='Only list the invoices that are due')
+        parser.add_argument('--user', help='Username recorded as the creator of the invoices')
+
+    def handle(self, *args, **options):
+        today = options['date'] or date.today()
+        user = None
+        if options['user']:
+            user = User.objects.filter(username=options['user']).first()
+            if user is None:
+                raise CommandError(f'No user "{options["user"]}".')
+
+        if options['dry_run']:
+            total = 0
+            for schedule in due_schedules(today):
+                dates, next_run = billing_dates(schedule, today)
+                total += len(dates)
+                days = ', '.join(f'{day:%Y-%m-%d}' for day in dates)
+                self.stdout.write(f'{schedule.name} ({schedule.client.name}): {days}')
+            self.stdout.write(f'{total} invoices are due by {today}.')
+            return
+
+        invoices = generate_due_invoices(today, user)
+        for invoice in invoices:
+            self.stdout.write(f'{invoice.invoice_number} {invoice.client.name} {invoice.invoice_date} {invoice.total}')
+        self.stdout.write(self.style.SUCCESS(f'Created {len(invoices)} invoices due by {today}.'))
@@ -0,0 +1,74 @@
+import csv
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.imports import CHUNK_SIZE, IMPORTERS, ImportFileError, get_checkpoint, run_import
+
+
+class Command(BaseCommand):
+    help = (
+        'Import clients or historical invoices from a CSV file in chunks. An '
+        'interrupted import resumes after the last committed chunk when run again.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=sorted(IMPORTERS))
+        parser.add_argument('path')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE, help='Rows per transaction')
+        parser.add_argument(
+            '--errors', metavar='PATH',
+            help='Append rejected rows (line, record, messages) to this CSV file',
+        )
+        parser.add_argument('--restart', action='store_true', help='Start over instead of resuming')
+        parser.add_argument('--user', help='Username recorded as creator (default: the first superuser)')
+
+    def get_user(self, username):
+        User = get_user_model()
+        if username:
+            user = User.objects.filter(username=username).first()
+            if user is None:
+                raise CommandError(f'No user "{username}".')
+            return user
+        return User.objects.filter(is_superuser=True).order_by('pk').first()
+
+    def handle(self, *args, **options):
+        kind, path = options['kind'], options['path']
+        if options['chunk_size'] < 1:
+            raise CommandError('--chunk-size must be positive.')
+        user = self.get_user(options['user'])
+        try:
+            checkpoint = get_checkpoint(kind, path, restart=options['restart'])
+        except OSError as e:
+            raise CommandError(str(e))
+
+        if checkpoint.finished:
+            self.stdout.write(
+                f'{path} was already imported ({checkpoint.created} created, '
+                f'{checkpoint.skipped} skipped, {checkpoint.failed} failed). Use --restart to import it again.'
+            )
+            return
+        if checkpoint.rows_done:
+            self.stdout.write(f'Resuming after row {checkpoint.rows_done}.')
+
+        error_file = open(options['errors'], 'a', newline='', encoding='utf-8') if options['errors'] else None
+        try:
+            writer = csv.writer(error_file) if error_file else None
+            for checkpoint, errors in run_import(checkpoint, path, options['chunk_size'], user):
+                if writer:
+                    writer.writerows((error.line, error.record, '; '.join(error.messages)) for error in errors)
+                self.stdout.write(
+                    f'{checkpoint.rows_done} rows: {checkpoint.created} created, '
+                    f'{checkpoint.skipped} skipped, {checkpoint.failed} failed'
+                )
+        except ImportFileError as e:
+            raise CommandError(str(e))
+        finally:
+            if error_file:
+                error_file.close()
+
+        message = (
+            f'Imported {path}: {checkpoint.created} created, '
+            f'{checkpoint.skipped} skipped, {checkpoint.failed} failed.'
+        )
+        self.stdout.write(self.style.SUCCESS(message) if not checkpoint.failed else self.style.WARNING(message))
@@ -0,0 +1,92 @@
+import json
+import os
+import re
+import subprocess
+import sys
+from collections import defaultdict
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# What a management command pays, and what a warmed-up web worker pays
+SCENARIOS = [
+    ('command', 'import django; django.setup()'),
+    ('worker', (
+        'import invoice.wsgi; from invoices.warmup import warm_up; import json, sys; '
+        'sys.stdout.write(json.dumps(warm_up()))'
+    )),
+]
+
+# Libraries that should only be loaded by web workers
+HEAVY_PACKAGES = ('xhtml2pdf', 'reportlab', 'qrcode', 'PIL', 'num2words', 'numpy')
+
+IMPORT_LINE = re.compile(r'^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)')
+
+
+def parse_importtime(stderr):
+    """Self time in microseconds per top-level package from -X importtime output"""
+    packages = defaultdict(int)
+    total = 0
+    for line in stderr.splitlines():
+        match = IMPORT_LINE.match(line)
+        if not match:
+            continue
+        self_us, cumulative_us, indent, module = match.groups()
+        packages[module.split('.')[0]] += int(self_us)
+        if len(indent) == 1:
+            total += int(cumulative_us)
+    return total, dict(packages)
+
+
+class Command(BaseCommand):
+    help = (
+        'Measure import time at startup with python -X importtime, for a management '
+        'command and for a warmed-up web worker, and flag heavy libraries loaded '
+        'where they should not be.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--top', type=int, default=15, help='Packages to list per scenario')
+        parser.add_argument('--json', action='store_true', help='Print machine-readable results')
+
+    def handle(self, *args, **options):
+        env = dict(os.environ, DJANGO_SETTINGS_MODULE=os.environ.get('DJANGO_SETTINGS_MODULE', 'invoice.settings'))
+        results = {}
+        for name, code in SCENARIOS:
+            process = subprocess.run(
+                [sys.executable, '-X', 'importtime', '-c', code],
+                cwd=settings.BASE_DIR, env=env, capture_output=True, text=True,
+            )
+            if process.returncode:
+                raise CommandError(f'{name} scenario failed:\n{process.stderr[-2000:]}')
+            total, packages = parse_importtime(process.stderr)
+            results[name] = {
+                'total_ms': round(total / 1000, 1),
+                'packages_ms': {
+                    package: round(us / 1000, 1)
+                    for package, us in sorted(packages.items(), key=lambda item: -item[1])
+                },
+                'heavy': [package for package in HEAVY_PACKAGES if package in packages],
+            }
+            if process.stdout.strip():
+                results[name]['warm_up_ms'] = {
+                    step: None if seconds is None else round(seconds * 1000, 1)
+                    for step, seconds in json.loads(process.stdout).items()
+                }
+
+        if options['json']:
+            self.stdout.write(json.dumps(results, indent=2))
+            return
+
+        for name, result in results.items():
+            self.stdout.write(self.style.MIGRATE_HEADING(f'{name}: {result["total_ms"]} ms of imports'))
+            for package, ms in list(result['packages_ms'].items())[:options['top']]:
+                self.stdout.write(f'  {package:<24} {ms:8.1f} ms')
+            if 'warm_up_ms' in result:
+                steps = ', '.join(f'{step} {ms} ms' for step, ms in result['warm_up_ms'].items())
+                self.stdout.write(f'  warm-up: {steps}')
+
+        if results['command']['heavy']:
+            self.stdout.write(self.style.WARNING(
+                f'Management commands import {", ".join(results["command"]["heavy"])}; keep these imports lazy.'
+            ))
@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.exchange_rates import RateFileError, convert_invoices, load_rates
+from invoices.stats import invalidate_dashboard_summary
+
+
+class Command(BaseCommand):
+    help = (
+        'Load exchange rates (rupees per unit) from a CSV file with currency, date and '
+        'rate columns. A rate applies from its date until the next one for its currency.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('path')
+        parser.add_argument(
+            '--convert', action='store_true',
+            help='Then recompute the rupee amounts of existing invoices (see convert_invoice_totals)',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            count = load_rates(options['path'])
+        except (RateFileError, OSError) as e:
+            raise CommandError(str(e))
+        self.stdout.write(self.style.SUCCESS(f'Loaded {count} exchange rates.'))
+
+        if options['convert']:
+            checked = updated = 0
+            for checked, updated in convert_invoices():
+                pass
+            invalidate_dashboard_summary()
+            self.stdout.write(f'Checked {checked} invoices, updated {updated}.')
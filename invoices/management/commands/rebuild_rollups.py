@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from invoices.rollups import rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = 'Recompute the revenue and collections rollup tables from scratch'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        count = rebuild_rollups(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt {count} rollup rows.'))
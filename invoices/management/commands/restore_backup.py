@@ -0,0 +1,60 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from invoices.backup import (
+    BackupError, backup_root, list_snapshots, reset_caches, restore_database, restore_media, snapshots_dir,
+    verify_snapshot,
+)
+
+
+class Command(BaseCommand):
+    help = 'Verify a backup snapshot and restore the database and media from it.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('snapshot', nargs='?', help='Snapshot name or path (default: the newest)')
+        parser.add_argument('--input', type=Path, help='Backup directory (default: BACKUP_ROOT)')
+        parser.add_argument('--database', default='default', help='Database alias to restore into')
+        parser.add_argument('--verify-only', action='store_true', help='Check the snapshot without restoring')
+        parser.add_argument('--no-media', action='store_true', help='Only restore the database')
+        parser.add_argument('--noinput', '--no-input', action='store_false', dest='interactive')
+
+    def handle(self, *args, **options):
+        root = options['input'] or backup_root()
+        snapshot = self.find_snapshot(root, options['snapshot'])
+        try:
+            manifest = verify_snapshot(snapshot, root)
+        except BackupError as exc:
+            raise CommandError(str(exc))
+        self.stdout.write(f'{snapshot.name}: verified ({len(manifest["media"])} media files).')
+        if options['verify_only']:
+            return
+
+        if options['interactive']:
+            answer = input(f'This replaces all data in the "{options["database"]}" database. Type "yes" to continue: ')
+            if answer != 'yes':
+                raise CommandError('Restore cancelled.')
+
+        try:
+            restore_database(snapshot, manifest['database'], options['database'])
+        except BackupError as exc:
+            raise CommandError(str(exc))
+        reset_caches()
+        if not options['no_media']:
+            written = restore_media(manifest['media'], settings.MEDIA_ROOT, root)
+            self.stdout.write(f'Restored {written} media files.')
+        self.stdout.write(self.style.SUCCESS(f'Restored {snapshot.name}.'))
+
+    def find_snapshot(self, root, name):
+        if name is None:
+            snapshots = list_snapshots(root)
+            if not snapshots:
+                raise CommandError(f'No snapshots in {snapshots_dir(root)}.')
+            return snapshots[-1]
+        path = Path(name)
+        if not path.is_dir():
+            path = snapshots_dir(root) / name
+        if not path.is_dir():
+            raise CommandError(f'Snapshot "{name}" not found.')
+        return path
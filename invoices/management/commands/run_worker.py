@@ -0,0 +1,105 @@
+import multiprocessing
+import os
+import signal
+import socket
+import threading
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections, connections
+from django.utils import timezone
+
+from invoices.jobs import claim_job, purge_jobs, requeue_stale, run_job
+
+# Seconds between checks for stale jobs and purges of old finished jobs
+MAINTENANCE_INTERVAL = 300
+
+
+class Command(BaseCommand):
+    help = (
+        'Run background jobs from the database queue. With --processes N, N worker '
+        'processes claim jobs concurrently. SIGTERM or Ctrl+C lets running jobs finish.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--processes', type=int, default=1, help='Worker processes (default 1)')
+        parser.add_argument('--poll', type=float, default=1.0, help='Seconds to wait when the queue is empty')
+        parser.add_argument('--burst', action='store_true', help='Exit once no job is due')
+        parser.add_argument(
+            '--keep-days', type=int, default=7,
+            help='Delete successful jobs after this many days (0 keeps them)',
+        )
+
+    def handle(self, *args, **options):
+        if options['processes'] < 1:
+            raise CommandError('--processes must be at least 1.')
+        self.options = options
+        if options['processes'] == 1:
+            self.work(f'{socket.gethostname()}:{os.getpid()}')
+            return
+
+        # Forked children must not share the parent's database connections
+        connections.close_all()
+        context = multiprocessing.get_context('fork')
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+
+        workers = {}
+        while not stopping.is_set():
+            for slot in range(options['processes']):
+                process = workers.get(slot)
+                if process is not None and process.is_alive():
+                    continue
+                if process is not None:
+                    if options['burst'] and process.exitcode == 0:
+                        continue
+                    self.stderr.write(f'Worker {process.pid} exited with {process.exitcode}, restarting.')
+                workers[slot] = context.Process(target=self.work_in_child, args=(slot,), daemon=True)
+                workers[slot].start()
+            if options['burst'] and not any(process.is_alive() for process in workers.values()):
+                return
+            stopping.wait(1)
+
+        for process in workers.values():
+            if process.is_alive():
+                process.terminate()
+        for process in workers.values():
+            process.join()
+
+    def work_in_child(self, slot):
+        self.work(f'{socket.gethostname()}:{os.getpid()}')
+
+    def work(self, worker_id):
+        stopping = threading.Event()
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stopping.set())
+        self.stdout.write(f'Worker {worker_id} started.')
+
+        last_maintenance = None
+        while not stopping.is_set():
+            if last_maintenance is None or time.monotonic() - last_maintenance > MAINTENANCE_INTERVAL:
+                self.maintain()
+                last_maintenance = time.monotonic()
+
+            close_old_connections()
+            job = claim_job(worker_id)
+            if job is None:
+                if self.options['burst']:
+                    break
+                stopping.wait(self.options['poll'])
+                continue
+
+            started = time.monotonic()
+            ok = run_job(job)
+            outcome = 'done' if ok else f'failed (attempt {job.attempts} of {job.max_attempts})'
+            self.stdout.write(f'{job.task} #{job.pk} {outcome} in {time.monotonic() - started:.2f}s')
+        self.stdout.write(f'Worker {worker_id} stopped.')
+
+    def maintain(self):
+        released = requeue_stale()
+        if released:
+            self.stderr.write(f'Released {released} jobs left running by a stopped worker.')
+        if self.options['keep_days']:
+            purge_jobs(timezone.now() - timedelta(days=self.options['keep_days']))
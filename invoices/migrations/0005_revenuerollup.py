@@ -0,0 +1,34 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:50
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0004_invoice_is_quotation_alter_invoiceitem_unit_type'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueRollup',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('period', models.CharField(choices=[('day', 'Day'), ('month', 'Month')], max_length=5)),
+                ('bucket', models.DateField(help_text='Day, or first day of the month')),
+                ('currency', models.CharField(max_length=3)),
+                ('invoice_count', models.IntegerField(default=0)),
+                ('invoiced', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('settled', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('payment_count', models.IntegerField(default=0)),
+                ('collected', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='invoices.client')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='invoices.company')),
+            ],
+            options={
+                'ordering': ['period', 'bucket'],
+                'constraints': [models.UniqueConstraint(fields=('period', 'bucket', 'company', 'client', 'currency'), name='unique_revenue_rollup_bucket')],
+            },
+        ),
+    ]
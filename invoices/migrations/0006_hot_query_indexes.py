@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0005_revenuerollup'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['-invoice_date', '-created_at'], name='invoice_date_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['-created_at'], name='invoice_created_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoice',
+            index=models.Index(fields=['updated_at'], name='invoice_updated_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='invoiceitem',
+            index=models.Index(fields=['invoice', 'order', 'id'], name='item_invoice_order_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['invoice', '-paid_on', '-created_at'], name='payment_invoice_paid_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='payment',
+            index=models.Index(fields=['updated_at'], name='payment_updated_idx'),
+        ),
+    ]
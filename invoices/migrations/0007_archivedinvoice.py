@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:00
+
+import django.core.serializers.json
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0006_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchivedInvoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('original_id', models.PositiveIntegerField(help_text='Primary key the invoice had before archiving', unique=True)),
+                ('invoice_number', models.CharField(max_length=50, unique=True)),
+                ('fiscal_year', models.PositiveSmallIntegerField(help_text='Year the fiscal year starts in')),
+                ('invoice_date', models.DateField()),
+                ('status', models.CharField(choices=[('draft', 'Draft'), ('sent', 'Sent'), ('paid', 'Paid'), ('overdue', 'Overdue'), ('cancelled', 'Cancelled')], max_length=20)),
+                ('currency', models.CharField(choices=[('INR', '₹ INR'), ('USD', '$ USD'), ('EUR', '€ EUR'), ('GBP', '£ GBP')], max_length=3)),
+                ('is_quotation', models.BooleanField(default=False)),
+                ('total', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('amount_paid', models.DecimalField(decimal_places=2, default=0, max_digits=12)),
+                ('payload', models.JSONField(encoder=django.core.serializers.json.DjangoJSONEncoder)),
+                ('archived_at', models.DateTimeField(auto_now_add=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_invoices', to='invoices.client')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='archived_invoices', to='invoices.company')),
+            ],
+            options={
+                'ordering': ['-invoice_date', '-original_id'],
+                'indexes': [models.Index(fields=['fiscal_year', 'company'], name='archived_year_company_idx'), models.Index(fields=['client', '-invoice_date'], name='archived_client_date_idx')],
+            },
+        ),
+    ]
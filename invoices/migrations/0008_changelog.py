@@ -0,0 +1,41 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:18
+
+from django.db import migrations, models
+
+
+def log_existing_rows(apps, schema_editor):
+    """Start the change log with one entry per existing row, so a first sync
+    without a cursor returns everything"""
+    ChangeLog = apps.get_model('invoices', 'ChangeLog')
+    for kind, model_name in (('client', 'Client'), ('invoice', 'Invoice'),
+                             ('item', 'InvoiceItem'), ('payment', 'Payment')):
+        pks = apps.get_model('invoices', model_name).objects.order_by('pk').values_list('pk', flat=True)
+        ChangeLog.objects.bulk_create(
+            (ChangeLog(kind=kind, object_id=pk) for pk in pks.iterator(chunk_size=2000)),
+            batch_size=1000,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0007_archivedinvoice'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ChangeLog',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('invoice', 'Invoice'), ('item', 'Invoice item'), ('payment', 'Payment'), ('client', 'Client')], max_length=10)),
+                ('object_id', models.PositiveBigIntegerField()),
+                ('deleted', models.BooleanField(default=False)),
+                ('changed_at', models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                'ordering': ['pk'],
+                'indexes': [models.Index(fields=['kind', 'object_id'], name='changelog_object_idx')],
+            },
+        ),
+        migrations.RunPython(log_existing_rows, migrations.RunPython.noop),
+    ]
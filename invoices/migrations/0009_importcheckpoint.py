@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:24
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0008_changelog'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImportCheckpoint',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('clients', 'Clients'), ('invoices', 'Invoices')], max_length=10)),
+                ('digest', models.CharField(help_text='SHA-256 of the imported file', max_length=64)),
+                ('filename', models.CharField(max_length=255)),
+                ('rows_done', models.PositiveIntegerField(default=0)),
+                ('created', models.PositiveIntegerField(default=0)),
+                ('skipped', models.PositiveIntegerField(default=0)),
+                ('failed', models.PositiveIntegerField(default=0)),
+                ('finished', models.BooleanField(default=False)),
+                ('started_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['-started_at'],
+                'constraints': [models.UniqueConstraint(fields=('kind', 'digest'), name='unique_import_checkpoint')],
+            },
+        ),
+    ]
@@ -0,0 +1,81 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:39
+
+import django.core.validators
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0011_emaildelivery'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecurringInvoice',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(help_text='e.g. "Lift maintenance contract"', max_length=200)),
+                ('currency', models.CharField(choices=[('INR', '₹ INR'), ('USD', '$ USD'), ('EUR', '€ EUR'), ('GBP', '£ GBP')], default='INR', max_length=3)),
+                ('notes', models.TextField(blank=True)),
+                ('terms', models.TextField(blank=True)),
+                ('interval', models.CharField(choices=[('weekly', 'Weekly'), ('monthly', 'Monthly'), ('quarterly', 'Quarterly'), ('half_yearly', 'Half-yearly'), ('yearly', 'Yearly')], default='monthly', max_length=20)),
+                ('start_date', models.DateField(help_text='Date of the first invoice; later ones fall on the same day of the period')),
+                ('next_run', models.DateField(help_text='Date of the next invoice')),
+                ('end_date', models.DateField(blank=True, help_text='No invoices after this date', null=True)),
+                ('due_days', models.PositiveSmallIntegerField(default=30, help_text='Days from invoice date to due date')),
+                ('auto_send', models.BooleanField(default=False, help_text='Email each invoice to the client')),
+                ('is_active', models.BooleanField(default=True)),
+                ('last_run', models.DateField(blank=True, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('client', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_invoices', to='invoices.client')),
+                ('company', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='recurring_invoices', to='invoices.company')),
+                ('created_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'ordering': ['next_run', 'name'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecurringInvoiceItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('description', models.CharField(max_length=500)),
+                ('unit_type', models.CharField(choices=[('sqft', 'Square Feet (Sq.Ft)'), ('sqm', 'Square Meter (Sq.M)'), ('nos', 'Numbers (Nos)'), ('ls', 'Lump Sum (L.S)')], default='nos', max_length=20, verbose_name='Unit')),
+                ('quantity', models.DecimalField(decimal_places=2, max_digits=10, validators=[django.core.validators.MinValueValidator(0.01)])),
+                ('rate', models.DecimalField(decimal_places=2, max_digits=12, validators=[django.core.validators.MinValueValidator(0)])),
+                ('discount', models.DecimalField(decimal_places=2, default=0, max_digits=5, validators=[django.core.validators.MinValueValidator(0)])),
+                ('tax_rate', models.DecimalField(decimal_places=2, default=0, help_text='GST %', max_digits=5)),
+                ('order', models.PositiveIntegerField(default=0)),
+                ('recurring_invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='items', to='invoices.recurringinvoice')),
+            ],
+            options={
+                'ordering': ['order', 'id'],
+            },
+        ),
+        migrations.CreateModel(
+            name='RecurringRun',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('run_date', models.DateField()),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('invoice', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='+', to='invoices.invoice')),
+                ('recurring_invoice', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='runs', to='invoices.recurringinvoice')),
+            ],
+            options={
+                'ordering': ['-run_date'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='recurringinvoice',
+            index=models.Index(fields=['is_active', 'next_run'], name='recurring_due_idx'),
+        ),
+        migrations.AddConstraint(
+            model_name='recurringrun',
+            constraint=models.UniqueConstraint(fields=('recurring_invoice', 'run_date'), name='unique_recurring_run'),
+        ),
+    ]
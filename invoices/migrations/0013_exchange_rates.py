@@ -0,0 +1,55 @@
+# Generated by Django 5.2.18 on 2026-10-19 19:44
+
+import django.core.validators
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import F
+
+
+def convert_rupee_invoices(apps, schema_editor):
+    """Rupee invoices convert at 1; the others need rates first (manage.py
+    load_exchange_rates, then convert_invoice_totals)"""
+    Invoice = apps.get_model('invoices', 'Invoice')
+    Invoice.objects.filter(currency='INR').update(
+        exchange_rate=1, total_base=F('total'), amount_paid_base=F('amount_paid'),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0012_recurringinvoice'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='invoice',
+            name='amount_paid_base',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='exchange_rate',
+            field=models.DecimalField(blank=True, decimal_places=6, max_digits=16, null=True),
+        ),
+        migrations.AddField(
+            model_name='invoice',
+            name='total_base',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=14, null=True),
+        ),
+        migrations.CreateModel(
+            name='ExchangeRate',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('currency', models.CharField(choices=[('INR', '₹ INR'), ('USD', '$ USD'), ('EUR', '€ EUR'), ('GBP', '£ GBP')], max_length=3)),
+                ('date', models.DateField(help_text='First day the rate applies')),
+                ('rate', models.DecimalField(decimal_places=6, max_digits=16, validators=[django.core.validators.MinValueValidator(Decimal('0.000001'))])),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+            ],
+            options={
+                'ordering': ['currency', '-date'],
+                'constraints': [models.UniqueConstraint(fields=('currency', 'date'), name='unique_exchange_rate')],
+            },
+        ),
+        migrations.RunPython(convert_rupee_invoices, migrations.RunPython.noop),
+    ]
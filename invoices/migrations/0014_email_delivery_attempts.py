@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 20:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('invoices', '0013_exchange_rates'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='emaildelivery',
+            name='attempts',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+    ]
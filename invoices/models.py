@@ -1,12 +1,13 @@
 from django.db import models
+from django.utils import timezone
 from django.contrib.auth.models import User
+from django.core import serializers
+from django.core.serializers.json import DjangoJSONEncoder
 from django.core.validators import MinValueValidator
 from decimal import Decimal
 from datetime import date
-import qrcode
 from io import BytesIO
 from django.core.files import File
-from PIL import Image
 
 
 class Company(models.Model):
@@ -109,6 +110,11 @@ class Client(models.Model):
         return ', '.join(parts)
 
 
+# Invoice fields the rupee amounts are computed from, and the amounts
+BASE_SOURCE_FIELDS = frozenset({'currency', 'invoice_date', 'total', 'amount_paid'})
+BASE_FIELDS = ('exchange_rate', 'total_base', 'amount_paid_base')
+
+
 class Invoice(models.Model):
     """Invoice model"""
     STATUS_CHOICES = [
@@ -145,6 +151,12 @@ class Invoice(models.Model):
     # Payment tracking
     amount_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
     
+    # Total and amount paid converted to rupees at the rate of the invoice
+    # date (see invoices.exchange_rates); null while no rate is known
+    exchange_rate = models.DecimalField(max_digits=16, decimal_places=6, null=True, blank=True)
+    total_base = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    amount_paid_base = models.DecimalField(max_digits=14, decimal_places=2, null=True, blank=True)
+    
     # Notes
     notes = models.TextField(blank=True, help_text='Internal notes')
     terms = models.TextField(blank=True, help_text='Terms and conditions')
@@ -161,6 +173,16 @@ class Invoice(models.Model):
 
     class Meta:
         ordering = ['-invoice_date', '-created_at']
+        indexes = [
+            # Default ordering of the invoice list
+            models.Index(fields=['-invoice_date', '-created_at'], name='invoice_date_created_idx'),
+            # Overdue / aging filters
+            models.Index(fields=['status', 'due_date'], name='invoice_status_due_idx'),
+            # Dashboard "recent invoices"
+            models.Index(fields=['-created_at'], name='invoice_created_idx'),
+            # Incremental refresh of the analytics cache
+            models.Index(fields=['updated_at'], name='invoice_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Invoice {self.invoice_number} - {self.client.name}"
@@ -175,6 +197,11 @@ class Invoice(models.Model):
         if self.pk:
             self.calculate_totals()
         
+        self.convert_to_base()
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None and BASE_SOURCE_FIELDS.intersection(update_fields):
+            kwargs['update_fields'] = [*update_fields, *BASE_FIELDS]
+        
         super().save(*args, **kwargs)
         
         # Generate QR code after saving
@@ -183,12 +210,21 @@ class Invoice(models.Model):
 
     def generate_invoice_number(self):
         """Generate unique invoice number"""
+        return self.allocate_invoice_numbers(1)[0]
+
+    @staticmethod
+    def allocate_invoice_numbers(count):
+        """The next ``count`` consecutive invoice numbers for this month"""
         from datetime import datetime
         year = datetime.now().year
         month = datetime.now().month
         
+        # A range on the unique index rather than LIKE 'INV-YYYYMM%', which
+        # SQLite can only answer with a full scan ('.' sorts right after '-').
+        prefix = f'INV-{year}{month:02d}-'
         last_invoice = Invoice.objects.filter(
-            invoice_number__startswith=f'INV-{year}{month:02d}'
+            invoice_number__gte=prefix,
+            invoice_number__lt=f'INV-{year}{month:02d}.',
         ).order_by('-invoice_number').first()
         
         if last_invoice:
@@ -197,11 +233,12 @@ class Invoice(models.Model):
         else:
             new_num = 1
         
-        return f'INV-{year}{month:02d}-{new_num:04d}'
+        return [f'{prefix}{number:04d}' for number in range(new_num, new_num + count)]
 
-    def calculate_totals(self):
-        """Calculate invoice totals from line items"""
-        items = self.items.all()
+    def calculate_totals(self, items=None):
+        """Calculate invoice totals from line items (default: the saved ones)"""
+        if items is None:
+            items = self.items.all()
         
         subtotal = Decimal('0.00')
         tax_amount = Decimal('0.00')
@@ -222,6 +259,13 @@ class Invoice(models.Model):
         self.tax_amount = tax_amount
         self.total = subtotal - discount_amount + tax_amount
 
+    def convert_to_base(self):
+        """Set the rupee amounts from the exchange rate of the invoice date"""
+        from .exchange_rates import rate_for, to_base
+        self.exchange_rate = rate_for(self.currency, self.invoice_date)
+        self.total_base = to_base(self.total, self.exchange_rate)
+        self.amount_paid_base = to_base(self.amount_paid, self.exchange_rate)
+
     def get_balance_due(self):
         """Get remaining balance"""
         return self.total - self.amount_paid
@@ -278,6 +322,9 @@ class Invoice(models.Model):
         if not self.company.upi_id:
             return
         
+        # Imported here so commands and migrations do not load qrcode/PIL
+        import qrcode
+        
         # UPI payment string format
         upi_string = f"upi://pay?pa={self.company.upi_id}&pn={self.company.name}&am={self.total}&cu={self.currency}&tn=Invoice {self.invoice_number}"
         
@@ -345,29 +392,33 @@ class InvoiceItem(models.Model):
     
     class Meta:
         ordering = ['order', 'id']
+        indexes = [
+            models.Index(fields=['invoice', 'order', 'id'], name='item_invoice_order_idx'),
+        ]
 
     def __str__(self):
         return f"{self.description} - {self.quantity} x {self.rate}"
 
     def save(self, *args, **kwargs):
         """Calculate line item amount"""
+        self.calculate_amount()
+        
+        super().save(*args, **kwargs)
+        
+        # Update invoice totals (Invoice.save recalculates them). Going through
+        # save() rather than a queryset update keeps rollups and caches in sync.
+        if self.invoice_id:
+            self.invoice.save(update_fields=[
+                'subtotal', 'tax_amount', 'discount_amount', 'total', 'updated_at'
+            ])
+
+    def calculate_amount(self):
+        """Set the line amount after discount and tax"""
         subtotal = self.quantity * self.rate
         discount_amount = subtotal * (self.discount / Decimal('100'))
         taxable_amount = subtotal - discount_amount
         tax_amount = taxable_amount * (self.tax_rate / Decimal('100'))
         self.amount = taxable_amount + tax_amount
-        
-        super().save(*args, **kwargs)
-        
-        # Update invoice totals
-        if self.invoice_id:
-            self.invoice.calculate_totals()
-            Invoice.objects.filter(pk=self.invoice.pk).update(
-                subtotal=self.invoice.subtotal,
-                tax_amount=self.invoice.tax_amount,
-                discount_amount=self.invoice.discount_amount,
-                total=self.invoice.total
-            )
 
     def get_line_total(self):
         """Get line item total"""
@@ -420,6 +471,10 @@ class Payment(models.Model):
 
     class Meta:
         ordering = ['-paid_on', '-created_at']
+        indexes = [
+            models.Index(fields=['invoice', '-paid_on', '-created_at'], name='payment_invoice_paid_idx'),
+            models.Index(fields=['updated_at'], name='payment_updated_idx'),
+        ]
 
     def __str__(self):
         return f"Payment {self.amount} for {self.invoice.invoice_number}"
@@ -435,3 +490,352 @@ class Payment(models.Model):
         if self.invoice.total and total_paid >= self.invoice.total:
             self.invoice.status = 'paid'
         self.invoice.save(update_fields=['amount_paid', 'status', 'updated_at'])
+
+
+class RevenueRollup(models.Model):
+    """Invoiced and collected amounts pre-aggregated per day or month.
+
+    Rows are kept up to date incrementally by ``invoices.rollups`` whenever an
+    invoice or payment is written, so reports read one row per bucket instead
+    of grouping the invoice and payment tables.
+    """
+
+    PERIOD_CHOICES = [
+        ('day', 'Day'),
+        ('month', 'Month'),
+    ]
+
+    period = models.CharField(max_length=5, choices=PERIOD_CHOICES)
+    bucket = models.DateField(help_text='Day, or first day of the month')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='+')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='+')
+    currency = models.CharField(max_length=3)
+
+    # Invoices dated in this bucket
+    invoice_count = models.IntegerField(default=0)
+    invoiced = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    settled = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    # Payments received in this bucket
+    payment_count = models.IntegerField(default=0)
+    collected = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+
+    class Meta:
+        ordering = ['period', 'bucket']
+        constraints = [
+            models.UniqueConstraint(
+                fields=['period', 'bucket', 'company', 'client', 'currency'],
+                name='unique_revenue_rollup_bucket',
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_period_display()} {self.bucket} {self.currency}"
+
+    def get_outstanding(self):
+        """Unpaid part of the amount invoiced in this bucket"""
+        return self.invoiced - self.settled
+
+
+class ArchivedInvoice(models.Model):
+    """A settled invoice from a closed fiscal year moved out of the hot tables.
+
+    The invoice row and its items, payments, payment info and email
+    deliveries are kept as a serialized snapshot in ``payload``; the columns alongside it are the ones
+    needed to list archived invoices and to rebuild revenue rollups. See
+    ``invoices.archive``.
+    """
+    original_id = models.PositiveIntegerField(unique=True, help_text='Primary key the invoice had before archiving')
+    invoice_number = models.CharField(max_length=50, unique=True)
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='archived_invoices')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='archived_invoices')
+    fiscal_year = models.PositiveSmallIntegerField(help_text='Year the fiscal year starts in')
+
+    invoice_date = models.DateField()
+    status = models.CharField(max_length=20, choices=Invoice.STATUS_CHOICES)
+    currency = models.CharField(max_length=3, choices=Invoice.CURRENCY_CHOICES)
+    is_quotation = models.BooleanField(default=False)
+    total = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+    amount_paid = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    payload = models.JSONField(encoder=DjangoJSONEncoder)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-invoice_date', '-original_id']
+        indexes = [
+            models.Index(fields=['fiscal_year', 'company'], name='archived_year_company_idx'),
+            models.Index(fields=['client', '-invoice_date'], name='archived_client_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"Archived invoice {self.invoice_number}"
+
+    def _deserialize(self, key):
+        return [obj.object for obj in serializers.deserialize('python', self.payload.get(key) or [])]
+
+    def unpack(self):
+        """Rebuild unsaved instances for read-only rendering.
+
+        Returns ``(invoice, items, payments, payment_info)``; ``payment_info``
+        is a blank PaymentInfo when the invoice never had one.
+        """
+        invoice = self._deserialize('invoice')[0]
+        invoice.company = self.company
+        invoice.client = self.client
+        items = self._deserialize('items')
+        payments = self._deserialize('payments')
+        payment_info = next(iter(self._deserialize('payment_info')), None) or PaymentInfo()
+        for obj in items + payments + [payment_info]:
+            obj.invoice = invoice
+        return invoice, items, payments, payment_info
+
+    def email_deliveries(self):
+        """The invoice's email deliveries as they were when it was archived, newest first"""
+        deliveries = self._deserialize('email_deliveries')
+        return sorted(deliveries, key=lambda delivery: delivery.created_at, reverse=True)
+
+
+class ChangeLog(models.Model):
+    """One write to a synced row, in commit order, for the delta sync API.
+
+    Appended by the signal handlers in ``invoices.signals`` (and by the bulk
+    API, which bypasses signals); ``invoices.changes`` pages through it by
+    primary key. A row with ``deleted`` set is a tombstone.
+    """
+
+    KIND_CHOICES = [
+        ('invoice', 'Invoice'),
+        ('item', 'Invoice item'),
+        ('payment', 'Payment'),
+        ('client', 'Client'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.PositiveBigIntegerField()
+    deleted = models.BooleanField(default=False)
+    changed_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['pk']
+        indexes = [
+            # Compaction finds superseded entries per object
+            models.Index(fields=['kind', 'object_id'], name='changelog_object_idx'),
+        ]
+
+    def __str__(self):
+        action = 'deleted' if self.deleted else 'changed'
+        return f"{self.get_kind_display()} {self.object_id} {action}"
+
+
+class ImportCheckpoint(models.Model):
+    """Progress of a CSV import, committed with each chunk so a failed or
+    interrupted import resumes after the last committed row. See
+    ``invoices.imports``.
+    """
+
+    KIND_CHOICES = [
+        ('clients', 'Clients'),
+        ('invoices', 'Invoices'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    digest = models.CharField(max_length=64, help_text='SHA-256 of the imported file')
+    filename = models.CharField(max_length=255)
+    rows_done = models.PositiveIntegerField(default=0)
+    created = models.PositiveIntegerField(default=0)
+    skipped = models.PositiveIntegerField(default=0)
+    failed = models.PositiveIntegerField(default=0)
+    finished = models.BooleanField(default=False)
+    started_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'digest'], name='unique_import_checkpoint'),
+        ]
+
+    def __str__(self):
+        return f"{self.get_kind_display()} import of {self.filename}"
+
+
+class Job(models.Model):
+    """A background task stored in the database, run by ``manage.py run_worker``.
+
+    See ``invoices.jobs`` for enqueueing and claiming.
+    """
+
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    task = models.CharField(max_length=100)
+    kwargs = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    priority = models.SmallIntegerField(default=0, help_text='Higher runs first')
+    run_at = models.DateTimeField(default=timezone.now, help_text='Not run before this time')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    max_attempts = models.PositiveSmallIntegerField(default=3)
+    locked_by = models.CharField(max_length=100, blank=True)
+    locked_at = models.DateTimeField(null=True, blank=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        indexes = [
+            # Workers claim the next due job of the highest priority
+            models.Index(fields=['status', '-priority', 'run_at'], name='job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} #{self.pk} ({self.get_status_display()})"
+
+
+class EmailDelivery(models.Model):
+    """An invoice or payment receipt emailed to a client.
+
+    Created as queued by ``invoices.emails`` and sent by the background
+    worker, which records the outcome here. ``attempts`` counts the tries
+    to send it, including those cut short by a connection error that left
+    it queued for the job's retry.
+    """
+
+    KIND_CHOICES = [
+        ('invoice', 'Invoice'),
+        ('receipt', 'Payment receipt'),
+    ]
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('sent', 'Sent'),
+        ('failed', 'Failed'),
+    ]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    invoice = models.ForeignKey(Invoice, on_delete=models.CASCADE, related_name='email_deliveries')
+    payment = models.ForeignKey(Payment, on_delete=models.CASCADE, null=True, blank=True, related_name='email_deliveries')
+    recipient = models.EmailField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='queued')
+    attempts = models.PositiveSmallIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['-created_at']
+        verbose_name_plural = 'Email deliveries'
+
+    def __str__(self):
+        return f"{self.get_kind_display()} {self.invoice.invoice_number} to {self.recipient}"
+
+
+class RecurringInvoice(models.Model):
+    """A template for an invoice billed on a schedule, e.g. a monthly
+    maintenance contract. ``invoices.recurring`` generates the invoices
+    that are due.
+    """
+
+    INTERVAL_CHOICES = [
+        ('weekly', 'Weekly'),
+        ('monthly', 'Monthly'),
+        ('quarterly', 'Quarterly'),
+        ('half_yearly', 'Half-yearly'),
+        ('yearly', 'Yearly'),
+    ]
+
+    name = models.CharField(max_length=200, help_text='e.g. "Lift maintenance contract"')
+    company = models.ForeignKey(Company, on_delete=models.CASCADE, related_name='recurring_invoices')
+    client = models.ForeignKey(Client, on_delete=models.CASCADE, related_name='recurring_invoices')
+    currency = models.CharField(max_length=3, choices=Invoice.CURRENCY_CHOICES, default='INR')
+    notes = models.TextField(blank=True)
+    terms = models.TextField(blank=True)
+
+    interval = models.CharField(max_length=20, choices=INTERVAL_CHOICES, default='monthly')
+    start_date = models.DateField(help_text='Date of the first invoice; later ones fall on the same day of the period')
+    next_run = models.DateField(help_text='Date of the next invoice')
+    end_date = models.DateField(null=True, blank=True, help_text='No invoices after this date')
+    due_days = models.PositiveSmallIntegerField(default=30, help_text='Days from invoice date to due date')
+    auto_send = models.BooleanField(default=False, help_text='Email each invoice to the client')
+    is_active = models.BooleanField(default=True)
+    last_run = models.DateField(null=True, blank=True)
+
+    created_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['next_run', 'name']
+        indexes = [
+            models.Index(fields=['is_active', 'next_run'], name='recurring_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.name} ({self.client.name}, {self.get_interval_display().lower()})"
+
+
+class RecurringInvoiceItem(models.Model):
+    """A line item copied into every invoice of a recurring schedule"""
+
+    recurring_invoice = models.ForeignKey(RecurringInvoice, on_delete=models.CASCADE, related_name='items')
+    description = models.CharField(max_length=500)
+    unit_type = models.CharField(max_length=20, choices=InvoiceItem.UNIT_TYPE_CHOICES, default='nos', verbose_name='Unit')
+    quantity = models.DecimalField(max_digits=10, decimal_places=2, validators=[MinValueValidator(0.01)])
+    rate = models.DecimalField(max_digits=12, decimal_places=2, validators=[MinValueValidator(0)])
+    discount = models.DecimalField(max_digits=5, decimal_places=2, default=0, validators=[MinValueValidator(0)])
+    tax_rate = models.DecimalField(max_digits=5, decimal_places=2, default=0, help_text='GST %')
+    order = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ['order', 'id']
+
+    def __str__(self):
+        return f"{self.description} - {self.quantity} x {self.rate}"
+
+
+class RecurringRun(models.Model):
+    """The invoice generated for one date of a recurring schedule.
+
+    The unique constraint is what makes generation safe to rerun: a second
+    run for the same date fails and rolls back instead of billing twice.
+    """
+
+    recurring_invoice = models.ForeignKey(RecurringInvoice, on_delete=models.CASCADE, related_name='runs')
+    run_date = models.DateField()
+    # Kept when the invoice is deleted or archived, so that date is not billed again
+    invoice = models.ForeignKey(Invoice, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['-run_date']
+        constraints = [
+            models.UniqueConstraint(fields=['recurring_invoice', 'run_date'], name='unique_recurring_run'),
+        ]
+
+    def __str__(self):
+        return f"{self.recurring_invoice.name} on {self.run_date}"
+
+
+class ExchangeRate(models.Model):
+    """Rupees per unit of a currency, in force from ``date`` until the next
+    rate. Maintained locally with ``manage.py load_exchange_rates``.
+    """
+
+    currency = models.CharField(max_length=3, choices=Invoice.CURRENCY_CHOICES)
+    date = models.DateField(help_text='First day the rate applies')
+    rate = models.DecimalField(max_digits=16, decimal_places=6, validators=[MinValueValidator(Decimal('0.000001'))])
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ['currency', '-date']
+        constraints = [
+            models.UniqueConstraint(fields=['currency', 'date'], name='unique_exchange_rate'),
+        ]
+
+    def __str__(self):
+        return f"1 {self.currency} = ₹{self.rate} from {self.date}"
@@ -0,0 +1,69 @@
+"""
+HTML to PDF conversion.
+
+``html_to_pdf`` renders in the calling thread, for the WSGI views.
+``ahtml_to_pdf`` hands the CPU-bound xhtml2pdf work to a process pool, so an
+async view waiting for a PDF does not hold up the event loop, and several
+PDFs render in parallel instead of queueing on the GIL.
+
+This module must stay importable without Django settings: pool processes are
+spawned fresh and only import what ``html_to_pdf`` needs.
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+class PdfError(Exception):
+    """xhtml2pdf reported errors while rendering"""
+
+
+def html_to_pdf(html):
+    """Render an HTML string to PDF bytes.
+
+    Raises ImportError when xhtml2pdf is not installed and PdfError when the
+    document has errors.
+    """
+    from xhtml2pdf import pisa
+
+    result = BytesIO()
+    pdf = pisa.pisaDocument(BytesIO(html.encode('UTF-8')), result)
+    if pdf.err:
+        raise PdfError(f'{pdf.err} errors while rendering PDF')
+    return result.getvalue()
+
+
+def _warm_pool_process():
+    try:
+        from xhtml2pdf import pisa  # noqa: F401
+    except ImportError:
+        pass
+
+
+def get_executor():
+    """This process's PDF pool, created on first use"""
+    global _executor
+    if _executor is None:
+        with _executor_lock:
+            if _executor is None:
+                from django.conf import settings
+                _executor = ProcessPoolExecutor(
+                    max_workers=getattr(settings, 'PDF_PROCESSES', None) or os.cpu_count(),
+                    # Forking a process that runs an event loop and thread
+                    # pools is unsafe; start clean interpreters instead.
+                    mp_context=multiprocessing.get_context('spawn'),
+                    initializer=_warm_pool_process,
+                )
+    return _executor
+
+
+async def ahtml_to_pdf(html):
+    """Render an HTML string to PDF bytes in the process pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(get_executor(), html_to_pdf, html)
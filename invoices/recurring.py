@@ -0,0 +1,161 @@
+"""
+Recurring invoices.
+
+``generate_due_invoices`` bills every active ``RecurringInvoice`` whose
+``next_run`` has come, in one transaction. All invoices and their items are
+written with ``bulk_create`` through ``bulk.insert_invoices``, which
+allocates the invoice numbers as one block. Each billed date gets a
+``RecurringRun`` row, and each schedule's ``next_run`` moves past the dates
+billed. A schedule that fell behind, because the generator did not run for a
+while, catches up with one invoice per missed date.
+
+Reruns never bill a date twice. ``next_run`` advances in the same
+transaction as the inserts, with an update conditional on its old value,
+and ``RecurringRun`` is unique per schedule and date. A concurrent run that
+loses the race rolls back on the constraint and retries, and then finds
+nothing left to bill.
+"""
+import calendar
+from datetime import date, timedelta
+
+from django.db import IntegrityError, transaction
+from django.db.models import F, Q
+
+from .bulk import NUMBER_ATTEMPTS, insert_invoices
+from .emails import queue_invoice_emails
+from .models import Invoice, InvoiceItem, RecurringInvoice, RecurringRun
+
+INTERVAL_MONTHS = {'monthly': 1, 'quarterly': 3, 'half_yearly': 6, 'yearly': 12}
+
+# Fields copied from a schedule's items into each invoice's items
+ITEM_FIELDS = ('description', 'unit_type', 'quantity', 'rate', 'discount', 'tax_rate', 'order')
+
+
+def add_months(day, months):
+    """The same day ``months`` later, or the month's last day if it is shorter"""
+    month = day.month - 1 + months
+    year, month = day.year + month // 12, month % 12 + 1
+    return date(year, month, min(day.day, calendar.monthrange(year, month)[1]))
+
+
+def next_date(schedule, day):
+    """The schedule's first invoice date after ``day``.
+
+    Monthly and longer intervals count from ``start_date``, so a schedule
+    starting on the 31st bills on the 30th in April and the 31st again in May.
+    """
+    if schedule.interval == 'weekly':
+        return day + timedelta(weeks=1)
+    step = INTERVAL_MONTHS[schedule.interval]
+    start = schedule.start_date
+    periods = max(0, ((day.year - start.year) * 12 + day.month - start.month) // step)
+    candidate = add_months(start, periods * step)
+    while candidate <= day:
+        periods += 1
+        candidate = add_months(start, periods * step)
+    return candidate
+
+
+def billing_dates(schedule, today):
+    """The invoice dates due by ``today`` and the next_run after them"""
+    dates, day = [], schedule.next_run
+    while day <= today and (schedule.end_date is None or day <= schedule.end_date):
+        dates.append(day)
+        day = next_date(schedule, day)
+    return dates, day
+
+
+def due_schedules(today):
+    return (
+        RecurringInvoice.objects
+        .filter(is_active=True, next_run__lte=today)
+        .filter(Q(end_date__isnull=True) | Q(end_date__gte=F('next_run')))
+        .select_related('company', 'client')
+        .prefetch_related('items')
+        .order_by('pk')
+    )
+
+
+def build_invoice(schedule, day):
+    """An unsaved invoice and items for one date of a schedule"""
+    invoice = Invoice(
+        company=schedule.company, client=schedule.client, currency=schedule.currency,
+        invoice_date=day, due_date=day + timedelta(days=schedule.due_days),
+        notes=schedule.notes, terms=schedule.terms, status='draft',
+    )
+    items = []
+    for item in schedule.items.all():
+        item = InvoiceItem(**{field: getattr(item, field) for field in ITEM_FIELDS})
+        item.calculate_amount()
+        items.append(item)
+    invoice.calculate_totals(items)
+    return invoice, items
+
+
+def generate(today, user):
+    records, runs, to_send = [], [], []
+    for schedule in due_schedules(today):
+        dates, next_run = billing_dates(schedule, today)
+        if not dates:
+            continue
+        finished = schedule.end_date is not None and next_run > schedule.end_date
+        # Only one run can move next_run on from the value it read
+        claimed = RecurringInvoice.objects.filter(pk=schedule.pk, next_run=schedule.next_run).update(
+            next_run=next_run, last_run=dates[-1], is_active=not finished,
+        )
+        if not claimed:
+            continue
+        for day in dates:
+            invoice, items = build_invoice(schedule, day)
+            records.append((len(records), invoice, items, []))
+            runs.append(RecurringRun(recurring_invoice=schedule, run_date=day, invoice=invoice))
+            if schedule.auto_send:
+                to_send.append(invoice)
+    if not records:
+        return []
+
+    invoices = insert_invoices(records, user)
+    RecurringRun.objects.bulk_create(runs)
+    queue_invoice_emails(to_send, user)
+    return invoices
+
+
+def generate_due_invoices(today=None, user=None):
+    """Create the invoices due by ``today`` for every active schedule; returns them"""
+    today = today or date.today()
+    for attempt in range(NUMBER_ATTEMPTS):
+        try:
+            with transaction.atomic():
+                return generate(today, user)
+        except IntegrityError:
+            # A concurrent run billed the same dates or took numbers from the block
+            if attempt == NUMBER_ATTEMPTS - 1:
+                raise
+
+
+def schedule_initial(invoice):
+    """Initial schedule fields and items for repeating an invoice, one interval on"""
+    initial = {
+        'name': f'{invoice.client.name} - {invoice.invoice_number}',
+        'company': invoice.company_id,
+        'client': invoice.client_id,
+        'currency': invoice.currency,
+        'interval': 'monthly',
+        'start_date': add_months(invoice.invoice_date, 1),
+        'due_days': max(0, (invoice.due_date - invoice.invoice_date).days),
+        'notes': invoice.notes,
+        'terms': invoice.terms,
+    }
+    items = [{field: getattr(item, field) for field in ITEM_FIELDS} for item in invoice.items.all()]
+    return initial, items
+
+
+def resume(schedule, today=None):
+    """Reactivate a paused schedule without billing the dates it missed"""
+    today = today or date.today()
+    day = schedule.next_run
+    while day < today:
+        day = next_date(schedule, day)
+    schedule.next_run = day
+    schedule.is_active = True
+    schedule.save(update_fields=['next_run', 'is_active', 'updated_at'])
@@ -0,0 +1,189 @@
+"""
+Report queries that aggregate in the database.
+"""
+from datetime import date, timedelta
+
+from decimal import Decimal
+
+from django.db.models import (
+    Case, CharField, Count, DecimalField, ExpressionWrapper, F, Q, Sum, Value, When,
+)
+from django.db.models.functions import Lower, Substr, TruncMonth
+
+from .models import Invoice, InvoiceItem
+
+# (key, label, minimum days overdue, maximum days overdue)
+AGING_BUCKETS = [
+    ('current', 'Not Due', None, -1),
+    ('days_0_30', '0-30', 0, 30),
+    ('days_31_60', '31-60', 31, 60),
+    ('days_61_90', '61-90', 61, 90),
+    ('days_90_plus', '90+', 91, None),
+]
+
+
+def aging_bucket_filter(key, today):
+    """Q object selecting invoices whose due date falls in an aging bucket"""
+    for bucket, label, min_days, max_days in AGING_BUCKETS:
+        if bucket != key:
+            continue
+        query = Q()
+        if min_days is not None:
+            query &= Q(due_date__lte=today - timedelta(days=min_days))
+        if max_days is not None:
+            query &= Q(due_date__gte=today - timedelta(days=max_days))
+        return query
+    raise ValueError(f'Unknown aging bucket "{key}"')
+
+
+def open_invoices():
+    """Invoices that still have a balance to collect"""
+    return Invoice.objects.filter(
+        is_quotation=False,
+        amount_paid__lt=F('total'),
+    ).exclude(status__in=['paid', 'cancelled'])
+
+
+def aging_summary(group_by='client', today=None, using=None):
+    """Outstanding balance per aging bucket for each client or company.
+
+    A single grouped query with one conditional SUM per bucket; amounts are
+    never mixed across currencies. Rows are generated lazily, so a caller
+    streaming them after its view returned passes the database in ``using``.
+    """
+    today = today or date.today()
+    balance = F('total') - F('amount_paid')
+    aggregates = {
+        key: Sum(balance, filter=aging_bucket_filter(key, today))
+        for key, label, min_days, max_days in AGING_BUCKETS
+    }
+    rows = (
+        open_invoices()
+        .order_by()
+        .values(f'{group_by}_id', f'{group_by}__name', 'currency')
+        .annotate(invoice_count=Count('pk'), outstanding=Sum(balance), **aggregates)
+        .order_by(f'{group_by}__name', 'currency')
+        .using(using)
+    )
+    for row in rows:
+        row['id'] = row.pop(f'{group_by}_id')
+        row['name'] = row.pop(f'{group_by}__name')
+        row['buckets'] = [row[key] or 0 for key, label, min_days, max_days in AGING_BUCKETS]
+        row['cells'] = [(key, row[key] or 0) for key, label, min_days, max_days in AGING_BUCKETS]
+        yield row
+
+
+def aging_invoices(today=None, bucket=None, **filters):
+    """Open invoices annotated with their balance and aging bucket"""
+    today = today or date.today()
+    invoices = open_invoices().filter(**filters)
+    if bucket:
+        invoices = invoices.filter(aging_bucket_filter(bucket, today))
+    return invoices.annotate(
+        balance=F('total') - F('amount_paid'),
+        aging_bucket=Case(
+            *[
+                When(aging_bucket_filter(key, today), then=Value(label))
+                for key, label, min_days, max_days in AGING_BUCKETS
+            ],
+            output_field=CharField(),
+        ),
+    ).order_by('due_date', 'pk')
+
+
+GST_CHUNK_SIZE = 2000
+GST_COLUMNS = [
+    ('month', 'Month'),
+    ('supply_type', 'Supply Type'),
+    ('gstin', 'Client GSTIN'),
+    ('tax_rate', 'Tax Rate %'),
+    ('place_of_supply', 'Place of Supply'),
+    ('invoice_count', 'Invoices'),
+    ('taxable_value', 'Taxable Value'),
+    ('cgst', 'CGST'),
+    ('sgst', 'SGST'),
+    ('igst', 'IGST'),
+    ('tax_amount', 'Total Tax'),
+]
+
+
+def fiscal_year_start(day):
+    """First day of the Indian financial year (April-March) containing a date"""
+    year = day.year if day.month >= 4 else day.year - 1
+    return date(year, 4, 1)
+
+
+def gst_items(start, end, company_id=None):
+    """Billed line items (no quotations or cancelled invoices) in a date range"""
+    items = InvoiceItem.objects.filter(
+        invoice__is_quotation=False,
+        invoice__invoice_date__gte=start,
+        invoice__invoice_date__lte=end,
+    ).exclude(invoice__status='cancelled')
+    if company_id:
+        items = items.filter(invoice__company_id=company_id)
+    return items
+
+
+def gst_summary(start, end, company_id=None, using=None):
+    """Taxable value and tax per month, tax rate, client GSTIN and supply type.
+
+    Aggregation happens in the database; rows are streamed with
+    ``iterator()`` so a full year never sits in memory. Intra-state supplies
+    split tax equally into CGST and SGST, inter-state supplies are IGST.
+    Place of supply uses the GSTIN state codes when both parties have a
+    GSTIN, and falls back to comparing billing state with company state.
+    ``using`` pins the database, as for ``aging_summary``.
+    """
+    decimal = DecimalField(max_digits=14, decimal_places=2)
+    taxable = ExpressionWrapper(
+        F('quantity') * F('rate') * (Value(Decimal('100')) - F('discount')) / Value(Decimal('100')),
+        output_field=decimal,
+    )
+    tax = ExpressionWrapper(taxable * F('tax_rate') / Value(Decimal('100')), output_field=decimal)
+    both_registered = ~Q(invoice__client__gstin='') & ~Q(invoice__company__gstin='')
+
+    rows = (
+        gst_items(start, end, company_id)
+        .order_by()
+        .annotate(
+            month=TruncMonth('invoice__invoice_date'),
+            client_state_code=Substr('invoice__client__gstin', 1, 2),
+            company_state_code=Substr('invoice__company__gstin', 1, 2),
+            client_state=Lower('invoice__client__billing_state'),
+            company_state=Lower('invoice__company__state'),
+        )
+        .annotate(
+            supply_type=Case(
+                When(~Q(invoice__client__gstin=''), then=Value('B2B')),
+                default=Value('B2C'),
+                output_field=CharField(),
+            ),
+            place_of_supply=Case(
+                When(both_registered & Q(client_state_code=F('company_state_code')), then=Value('intra')),
+                When(both_registered, then=Value('inter')),
+                When(Q(client_state='') | Q(client_state=F('company_state')), then=Value('intra')),
+                default=Value('inter'),
+                output_field=CharField(),
+            ),
+        )
+        .values('month', 'tax_rate', 'supply_type', 'place_of_supply', gstin=F('invoice__client__gstin'))
+        .annotate(
+            invoice_count=Count('invoice_id', distinct=True),
+            taxable_value=Sum(taxable),
+            tax_amount=Sum(tax),
+        )
+        .order_by('month', 'supply_type', 'gstin', 'tax_rate', 'place_of_supply')
+        .using(using)
+    )
+
+    for row in rows.iterator(chunk_size=GST_CHUNK_SIZE):
+        tax_amount = (row['tax_amount'] or Decimal('0')).quantize(Decimal('0.01'))
+        if row['place_of_supply'] == 'intra':
+            cgst = (tax_amount / 2).quantize(Decimal('0.01'))
+            row.update(cgst=cgst, sgst=tax_amount - cgst, igst=Decimal('0.00'))
+        else:
+            row.update(cgst=Decimal('0.00'), sgst=Decimal('0.00'), igst=tax_amount)
+        row['taxable_value'] = (row['taxable_value'] or Decimal('0')).quantize(Decimal('0.01'))
+        row['tax_amount'] = tax_amount
+        yield row
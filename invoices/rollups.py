@@ -0,0 +1,305 @@
+"""
+Incremental maintenance of ``RevenueRollup``.
+
+Every invoice and payment contributes to one day bucket and one month bucket.
+When a row is written, the signal handlers in ``invoices.signals`` compute its
+contribution before and after the write and apply the difference as an
+``F()`` update, so the rollup never has to be recomputed from scratch.
+
+``rebuild_rollups`` recomputes everything with ``GROUP BY`` queries and
+``check_rollups`` compares the stored rows against that recomputation.
+
+Archived invoices keep their contribution: archiving runs inside
+``suspended()`` and the recomputation reads ``ArchivedInvoice`` as well.
+"""
+from collections import defaultdict
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import date
+from decimal import Decimal
+
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import TruncMonth
+
+from .models import ArchivedInvoice, Invoice, Payment, RevenueRollup
+
+PERIODS = ('day', 'month')
+MEASURES = ('invoice_count', 'invoiced', 'settled', 'payment_count', 'collected')
+
+# Fields read to work out the contribution of an invoice / payment
+INVOICE_FIELDS = (
+    'invoice_date', 'company_id', 'client_id', 'currency',
+    'total', 'amount_paid', 'is_quotation', 'status',
+)
+PAYMENT_FIELDS = ('invoice_id', 'amount', 'paid_on')
+DIMENSION_FIELDS = ('company_id', 'client_id', 'currency', 'is_quotation')
+
+_suspended = ContextVar('rollups_suspended', default=False)
+
+
+@contextmanager
+def suspended():
+    """Leave rollups untouched by the invoice and payment writes in this block"""
+    token = _suspended.set(True)
+    try:
+        yield
+    finally:
+        _suspended.reset(token)
+
+
+def is_suspended():
+    return _suspended.get()
+
+
+def get_bucket(period, day):
+    """Map a date to the start of its day or month bucket"""
+    if period == 'month':
+        return day.replace(day=1)
+    return day
+
+
+def invoice_state(invoice):
+    """Snapshot the rollup-relevant fields of an Invoice instance"""
+    return {field: getattr(invoice, field) for field in INVOICE_FIELDS}
+
+
+def load_invoice_state(pk):
+    """Read the rollup-relevant fields of an invoice from the database"""
+    return Invoice.objects.filter(pk=pk).values(*INVOICE_FIELDS).first()
+
+
+def invoice_contribution(state):
+    """Rollup key and measures contributed by an invoice (None if excluded)"""
+    if not state or state['is_quotation'] or state['status'] == 'cancelled':
+        return None
+    key = (state['invoice_date'], state['company_id'], state['client_id'], state['currency'])
+    return key, {
+        'invoice_count': 1,
+        'invoiced': state['total'] or Decimal('0'),
+        'settled': state['amount_paid'] or Decimal('0'),
+    }
+
+
+def payment_contribution(state, invoice):
+    """Rollup key and measures contributed by a payment (None if excluded)"""
+    if not state or not invoice or invoice['is_quotation']:
+        return None
+    key = (state['paid_on'], invoice['company_id'], invoice['client_id'], invoice['currency'])
+    return key, {
+        'payment_count': 1,
+        'collected': state['amount'] or Decimal('0'),
+    }
+
+
+def apply_delta(key, deltas):
+    """Add measure deltas to the day and month buckets for a key"""
+    deltas = {field: value for field, value in deltas.items() if value}
+    if not deltas:
+        return
+    day, company_id, client_id, currency = key
+    for period in PERIODS:
+        rows = RevenueRollup.objects.filter(
+            period=period,
+            bucket=get_bucket(period, day),
+            company_id=company_id,
+            client_id=client_id,
+            currency=currency,
+        )
+        updates = {field: F(field) + value for field, value in deltas.items()}
+        if rows.update(**updates):
+            continue
+        try:
+            with transaction.atomic():
+                RevenueRollup.objects.create(
+                    period=period,
+                    bucket=get_bucket(period, day),
+                    company_id=company_id,
+                    client_id=client_id,
+                    currency=currency,
+                    **deltas,
+                )
+        except IntegrityError:
+            # Another writer created the bucket first
+            rows.update(**updates)
+
+
+def apply_change(old, new):
+    """Replace an old contribution with a new one"""
+    if old == new:
+        return
+    if old and new and old[0] == new[0]:
+        measures = set(old[1]) | set(new[1])
+        apply_delta(new[0], {
+            field: new[1].get(field, 0) - old[1].get(field, 0) for field in measures
+        })
+        return
+    if old:
+        apply_delta(old[0], {field: -value for field, value in old[1].items()})
+    if new:
+        apply_delta(new[0], new[1])
+
+
+def invoice_changed(pk, old_state, new_state):
+    """Apply an invoice write, moving its payments if its dimensions changed"""
+    apply_change(invoice_contribution(old_state), invoice_contribution(new_state))
+
+    if old_state and new_state and any(
+        old_state[field] != new_state[field] for field in DIMENSION_FIELDS
+    ):
+        payments = Payment.objects.filter(
+            invoice_id=pk
+        ).values(*PAYMENT_FIELDS)
+        for payment in payments:
+            apply_change(
+                payment_contribution(payment, old_state),
+                payment_contribution(payment, new_state),
+            )
+
+
+def payment_changed(old_state, new_state):
+    """Apply a payment write"""
+    invoices = {}
+    for state in (old_state, new_state):
+        if state and state['invoice_id'] not in invoices:
+            invoices[state['invoice_id']] = load_invoice_state(state['invoice_id'])
+    apply_change(
+        payment_contribution(old_state, invoices.get(old_state and old_state['invoice_id'])),
+        payment_contribution(new_state, invoices.get(new_state and new_state['invoice_id'])),
+    )
+
+
+def apply_contributions(contributions):
+    """Add many new contributions with one update per bucket, for bulk inserts"""
+    totals = defaultdict(lambda: defaultdict(int))
+    for key, measures in contributions:
+        for field, value in measures.items():
+            totals[key][field] += value
+    for key, deltas in totals.items():
+        apply_delta(key, deltas)
+
+
+def compute_rollups():
+    """Recompute every rollup row from the invoice and payment tables"""
+    expected = defaultdict(lambda: dict.fromkeys(MEASURES, 0))
+
+    invoices = Invoice.objects.filter(is_quotation=False).exclude(status='cancelled').order_by()
+    payments = Payment.objects.filter(invoice__is_quotation=False).order_by()
+
+    for period in PERIODS:
+        if period == 'month':
+            invoice_bucket, payment_bucket = TruncMonth('invoice_date'), TruncMonth('paid_on')
+        else:
+            invoice_bucket, payment_bucket = F('invoice_date'), F('paid_on')
+
+        invoice_rows = invoices.annotate(bucket=invoice_bucket).values(
+            'bucket', 'company_id', 'client_id', 'currency'
+        ).annotate(
+            invoice_count=Count('pk'),
+            invoiced=Sum('total'),
+            settled=Sum('amount_paid'),
+        )
+        for row in invoice_rows:
+            key = (period, row['bucket'], row['company_id'], row['client_id'], row['currency'])
+            for field in ('invoice_count', 'invoiced', 'settled'):
+                expected[key][field] += row[field]
+
+        payment_rows = payments.annotate(
+            bucket=payment_bucket,
+            company_id=F('invoice__company_id'),
+            client_id=F('invoice__client_id'),
+            currency=F('invoice__currency'),
+        ).values('bucket', 'company_id', 'client_id', 'currency').annotate(
+            payment_count=Count('pk'),
+            collected=Sum('amount'),
+        )
+        for row in payment_rows:
+            key = (period, row['bucket'], row['company_id'], row['client_id'], row['currency'])
+            for field in ('payment_count', 'collected'):
+                expected[key][field] += row[field]
+
+    for key, measures in archived_contributions():
+        day, *dimensions = key
+        for period in PERIODS:
+            for field, value in measures.items():
+                expected[(period, get_bucket(period, day), *dimensions)][field] += value
+
+    return expected
+
+
+def archived_contributions():
+    """Rollup keys and measures of archived invoices and their payments"""
+    archived = ArchivedInvoice.objects.order_by().values(
+        'invoice_date', 'company_id', 'client_id', 'currency',
+        'total', 'amount_paid', 'is_quotation', 'status', 'payload',
+    )
+    for state in archived.iterator(chunk_size=1000):
+        contribution = invoice_contribution(state)
+        if contribution:
+            yield contribution
+        for payment in state['payload'].get('payments', []):
+            fields = payment['fields']
+            contribution = payment_contribution({
+                'paid_on': date.fromisoformat(fields['paid_on']),
+                'amount': Decimal(fields['amount']),
+            }, state)
+            if contribution:
+                yield contribution
+
+
+def rebuild_rollups(batch_size=1000):
+    """Throw away all rollup rows and recompute them; returns the row count"""
+    expected = compute_rollups()
+    rows = [
+        RevenueRollup(
+            period=period,
+            bucket=bucket,
+            company_id=company_id,
+            client_id=client_id,
+            currency=currency,
+            **measures,
+        )
+        for (period, bucket, company_id, client_id, currency), measures in expected.items()
+    ]
+    with transaction.atomic():
+        RevenueRollup.objects.all().delete()
+        RevenueRollup.objects.bulk_create(rows, batch_size=batch_size)
+    return len(rows)
+
+
+def check_rollups():
+    """Compare stored rollups with a recomputation; returns a list of mismatches"""
+    expected = compute_rollups()
+    mismatches = []
+    stored = RevenueRollup.objects.values_list(
+        'period', 'bucket', 'company_id', 'client_id', 'currency', *MEASURES
+    )
+    for row in stored.iterator(chunk_size=2000):
+        key, measures = row[:5], dict(zip(MEASURES, row[5:]))
+        wanted = expected.pop(key, None) or dict.fromkeys(MEASURES, 0)
+        if any(measures[field] != wanted[field] for field in MEASURES):
+            mismatches.append((key, measures, wanted))
+    for key, wanted in expected.items():
+        if any(wanted.values()):
+            mismatches.append((key, dict.fromkeys(MEASURES, 0), wanted))
+    return mismatches
+
+
+def rollup_series(period='month', start=None, end=None, group_by=None, **filters):
+    """Read rollup totals per bucket (and optionally per dimension)"""
+    rows = RevenueRollup.objects.filter(period=period, **filters).order_by()
+    if start:
+        rows = rows.filter(bucket__gte=get_bucket(period, start))
+    if end:
+        rows = rows.filter(bucket__lte=end)
+    fields = ['bucket', 'currency'] + ([group_by] if group_by else [])
+    rows = rows.values(*fields).annotate(
+        invoice_count=Sum('invoice_count'),
+        invoiced=Sum('invoiced'),
+        settled=Sum('settled'),
+        payment_count=Sum('payment_count'),
+        collected=Sum('collected'),
+    ).order_by(*fields)
+    for row in rows:
+        row['outstanding'] = row['invoiced'] - row['settled']
+    return list(rows)
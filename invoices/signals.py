@@ -0,0 +1,167 @@
+from django.contrib.auth.models import User
+from django.contrib.auth.signals import user_logged_out
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from . import rollups
+from .archive import is_archiving
+from .auth import invalidate_user
+from .changes import record_change
+from .companies import invalidate_companies
+from .exchange_rates import invalidate_rates
+from .fragments import UNCACHED_FIELDS, invalidate_client_fragments, invalidate_invoice_fragments
+from .models import Client, Company, ExchangeRate, Invoice, InvoiceItem, Payment, PaymentInfo
+from .stats import invalidate_dashboard_summary
+
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_delete, sender=Invoice)
+@receiver(post_save, sender=InvoiceItem)
+@receiver(post_delete, sender=InvoiceItem)
+@receiver(post_save, sender=Payment)
+@receiver(post_delete, sender=Payment)
+def invalidate_dashboard(sender, **kwargs):
+    """Invoice and payment writes change the dashboard counters"""
+    invalidate_dashboard_summary()
+
+
+# Revenue rollups
+# pre_save remembers what the row looked like in the database so that
+# post_save can apply only the difference to the rollup buckets.
+
+@receiver(pre_save, sender=Invoice)
+def remember_invoice_state(sender, instance, raw=False, **kwargs):
+    if raw or rollups.is_suspended():
+        return
+    instance._rollup_state = rollups.load_invoice_state(instance.pk) if instance.pk else None
+
+
+@receiver(post_save, sender=Invoice)
+def update_invoice_rollups(sender, instance, created, raw=False, update_fields=None, **kwargs):
+    if raw or rollups.is_suspended():
+        return
+    old_state = None if created else getattr(instance, '_rollup_state', None)
+    new_state = rollups.invoice_state(instance)
+    if old_state and update_fields:
+        # Fields outside update_fields were not written and may be stale
+        new_state = {
+            field: new_state[field] if field.removesuffix('_id') in update_fields else value
+            for field, value in old_state.items()
+        }
+    rollups.invoice_changed(instance.pk, old_state, new_state)
+    instance._rollup_state = new_state
+
+
+@receiver(post_delete, sender=Invoice)
+def remove_invoice_rollups(sender, instance, **kwargs):
+    if rollups.is_suspended():
+        return
+    rollups.invoice_changed(instance.pk, rollups.invoice_state(instance), None)
+
+
+@receiver(pre_save, sender=Payment)
+def remember_payment_state(sender, instance, raw=False, **kwargs):
+    if raw or rollups.is_suspended():
+        return
+    instance._rollup_state = (
+        Payment.objects.filter(pk=instance.pk).values(*rollups.PAYMENT_FIELDS).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=Payment)
+def update_payment_rollups(sender, instance, created, raw=False, **kwargs):
+    if raw or rollups.is_suspended():
+        return
+    old_state = None if created else getattr(instance, '_rollup_state', None)
+    new_state = {field: getattr(instance, field) for field in rollups.PAYMENT_FIELDS}
+    rollups.payment_changed(old_state, new_state)
+    instance._rollup_state = new_state
+
+
+@receiver(post_delete, sender=Payment)
+def remove_payment_rollups(sender, instance, **kwargs):
+    if rollups.is_suspended():
+        return
+    old_state = {field: getattr(instance, field) for field in rollups.PAYMENT_FIELDS}
+    rollups.payment_changed(old_state, None)
+
+
+# Cached users (invoices.auth)
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def invalidate_saved_user(sender, instance, **kwargs):
+    """Profile, password and is_active changes must reach every worker"""
+    invalidate_user(instance.pk)
+
+
+@receiver(user_logged_out)
+def invalidate_logged_out_user(sender, request, user, **kwargs):
+    if user is not None:
+        invalidate_user(user.pk)
+
+
+@receiver(post_save, sender=Company)
+@receiver(post_delete, sender=Company)
+def invalidate_company_cache(sender, **kwargs):
+    invalidate_companies()
+
+
+@receiver(post_save, sender=ExchangeRate)
+@receiver(post_delete, sender=ExchangeRate)
+def invalidate_rate_cache(sender, **kwargs):
+    invalidate_rates()
+
+
+# Invoice detail fragments (invoices.fragments)
+# Archiving deletes invoices inside archive.archiving(); the archived copy
+# is cached under its own revision, so those deletes need no bump.
+
+@receiver(post_save, sender=Invoice)
+def invalidate_invoice_detail(sender, instance, update_fields=None, **kwargs):
+    if update_fields and UNCACHED_FIELDS.issuperset(update_fields):
+        return
+    invalidate_invoice_fragments(instance.pk)
+
+
+@receiver(post_save, sender=InvoiceItem)
+@receiver(post_save, sender=PaymentInfo)
+def invalidate_invoice_detail_parts(sender, instance, **kwargs):
+    invalidate_invoice_fragments(instance.invoice_id)
+
+
+@receiver(post_delete, sender=InvoiceItem)
+@receiver(post_delete, sender=PaymentInfo)
+def remove_invoice_detail_parts(sender, instance, **kwargs):
+    if is_archiving():
+        return
+    invalidate_invoice_fragments(instance.invoice_id)
+
+
+@receiver(post_save, sender=Client)
+@receiver(post_delete, sender=Client)
+def invalidate_client_detail(sender, instance, **kwargs):
+    invalidate_client_fragments(instance.pk)
+
+
+# Change feed (invoices.changes)
+
+@receiver(post_save, sender=Invoice)
+@receiver(post_save, sender=InvoiceItem)
+@receiver(post_save, sender=Payment)
+@receiver(post_save, sender=Client)
+def log_change(sender, instance, raw=False, **kwargs):
+    if raw or is_archiving():
+        return
+    record_change(instance)
+
+
+@receiver(post_delete, sender=Invoice)
+@receiver(post_delete, sender=InvoiceItem)
+@receiver(post_delete, sender=Payment)
+@receiver(post_delete, sender=Client)
+def log_deletion(sender, instance, **kwargs):
+    if is_archiving():
+        return
+    record_change(instance, deleted=True)
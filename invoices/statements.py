@@ -0,0 +1,156 @@
+"""
+Client statements of account.
+
+``statement_ledger`` merges a client's invoices (debits) and payments
+(credits) into one chronological ledger in a single SQL query. The running
+balance is a window ``SUM`` over every entry up to the end of the period, so
+the opening balance needs no second query: it is the running balance of a
+zero-amount "opening balance" row placed before the first day.
+
+An invoice whose ``amount_paid`` is more than its recorded payments (one
+marked paid before that recorded a payment, or imported as paid) is
+credited the difference on its invoice date.
+
+Quotations and cancelled invoices are left out. Archived invoices are fully
+paid or cancelled and net to nothing, so they do not change the balances,
+but their lines are not listed.
+"""
+from datetime import date
+from decimal import Decimal
+
+from django.db import connections, router
+from django.db.models import Count
+
+from .models import Invoice, Payment
+
+# Ledger rows per PDF page (the first also holds the statement header); each
+# page is its own small table, which xhtml2pdf lays out far faster than one
+# table thousands of rows long
+STATEMENT_PAGE_ROWS = 40
+STATEMENT_FIRST_PAGE_ROWS = 25
+
+CENT = Decimal('0.01')
+
+# Method of the credit for the part of amount_paid no payment accounts for
+UNRECORDED_METHOD = 'marked_paid'
+
+LEDGER_SQL = '''
+WITH entries AS (
+    -- Sorts before every entry dated ``start``, after every earlier one
+    SELECT %(start)s AS day, 0 AS sort, NULL AS invoice_id, NULL AS payment_id,
+           '' AS reference, '' AS method, 0 AS debit, 0 AS credit
+    UNION ALL
+    SELECT i.invoice_date, 1, i.id, NULL, i.invoice_number, '', i.total, 0
+    FROM {invoice} i
+    WHERE {filters} AND i.invoice_date <= %(end)s
+    UNION ALL
+    SELECT p.paid_on, 2, i.id, p.id, i.invoice_number, p.method, 0, p.amount
+    FROM {payment} p JOIN {invoice} i ON i.id = p.invoice_id
+    WHERE {filters} AND p.paid_on <= %(end)s
+    UNION ALL
+    SELECT i.invoice_date, 3, i.id, NULL, i.invoice_number, %(unrecorded)s, 0, i.amount_paid - paid.amount
+    FROM {invoice} i JOIN (
+        SELECT i.id AS invoice_id, COALESCE(SUM(p.amount), 0) AS amount
+        FROM {invoice} i LEFT JOIN {payment} p ON p.invoice_id = i.id
+        WHERE {filters}
+        GROUP BY i.id
+    ) paid ON paid.invoice_id = i.id
+    WHERE i.invoice_date <= %(end)s AND i.amount_paid > paid.amount
+),
+ledger AS (
+    SELECT entries.*,
+           SUM(debit - credit) OVER (
+               ORDER BY day, sort, invoice_id, payment_id ROWS UNBOUNDED PRECEDING
+           ) AS balance
+    FROM entries
+)
+SELECT day, invoice_id, payment_id, reference, method, debit, credit, balance
+FROM ledger
+WHERE day >= %(start)s
+ORDER BY day, sort, invoice_id, payment_id
+'''
+
+
+def to_date(value):
+    # SQLite returns the dates of a UNION as text
+    return date.fromisoformat(value) if isinstance(value, str) else value
+
+
+def to_decimal(value):
+    # SQLite sums decimals as floats
+    return Decimal(str(value or 0)).quantize(CENT)
+
+
+def statement_ledger(client_id, currency, start, end, company_id=None):
+    """Ledger rows for a client's invoices and payments in one currency.
+
+    Returns a list of dicts with ``day``, ``invoice_id``, ``payment_id``,
+    ``reference``, payment ``method`` label, ``debit``, ``credit`` and running
+    ``balance``; a credit without a ``payment_id`` is unrecorded ``amount_paid``. The first row is the opening balance on ``start``.
+    """
+    filters = [
+        'i.client_id = %(client)s', 'i.currency = %(currency)s',
+        'i.is_quotation = %(false)s', "i.status <> 'cancelled'",
+    ]
+    if company_id:
+        filters.append('i.company_id = %(company)s')
+    sql = LEDGER_SQL.format(
+        invoice=Invoice._meta.db_table, payment=Payment._meta.db_table, filters=' AND '.join(filters),
+    )
+    params = {
+        'client': client_id, 'currency': currency, 'company': company_id,
+        'false': False, 'start': start, 'end': end, 'unrecorded': UNRECORDED_METHOD,
+    }
+    connection = connections[router.db_for_read(Invoice)]
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        columns = [column[0] for column in cursor.description]
+        rows = [dict(zip(columns, row)) for row in cursor.fetchall()]
+    methods = dict(Payment.METHOD_CHOICES, **{UNRECORDED_METHOD: 'Marked paid'})
+    for row in rows:
+        row['day'] = to_date(row['day'])
+        row['method'] = methods.get(row['method'], row['method'])
+        for field in ('debit', 'credit', 'balance'):
+            row[field] = to_decimal(row[field])
+    return rows
+
+
+def statement_summary(rows):
+    """Opening and closing balance and the totals billed and paid in a ledger"""
+    return {
+        'opening': rows[0]['balance'],
+        'closing': rows[-1]['balance'],
+        'billed': sum((row['debit'] for row in rows), Decimal('0.00')),
+        'paid': sum((row['credit'] for row in rows), Decimal('0.00')),
+    }
+
+
+def statement_pages(rows, size=STATEMENT_PAGE_ROWS, first_size=STATEMENT_FIRST_PAGE_ROWS):
+    """Ledger entries (without the opening row) split into PDF pages.
+
+    Each page carries the balance brought forward from the previous page
+    and the balance carried forward to the next.
+    """
+    entries = rows[1:]
+    balance = rows[0]['balance']
+    pages = []
+    start = 0
+    while start < len(entries) or not pages:
+        page_rows = entries[start:start + (size if pages else first_size)]
+        start += len(page_rows) or 1
+        pages.append({
+            'rows': page_rows,
+            'brought_forward': balance,
+            'carried_forward': page_rows[-1]['balance'] if page_rows else balance,
+        })
+        balance = pages[-1]['carried_forward']
+    return pages
+
+
+def client_currencies(client_id):
+    """Currencies the client has been invoiced in, the most used first"""
+    return list(
+        Invoice.objects.filter(client_id=client_id, is_quotation=False)
+        .order_by().values('currency').annotate(n=Count('pk'))
+        .order_by('-n', 'currency').values_list('currency', flat=True)
+    )
@@ -0,0 +1,121 @@
+"""
+Dashboard statistics.
+
+All counters are computed with a single conditional-aggregation query grouped
+by currency. The headline revenue and outstanding add up every currency
+from the rupee amounts stored on each invoice (see
+``invoices.exchange_rates``). The monthly trend is read from the revenue
+rollups, and the result is cached per user until an invoice or payment
+changes (see ``invoices.signals``).
+"""
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db.models import Count, F, Q, Sum
+
+from .caching import bump_version, versioned_key
+from .models import Invoice
+from .rollups import rollup_series
+
+DASHBOARD_NAMESPACE = 'dashboard'
+DASHBOARD_CACHE_TIMEOUT = 60 * 15
+TREND_MONTHS = 6
+
+
+def compute_dashboard_summary(today=None):
+    """Compute dashboard counters and per-currency totals in one query"""
+    today = today or date.today()
+    outstanding_filter = Q(is_quotation=False) & ~Q(status__in=['paid', 'cancelled'])
+
+    rows = (
+        Invoice.objects.order_by()
+        .values('currency')
+        .annotate(
+            count=Count('pk'),
+            paid=Count('pk', filter=Q(status='paid')),
+            unpaid=Count('pk', filter=~Q(status='paid')),
+            overdue=Count('pk', filter=Q(due_date__lt=today, status__in=['draft', 'sent'])),
+            revenue=Sum('total'),
+            outstanding=Sum(F('total') - F('amount_paid'), filter=outstanding_filter),
+            revenue_base=Sum('total_base'),
+            outstanding_base=Sum(F('total_base') - F('amount_paid_base'), filter=outstanding_filter),
+            unconverted=Count('pk', filter=Q(total_base__isnull=True)),
+        )
+        .order_by('currency')
+    )
+
+    summary = {
+        'total_invoices': 0,
+        'paid_invoices': 0,
+        'unpaid_invoices': 0,
+        'overdue_invoices': 0,
+        'total_revenue': Decimal('0.00'),
+        'total_outstanding': Decimal('0.00'),
+        # Invoices left out of the totals above for want of an exchange rate
+        'unconverted_invoices': 0,
+        'currency_totals': [],
+    }
+    for row in rows:
+        revenue = row['revenue'] or Decimal('0.00')
+        outstanding = row['outstanding'] or Decimal('0.00')
+        summary['total_invoices'] += row['count']
+        summary['paid_invoices'] += row['paid']
+        summary['unpaid_invoices'] += row['unpaid']
+        summary['overdue_invoices'] += row['overdue']
+        summary['total_revenue'] += row['revenue_base'] or Decimal('0.00')
+        summary['total_outstanding'] += row['outstanding_base'] or Decimal('0.00')
+        summary['unconverted_invoices'] += row['unconverted']
+        summary['currency_totals'].append({
+            'currency': row['currency'],
+            'count': row['count'],
+            'revenue': revenue,
+            'outstanding': outstanding,
+        })
+    summary['monthly_trend'] = compute_monthly_trend(today)
+    return summary
+
+
+def compute_monthly_trend(today, months=TREND_MONTHS, currency='INR'):
+    """Invoiced vs collected per month, read from the monthly rollups"""
+    start = today.replace(day=1)
+    for _ in range(months - 1):
+        start = (start - timedelta(days=1)).replace(day=1)
+
+    rows = {
+        row['bucket']: row
+        for row in rollup_series('month', start=start, currency=currency)
+    }
+    trend = []
+    month = start
+    while month <= today:
+        row = rows.get(month, {})
+        trend.append({
+            'month': month,
+            'invoiced': row.get('invoiced') or Decimal('0.00'),
+            'collected': row.get('collected') or Decimal('0.00'),
+            'outstanding': row.get('outstanding') or Decimal('0.00'),
+        })
+        month = (month + timedelta(days=32)).replace(day=1)
+
+    peak = max([row['invoiced'] for row in trend] + [row['collected'] for row in trend])
+    for row in trend:
+        row['invoiced_pct'] = int(row['invoiced'] * 100 / peak) if peak else 0
+        row['collected_pct'] = int(row['collected'] * 100 / peak) if peak else 0
+    return trend
+
+
+def get_dashboard_summary(user):
+    """Get the cached dashboard summary for a user"""
+    today = date.today()
+    key = versioned_key(DASHBOARD_NAMESPACE, user.pk, today.isoformat())
+    summary = cache.get(key)
+    if summary is None:
+        summary = compute_dashboard_summary(today)
+        cache.set(key, summary, DASHBOARD_CACHE_TIMEOUT)
+    return summary
+
+
+def invalidate_dashboard_summary():
+    """Drop cached dashboard summaries for all users"""
+    bump_version(DASHBOARD_NAMESPACE)
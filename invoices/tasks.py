@@ -0,0 +1,24 @@
+"""
+Tasks run by ``manage.py run_worker``. Queue them with ``invoices.jobs.enqueue``.
+"""
+from .emails import fail_deliveries, send_deliveries
+from .fragments import invalidate_invoice_fragments
+from .jobs import task
+from .models import Invoice
+
+
+@task
+def generate_qr_codes(invoice_ids):
+    """UPI QR codes for invoices created in bulk, which Invoice.save would have made"""
+    invoices = Invoice.objects.filter(pk__in=invoice_ids, qr_code='').select_related('company')
+    for invoice in invoices:
+        if invoice.company.upi_id:
+            invoice.generate_qr_code()
+            # The footer fragment may have been cached without the code
+            invalidate_invoice_fragments(invoice.pk)
+
+
+@task(on_give_up=fail_deliveries)
+def send_emails(delivery_ids):
+    """Send a batch of queued invoice and receipt emails over one connection"""
+    send_deliveries(delivery_ids)
@@ -1,3 +1,530 @@
-from django.test import TestCase
+import smtplib
+import sqlite3
+import subprocess
+import tempfile
+from datetime import date, timedelta
+from decimal import Decimal
+from html.parser import HTMLParser
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.admin import site
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.cache import cache
+from django.core.cache.utils import make_template_fragment_key
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.db import connections, router
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+
+from invoice.routers import STICKY_COOKIE, ReplicaRouter, StickyPrimaryMiddleware, read_replica
+
+from . import rollups
+from .admin import ArchivedInvoiceAdmin
+from .archive import archive_invoices, is_archiving, restore_invoice
+from .backup import BackupError, copy_sqlite, reset_caches, run_pg
+from .bulk import create_invoices
+from .companies import get_company
+from .emails import queue_invoice_emails
+from .exchange_rates import rate_for
+from .fragments import fragment_versions
+from .jobs import claim_job, requeue_stale, run_job
+from .statements import statement_ledger, statement_summary
+from .management.commands.check_query_plans import Command as CheckQueryPlans
+from .models import (
+    ArchivedInvoice, ChangeLog, Client, Company, EmailDelivery, ExchangeRate, Invoice, InvoiceItem, Job, Payment,
+)
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+# A second SQLite file standing in for the read replica. The test runner
+# creates it with the other test databases. It has an alias of its own that
+# ReplicaRoutingTests swaps in for "replica", so no other test is routed to it.
+TEST_REPLICA = 'test_replica'
+REPLICA_FILE = Path(tempfile.gettempdir()) / 'squarem_test_replica.sqlite3'
+connections.settings[TEST_REPLICA] = {
+    **connections.settings['default'],
+    'NAME': str(REPLICA_FILE),
+    'TEST': {**connections.settings['default']['TEST'], 'NAME': str(REPLICA_FILE), 'MIRROR': None},
+}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReplicaRoutingTests(TransactionTestCase):
+    """Reads in @read_replica views go to the replica, writes and sticky reads to the primary"""
+
+    databases = {'default', TEST_REPLICA}
+
+    def setUp(self):
+        alias = mock.patch('invoice.routers.REPLICA_ALIAS', TEST_REPLICA)
+        alias.start()
+        self.addCleanup(alias.stop)
+
+        self.user = User.objects.create_user('owner', password='pw')
+        Client.objects.create(name='Replicated', billing_address='Kochi')
+        self.copy_to_replica()
+        # Written after the copy, so only the primary has it
+        Client.objects.create(name='Lagging', billing_address='Kochi')
+        self.client.force_login(self.user)
+
+    def copy_to_replica(self):
+        """Make the replica a copy of the primary as it is now"""
+        for alias in ('default', TEST_REPLICA):
+            connections[alias].ensure_connection()
+        connections['default'].connection.backup(connections[TEST_REPLICA].connection)
+
+    def client_names(self):
+        response = self.client.get('/clients/')
+        self.assertEqual(response.status_code, 200)
+        return sorted(client.name for client in response.context['clients'])
+
+    def test_read_replica_view_reads_the_replica(self):
+        self.assertEqual(self.client_names(), ['Replicated'])
+
+    def test_router_uses_replica_only_inside_read_replica(self):
+        seen = {}
+
+        @read_replica
+        def view(request):
+            seen['read'] = router.db_for_read(Invoice)
+            seen['write'] = router.db_for_write(Invoice)
+            return HttpResponse()
+
+        view(RequestFactory().get('/'))
+        self.assertEqual(seen, {'read': TEST_REPLICA, 'write': 'default'})
+        self.assertIsNone(ReplicaRouter().db_for_read(Invoice))
+
+    def test_writes_go_to_the_primary(self):
+        @read_replica
+        def view(request):
+            client = Client.objects.create(name='Written', billing_address='Kochi')
+            return HttpResponse(client._state.db)
+
+        response = view(RequestFactory().post('/'))
+        self.assertEqual(response.content, b'default')
+        self.assertTrue(Client.objects.using('default').filter(name='Written').exists())
+        self.assertFalse(Client.objects.using(TEST_REPLICA).filter(name='Written').exists())
+
+    def test_reads_stick_to_the_primary_after_a_post(self):
+        response = self.client.post('/clients/create/', {
+            'name': 'Posted', 'billing_address': 'Kochi', 'billing_country': 'India',
+        })
+        self.assertEqual(response.status_code, 302)
+        self.assertIn(STICKY_COOKIE, response.cookies)
+        self.assertEqual(self.client_names(), ['Lagging', 'Posted', 'Replicated'])
+
+        # Once the window has passed, reads go back to the replica
+        del self.client.cookies[STICKY_COOKIE]
+        self.assertEqual(self.client_names(), ['Replicated'])
+
+    def test_safe_requests_do_not_stick(self):
+        middleware = StickyPrimaryMiddleware(lambda request: HttpResponse())
+        response = middleware(RequestFactory().get('/'))
+        self.assertNotIn(STICKY_COOKIE, response.cookies)
+
+
+class QueryPlanTests(TestCase):
+    """The hot queries keep using indexes on a seeded database"""
+
+    def test_hot_queries_use_indexes(self):
+        out = StringIO()
+        # Raises CommandError naming any query that scans a table or sorts in a temp B-tree
+        call_command('check_query_plans', invoices=5000, current_database=True, stdout=out)
+        self.assertIn('invoice_list: ', out.getvalue())
+        self.assertIn('All hot queries use indexes.', out.getvalue())
+        # The seed data was rolled back
+        self.assertFalse(Invoice.objects.exists())
+
+    def test_find_problems_flags_scans_and_sorts(self):
+        problems = CheckQueryPlans().find_problems(
+            '3 0 0 SCAN invoices_invoice\n'
+            '8 0 0 SEARCH invoices_client USING INTEGER PRIMARY KEY (rowid=?)\n'
+            '20 0 0 USE TEMP B-TREE FOR ORDER BY'
+        )
+        self.assertEqual(problems, ['SCAN invoices_invoice', 'USE TEMP B-TREE FOR ORDER BY'])
+        self.assertEqual(CheckQueryPlans().find_problems('3 0 0 SCAN invoices_invoice USING INDEX invoice_date_idx'), [])
+
+
+class BackupTests(SimpleTestCase):
+    """Backups fail with a BackupError the commands can report"""
+
+    def test_copy_gives_up_on_a_database_that_keeps_changing(self):
+        with tempfile.TemporaryDirectory() as scratch:
+            live = str(Path(scratch) / 'live.sqlite3')
+            writer = sqlite3.connect(live)
+            writer.execute('CREATE TABLE t (x BLOB)')
+            writer.executemany('INSERT INTO t VALUES (?)', [(b'x' * 4000,)] * 100)
+            writer.commit()
+
+            class BusyConnection(sqlite3.Connection):
+                """Another connection writes after every step of the copy"""
+                def backup(self, target, progress=None, **kwargs):
+                    def step(*args):
+                        writer.execute('INSERT INTO t VALUES (1)')
+                        writer.commit()
+                        progress(*args)
+                    return super().backup(target, progress=step, **kwargs)
+
+            connect = sqlite3.connect
+            with mock.patch('invoices.backup.sqlite3.connect', lambda path, **kwargs: connect(
+                path, factory=BusyConnection if path == live else sqlite3.Connection, **kwargs
+            )):
+                with self.assertRaisesMessage(BackupError, 'kept changing'):
+                    copy_sqlite(live, str(Path(scratch) / 'copy.sqlite3'), pages=10, sleep=0, max_restarts=2)
+            writer.close()
+
+    def test_missing_or_failing_pg_tools_raise_backup_errors(self):
+        with mock.patch('subprocess.run', side_effect=FileNotFoundError):
+            with self.assertRaisesMessage(BackupError, 'pg_dump is not installed'):
+                run_pg(['pg_dump', 'invoice'])
+        with mock.patch('subprocess.run', side_effect=subprocess.CalledProcessError(1, 'pg_restore')):
+            with self.assertRaisesMessage(BackupError, 'pg_restore failed with exit status 1'):
+                run_pg(['pg_restore', '--list', 'database.dump'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ArchivingTests(TestCase):
+    """Moving invoices into and out of the archive is not an edit or a delete"""
+
+    def setUp(self):
+        company = Company.objects.create(name='Squarem', address='Kochi', state='Kerala')
+        client = Client.objects.create(name='Acme', billing_address='Kochi')
+        self.invoice = Invoice.objects.create(
+            company=company, client=client, invoice_date=date(2020, 5, 1), due_date=date(2020, 5, 31),
+        )
+        InvoiceItem.objects.create(invoice=self.invoice, description='Work', quantity=1, rate=100, tax_rate=18)
+        self.invoice.refresh_from_db()
+        self.invoice.status = 'paid'
+        self.invoice.amount_paid = self.invoice.total
+        self.invoice.save()
+
+    def test_archive_and_restore_leave_the_change_feed_alone(self):
+        logged = ChangeLog.objects.count()
+        self.assertEqual(list(archive_invoices(date(2021, 4, 1))), [1])
+        self.assertFalse(Invoice.objects.exists())
+        restore_invoice(ArchivedInvoice.objects.get())
+        self.assertEqual(Invoice.objects.get().total, Decimal('118.00'))
+        self.assertEqual(ChangeLog.objects.count(), logged)
+        self.assertFalse(is_archiving())
+
+    def test_email_deliveries_survive_the_archive(self):
+        EmailDelivery.objects.create(kind='invoice', invoice=self.invoice, recipient='a@acme.test', status='sent')
+        list(archive_invoices(date(2021, 4, 1)))
+        self.assertFalse(EmailDelivery.objects.exists())
+        archived = ArchivedInvoice.objects.get()
+        self.assertEqual([delivery.recipient for delivery in archived.email_deliveries()], ['a@acme.test'])
+        self.assertFalse(ArchivedInvoiceAdmin(ArchivedInvoice, site).has_delete_permission(None, archived))
+
+        restore_invoice(archived)
+        self.assertEqual(EmailDelivery.objects.get().invoice_id, self.invoice.pk)
+
+    def test_suspended_rollups_still_log_changes(self):
+        logged = ChangeLog.objects.count()
+        with rollups.suspended():
+            self.invoice.delete()
+        # Tombstones for the invoice and its item
+        self.assertEqual(ChangeLog.objects.count(), logged + 2)
+
+    def test_suspended_rollups_still_log_bulk_inserts(self):
+        logged = ChangeLog.objects.count()
+        record = {
+            'company': self.invoice.company_id, 'client': self.invoice.client_id,
+            'invoice_date': '2026-05-01', 'due_date': '2026-05-31', 'status': 'draft', 'currency': 'INR',
+            'items': [{'description': 'Work', 'quantity': 1, 'rate': 100, 'tax_rate': 18}],
+        }
+        with rollups.suspended():
+            results = create_invoices([record])
+        self.assertTrue(results[0]['ok'], results)
+        # The invoice and its item
+        self.assertEqual(ChangeLog.objects.count(), logged + 2)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RestoreCacheTests(TestCase):
+    """After a restore nothing cached about the old data is served"""
+
+    def test_reset_caches_reloads_memoised_reference_data(self):
+        company = Company.objects.create(name='Before', address='Kochi')
+        ExchangeRate.objects.create(currency='USD', date=date(2026, 1, 1), rate=Decimal('83.00'))
+        self.assertEqual(get_company(company.pk).name, 'Before')
+        self.assertEqual(rate_for('USD', date(2026, 2, 1)), Decimal('83.00'))
+
+        # What a restore does: the rows change underneath, no signals are sent
+        Company.objects.filter(pk=company.pk).update(name='Restored')
+        ExchangeRate.objects.filter(currency='USD').update(rate=Decimal('84.00'))
+        self.assertEqual(get_company(company.pk).name, 'Before')
+
+        reset_caches()
+        self.assertEqual(get_company(company.pk).name, 'Restored')
+        self.assertEqual(rate_for('USD', date(2026, 2, 1)), Decimal('84.00'))
+
+
+class TagBalance(HTMLParser):
+    """Tracks open elements; void elements never need closing"""
+
+    VOID = {'area', 'base', 'br', 'col', 'embed', 'hr', 'img', 'input', 'link', 'meta', 'source', 'wbr'}
+
+    def __init__(self):
+        super().__init__()
+        self.open = []
+        self.errors = []
+
+    def handle_starttag(self, tag, attrs):
+        if tag not in self.VOID:
+            self.open.append(tag)
+
+    def handle_endtag(self, tag):
+        if not self.open or self.open[-1] != tag:
+            self.errors.append(f'</{tag}> closes {self.open[-1] if self.open else "nothing"}')
+        else:
+            self.open.pop()
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class InvoiceDetailFragmentTests(TestCase):
+    """Each cached fragment of the detail page is a complete element"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pw')
+        self.client.force_login(self.user)
+        company = Company.objects.create(name='Squarem', address='Kochi', state='Kerala')
+        customer = Client.objects.create(name='Acme', billing_address='Kochi', billing_state='Kerala')
+        self.invoice = Invoice.objects.create(
+            company=company, client=customer, invoice_date=date(2026, 5, 1), due_date=date(2026, 5, 31),
+        )
+        InvoiceItem.objects.create(invoice=self.invoice, description='Work', quantity=1, rate=100, tax_rate=18)
+        self.invoice.refresh_from_db()
+
+    def test_cached_fragments_are_balanced(self):
+        self.assertEqual(self.client.get(f'/invoices/{self.invoice.pk}/').status_code, 200)
+        versions = fragment_versions(self.invoice)
+        invoice = self.invoice
+        fragments = {
+            'invoice_company': [invoice.company_id, versions['company']],
+            'invoice_addresses': [invoice.client_id, versions['client']],
+            'invoice_items': [invoice.pk, versions['invoice']],
+            'invoice_summary': [invoice.pk, versions['invoice']],
+            'invoice_totals': [invoice.pk, versions['invoice']],
+            'invoice_footer': [invoice.pk, versions['invoice'], versions['client'], versions['company']],
+        }
+        for name, vary_on in fragments.items():
+            with self.subTest(fragment=name):
+                html = cache.get(make_template_fragment_key(name, vary_on))
+                self.assertIsNotNone(html)
+                parser = TagBalance()
+                parser.feed(html)
+                self.assertEqual(parser.errors, [])
+                self.assertEqual(parser.open, [])
+
+    def test_balance_due_is_not_cached(self):
+        url = f'/invoices/{self.invoice.pk}/'
+        self.assertContains(self.client.get(url), '<tr><td>Balance Due</td><td>₹ 118</td></tr>', html=True)
+        Payment.objects.create(invoice=self.invoice, amount=Decimal('18.00'))
+        response = self.client.get(url)
+        self.assertContains(response, '<tr class="total-row"><td>Total</td><td>₹ 118</td></tr>', html=True)
+        self.assertContains(response, '<tr><td>Balance Due</td><td>₹ 100</td></tr>', html=True)
+
+
+class FlakyBackend(locmem.EmailBackend):
+    """locmem backend that refuses some recipients and can drop the connection"""
+
+    connections = 0
+    # Messages in the outbox after which the connection drops, or None
+    disconnect_after = None
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        FlakyBackend.connections += 1
+
+    def send_messages(self, messages):
+        for message in messages:
+            if any(address.endswith('@refused.test') for address in message.to):
+                raise smtplib.SMTPRecipientsRefused({address: (550, b'No such user') for address in message.to})
+            if self.disconnect_after is not None and len(mail.outbox) >= self.disconnect_after:
+                raise smtplib.SMTPServerDisconnected('Connection unexpectedly closed')
+        return super().send_messages(messages)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EMAIL_BACKEND='invoices.tests.FlakyBackend')
+class EmailDeliveryTests(TestCase):
+    """Queued emails go out in batches over one connection, recording each try"""
+
+    def setUp(self):
+        FlakyBackend.connections = 0
+        FlakyBackend.disconnect_after = None
+        company = Company.objects.create(name='Squarem', address='Kochi', state='Kerala', email='billing@squarem.test')
+        self.invoices = []
+        for address in ('a@acme.test', 'b@acme.test', 'c@refused.test'):
+            client = Client.objects.create(name=address, billing_address='Kochi', email=address)
+            invoice = Invoice.objects.create(
+                company=company, client=client, invoice_date=date(2026, 5, 1), due_date=date(2026, 5, 31),
+            )
+            InvoiceItem.objects.create(invoice=invoice, description='Work', quantity=1, rate=100, tax_rate=18)
+            self.invoices.append(invoice)
+
+    def run_jobs(self):
+        while (job := claim_job('test')) is not None:
+            run_job(job)
+
+    def delivery(self, address):
+        return EmailDelivery.objects.get(recipient=address)
+
+    def test_batch_is_sent_over_one_connection(self):
+        queue_invoice_emails(self.invoices[:2])
+        self.assertEqual(Job.objects.count(), 1)
+        self.run_jobs()
+
+        self.assertEqual(FlakyBackend.connections, 1)
+        self.assertEqual(sorted(message.to[0] for message in mail.outbox), ['a@acme.test', 'b@acme.test'])
+        self.assertEqual(mail.outbox[0].attachments[0][2], 'application/pdf')
+        for delivery in EmailDelivery.objects.all():
+            self.assertEqual((delivery.status, delivery.attempts), ('sent', 1))
+            self.assertIsNotNone(delivery.sent_at)
+        self.assertEqual(Invoice.objects.get(pk=self.invoices[0].pk).status, 'sent')
+
+    def test_refused_and_dropped_messages_are_recorded_and_retried(self):
+        queue_invoice_emails(self.invoices)
+        FlakyBackend.disconnect_after = 1
+        self.run_jobs()
+
+        # The connection dropped after the first message; the job waits to be retried
+        job = Job.objects.get()
+        self.assertEqual((job.status, job.attempts), ('queued', 1))
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual((self.delivery('a@acme.test').status, self.delivery('a@acme.test').attempts), ('sent', 1))
+        dropped = self.delivery('b@acme.test')
+        self.assertEqual((dropped.status, dropped.attempts), ('queued', 1))
+        self.assertIn('unexpectedly closed', dropped.error)
+        self.assertEqual(self.delivery('c@refused.test').attempts, 0)
+
+        FlakyBackend.disconnect_after = None
+        Job.objects.update(run_at=timezone.now())
+        self.run_jobs()
+
+        self.assertEqual(Job.objects.get().status, 'done')
+        self.assertEqual(FlakyBackend.connections, 2)
+        self.assertEqual(len(mail.outbox), 2)
+        sent = self.delivery('b@acme.test')
+        self.assertEqual((sent.status, sent.attempts, sent.error), ('sent', 2, ''))
+        self.assertEqual(self.delivery('a@acme.test').attempts, 1)
+        refused = self.delivery('c@refused.test')
+        self.assertEqual((refused.status, refused.attempts), ('failed', 1))
+        self.assertIn('No such user', refused.error)
+
+    def test_deliveries_fail_when_the_job_gives_up(self):
+        queue_invoice_emails(self.invoices)
+        Job.objects.update(max_attempts=1)
+        FlakyBackend.disconnect_after = 1
+        self.run_jobs()
+
+        self.assertEqual(Job.objects.get().status, 'failed')
+        self.assertEqual(self.delivery('a@acme.test').status, 'sent')
+        dropped = self.delivery('b@acme.test')
+        self.assertEqual(dropped.status, 'failed')
+        self.assertIn('unexpectedly closed', dropped.error)
+        untried = self.delivery('c@refused.test')
+        self.assertEqual((untried.status, untried.attempts), ('failed', 0))
+        self.assertIn('unexpectedly closed', untried.error)
+
+    def test_deliveries_fail_when_a_stale_job_gives_up(self):
+        queue_invoice_emails(self.invoices)
+        stopped = timezone.now() - timedelta(hours=1)
+        Job.objects.update(status='running', attempts=3, locked_by='dead', locked_at=stopped)
+
+        self.assertEqual(requeue_stale(), 1)
+        self.assertEqual(Job.objects.get().status, 'failed')
+        for delivery in EmailDelivery.objects.all():
+            self.assertEqual((delivery.status, delivery.error), ('failed', 'The worker stopped before finishing the job.'))
+
+    def test_bulk_send_skips_paid_invoices_and_quotations_unless_filtered(self):
+        self.client.force_login(User.objects.create_user('owner', password='pw'))
+        paid, quotation, _ = self.invoices
+        Invoice.objects.filter(pk=paid.pk).update(status='paid')
+        Invoice.objects.filter(pk=quotation.pk).update(is_quotation=True)
+
+        self.client.post('/invoices/send/')
+        self.assertEqual(list(EmailDelivery.objects.values_list('recipient', flat=True)), ['c@refused.test'])
+
+        self.client.post('/invoices/send/', {'kind': 'quotation'})
+        self.assertTrue(EmailDelivery.objects.filter(recipient='b@acme.test').exists())
+        self.assertFalse(EmailDelivery.objects.filter(recipient='a@acme.test').exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PivotReportTests(TestCase):
+    """Pivot totals never add up amounts in different currencies"""
+
+    def setUp(self):
+        self.client.force_login(User.objects.create_user('owner', password='pw'))
+        company = Company.objects.create(name='Squarem', address='Kochi', state='Kerala')
+        client = Client.objects.create(name='Acme', billing_address='Kochi')
+        for currency, rate in (('INR', 1000), ('USD', 10)):
+            invoice = Invoice.objects.create(
+                company=company, client=client, currency=currency,
+                invoice_date=date(2026, 5, 1), due_date=date(2026, 5, 31),
+            )
+            InvoiceItem.objects.create(invoice=invoice, description='Work', quantity=1, rate=rate, tax_rate=0)
+        patcher = mock.patch('invoices.analytics._cache', None)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def pivot(self, **params):
+        response = self.client.get('/reports/pivot/', {'table': 'invoices', 'format': 'json', **params})
+        return response.json()
+
+    def test_currencies_are_grouped_apart(self):
+        report = self.pivot(group='month')
+        self.assertEqual(report['group_by'], ['month', 'currency'])
+        self.assertEqual(
+            sorted((row['currency'], row['total']) for row in report['rows']), [('INR', 1000.0), ('USD', 10.0)]
+        )
+
+    def test_one_filtered_currency_needs_no_grouping(self):
+        report = self.pivot(group='month', currency='USD')
+        self.assertEqual(report['group_by'], ['month'])
+        self.assertEqual([row['total'] for row in report['rows']], [10.0])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class StatementTests(TestCase):
+    """Statement balances count every rupee marked as paid"""
+
+    def setUp(self):
+        self.user = User.objects.create_user('owner', password='pw')
+        self.client.force_login(self.user)
+        company = Company.objects.create(name='Squarem', address='Kochi', state='Kerala')
+        self.customer = Client.objects.create(name='Acme', billing_address='Kochi')
+        self.invoice = Invoice.objects.create(
+            company=company, client=self.customer, invoice_date=date(2026, 5, 1), due_date=date(2026, 5, 31),
+        )
+        InvoiceItem.objects.create(invoice=self.invoice, description='Work', quantity=1, rate=1000, tax_rate=0)
+
+    def summary(self):
+        rows = statement_ledger(self.customer.pk, 'INR', date(2026, 4, 1), max(date.today(), date(2026, 6, 30)))
+        return rows, statement_summary(rows)
+
+    def test_mark_paid_records_a_payment(self):
+        response = self.client.post(f'/invoices/{self.invoice.pk}/mark-paid/')
+        self.assertEqual(response.status_code, 302)
+        payment = Payment.objects.get()
+        self.assertEqual(payment.amount, Decimal('1000.00'))
+        self.invoice.refresh_from_db()
+        self.assertEqual((self.invoice.status, self.invoice.amount_paid), ('paid', Decimal('1000.00')))
+        rows, summary = self.summary()
+        self.assertEqual(summary['closing'], Decimal('0.00'))
+        self.assertEqual(rows[-1]['payment_id'], payment.pk)
+
+    def test_amount_paid_without_payments_is_credited(self):
+        # Marked paid before mark-paid recorded a payment
+        Invoice.objects.filter(pk=self.invoice.pk).update(status='paid', amount_paid=Decimal('1000.00'))
+        rows, summary = self.summary()
+        self.assertEqual((summary['billed'], summary['paid'], summary['closing']),
+                         (Decimal('1000.00'), Decimal('1000.00'), Decimal('0.00')))
+        self.assertEqual((rows[-1]['payment_id'], rows[-1]['method']), (None, 'Marked paid'))
+
+        response = self.client.get(f'/clients/{self.customer.pk}/statement/?start=2026-04-01&end=2026-06-30')
+        self.assertContains(response, 'Payment (Marked paid)')
@@ -1,5 +1,12 @@
+from django.conf import settings
 from django.urls import path
-from . import views
+from . import api, views
+
+# Under ASGI the read-heavy pages can be served by async views
+if settings.ASYNC_VIEWS:
+    from . import async_views as read_views
+else:
+    read_views = views
 
 urlpatterns = [
     # Authentication
@@ -7,7 +14,14 @@ urlpatterns = [
     path('logout/', views.logout_view, name='logout'),
     
     # Dashboard
-    path('', views.dashboard, name='dashboard'),
+    path('', read_views.dashboard, name='dashboard'),
+    
+    # Reports
+    path('reports/revenue/', views.revenue_report, name='revenue_report'),
+    path('reports/pivot/', views.pivot_report, name='pivot_report'),
+    path('reports/aging/', views.aging_report, name='aging_report'),
+    path('reports/gst/', views.gst_report, name='gst_report'),
+    path('reports/cache-stats/', views.cache_stats, name='cache_stats'),
     
     # Company URLs
     path('companies/', views.company_list, name='company_list'),
@@ -18,17 +32,36 @@ urlpatterns = [
     # Client URLs
     path('clients/', views.client_list, name='client_list'),
     path('clients/create/', views.client_create, name='client_create'),
+    path('clients/duplicates/', views.client_duplicates, name='client_duplicates'),
+    path('clients/merge/', views.client_merge, name='client_merge'),
     path('clients/<int:pk>/edit/', views.client_edit, name='client_edit'),
     path('clients/<int:pk>/delete/', views.client_delete, name='client_delete'),
+    path('clients/<int:pk>/statement/', views.client_statement, name='client_statement'),
+    path('clients/<int:pk>/statement/pdf/', views.client_statement_pdf, name='client_statement_pdf'),
     
     # Invoice URLs
-    path('invoices/', views.invoice_list, name='invoice_list'),
+    path('invoices/', read_views.invoice_list, name='invoice_list'),
     path('invoices/create/', views.invoice_create, name='invoice_create'),
-    path('invoices/<int:pk>/', views.invoice_detail, name='invoice_detail'),
+    path('invoices/export/<str:dataset>/', views.invoice_export, name='invoice_export'),
+    path('invoices/send/', views.invoice_bulk_send, name='invoice_bulk_send'),
+    path('invoices/<int:pk>/', read_views.invoice_detail, name='invoice_detail'),
     path('invoices/<int:pk>/edit/', views.invoice_edit, name='invoice_edit'),
     path('invoices/<int:pk>/delete/', views.invoice_delete, name='invoice_delete'),
-    path('invoices/<int:pk>/pdf/', views.invoice_pdf, name='invoice_pdf'),
+    path('invoices/<int:pk>/pdf/', read_views.invoice_pdf, name='invoice_pdf'),
+    path('invoices/<int:pk>/send/', views.invoice_send, name='invoice_send'),
     path('invoices/<int:invoice_pk>/payments/new/', views.payment_create, name='payment_create'),
-    path('payments/<int:pk>/receipt/', views.payment_receipt_pdf, name='payment_receipt_pdf'),
+    path('payments/<int:pk>/receipt/', read_views.payment_receipt_pdf, name='payment_receipt_pdf'),
+    path('payments/<int:pk>/receipt/send/', views.payment_send_receipt, name='payment_send_receipt'),
     path('invoices/<int:pk>/mark-paid/', views.invoice_mark_paid, name='invoice_mark_paid'),
+
+    # Recurring invoice URLs
+    path('recurring/', views.recurring_list, name='recurring_list'),
+    path('recurring/create/', views.recurring_create, name='recurring_create'),
+    path('recurring/<int:pk>/edit/', views.recurring_edit, name='recurring_edit'),
+    path('recurring/<int:pk>/toggle/', views.recurring_toggle, name='recurring_toggle'),
+    path('recurring/<int:pk>/delete/', views.recurring_delete, name='recurring_delete'),
+
+    # JSON API
+    path('api/invoices/bulk/', api.invoice_bulk_create, name='api_invoice_bulk_create'),
+    path('api/changes/', api.changes, name='api_changes'),
 ]
@@ -2,17 +2,45 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import login, logout, authenticate
 from django.contrib import messages
-from django.db.models import Sum, Count, Q
-from django.http import HttpResponse
+from django.db.models import Count
+from django.db import router
+from django.http import Http404, HttpResponse, JsonResponse
 from django.template.loader import get_template
+from django.urls import reverse
+import os
+import time
 from datetime import date, timedelta
 from decimal import Decimal
+from urllib.parse import urlencode
 
-from .models import Company, Client, Invoice, InvoiceItem, PaymentInfo, Payment
+from invoice.routers import read_replica
+
+from .models import (
+    ArchivedInvoice, Company, Client, Invoice, InvoiceItem, PaymentInfo, Payment,
+    RecurringInvoice,
+)
 from .forms import (
     CompanyForm, ClientForm, InvoiceForm, 
-    InvoiceItemFormSet, InvoiceItemFormSetEdit, PaymentInfoForm, PaymentForm
+    InvoiceItemFormSet, InvoiceItemFormSetEdit, PaymentInfoForm, PaymentForm,
+    RecurringInvoiceForm, RecurringInvoiceItemFormSet, recurring_item_formset,
+)
+from .companies import all_companies, company_cache_stats, get_company
+from .dedupe import find_duplicates, merge_clients
+from .emails import queue_invoice_emails, queue_receipt_email
+from .exports import EXPORT_FORMATS, EXPORT_LABELS, EXPORTS, export_response, stream_csv, stream_json
+from .filters import active_filters, filter_invoices
+from .fragments import fragment_versions
+from .pdf import PdfError, html_to_pdf
+from .recurring import resume, schedule_initial
+from .reports import (
+    AGING_BUCKETS, GST_COLUMNS, aging_invoices, aging_summary, fiscal_year_start, gst_summary,
 )
+from .rollups import rollup_series
+from .statements import client_currencies, statement_ledger, statement_pages, statement_summary
+from .stats import get_dashboard_summary
+
+AGING_DRILLDOWN_LIMIT = 200
+CLIENT_DUPLICATES_LIMIT = 200
 
 
 # Authentication Views
@@ -45,42 +73,240 @@ def logout_view(request):
 
 # Dashboard
 @login_required
+@read_replica
 def dashboard(request):
     """Main dashboard with statistics"""
-    invoices = Invoice.objects.all()
-    
-    # Statistics
-    total_invoices = invoices.count()
-    total_revenue = invoices.aggregate(Sum('total'))['total__sum'] or Decimal('0.00')
-    paid_invoices = invoices.filter(status='paid').count()
-    unpaid_invoices = invoices.exclude(status='paid').count()
-    
-    # Recent invoices
-    recent_invoices = invoices.order_by('-created_at')[:10]
-    
-    # Overdue invoices
-    overdue_invoices = invoices.filter(
-        due_date__lt=date.today(),
-        status__in=['draft', 'sent']
-    ).count()
-    
-    context = {
-        'total_invoices': total_invoices,
-        'total_revenue': total_revenue,
-        'paid_invoices': paid_invoices,
-        'unpaid_invoices': unpaid_invoices,
-        'overdue_invoices': overdue_invoices,
-        'recent_invoices': recent_invoices,
-    }
+    context = dict(get_dashboard_summary(request.user))
+    context['recent_invoices'] = (
+        Invoice.objects.select_related('client').order_by('-created_at')[:10]
+    )
     
     return render(request, 'invoices/dashboard.html', context)
 
 
+@login_required
+@read_replica
+def revenue_report(request):
+    """Invoiced, collected and outstanding amounts per day or month"""
+    period = request.GET.get('period', 'month')
+    if period not in ('day', 'month'):
+        period = 'month'
+    group = request.GET.get('group')
+    group_field = {'company': 'company__name', 'client': 'client__name'}.get(group)
+
+    filters = {}
+    for param in ('company', 'client'):
+        if request.GET.get(param, '').isdigit():
+            filters[f'{param}_id'] = int(request.GET[param])
+    if request.GET.get('currency'):
+        filters['currency'] = request.GET['currency']
+
+    # Default window: the last 12 months, or the last 31 days for daily buckets
+    end = date.today()
+    start = end - timedelta(days=31 if period == 'day' else 365)
+    try:
+        if request.GET.get('start'):
+            start = date.fromisoformat(request.GET['start'])
+        if request.GET.get('end'):
+            end = date.fromisoformat(request.GET['end'])
+    except ValueError:
+        messages.error(request, 'Invalid date range.')
+
+    rows = rollup_series(period, start=start, end=end, group_by=group_field, **filters)
+    for row in rows:
+        row['label'] = row.get(group_field, '')
+    
+    return render(request, 'invoices/revenue_report.html', {
+        'rows': rows,
+        'period': period,
+        'group': group if group_field else '',
+        'start': start,
+        'end': end,
+        'companies': all_companies(),
+        'clients': Client.objects.only('pk', 'name'),
+        'currencies': Invoice.CURRENCY_CHOICES,
+    })
+
+
+@login_required
+@read_replica
+def pivot_report(request):
+    """Ad-hoc pivot over the in-memory analytics cache"""
+    try:
+        from .analytics import dimension_labels, get_analytics_cache
+    except ImportError:
+        messages.error(request, 'numpy is not installed. Please install it to use pivot reports.')
+        return redirect('dashboard')
+
+    analytics = get_analytics_cache()
+    table_name = request.GET.get('table', 'items')
+    if table_name not in analytics.tables:
+        table_name = 'items'
+
+    started = time.perf_counter()
+    analytics.refresh()
+    table = analytics.tables[table_name]
+    group_by = [dim for dim in request.GET.getlist('group') if dim in table.dimensions] or ['month']
+    # Match on the string form so booleans and numbers survive the query string
+    filters = {
+        dim: [value for value in table.values[dim] if str(value) in request.GET.getlist(dim)]
+        for dim in table.dimensions
+        if request.GET.getlist(dim)
+    }
+    # Amounts are in the invoice's own currency, so never add rupees to dollars
+    if 'currency' not in group_by and len(filters.get('currency', table.values['currency'])) > 1:
+        group_by.append('currency')
+    rows = table.query(group_by, filters)
+    elapsed_ms = (time.perf_counter() - started) * 1000
+    # Clients and companies are cached by pk; show their current names
+    labels = {dim: dimension_labels(dim, table.values[dim]) for dim in table.dimensions}
+
+    if request.GET.get('format') == 'json':
+        for row in rows:
+            for dim in set(group_by) & {'client', 'company'}:
+                row[f'{dim}_id'], row[dim] = row[dim], labels[dim][row[dim]]
+        return JsonResponse({
+            'table': table_name,
+            'group_by': group_by,
+            'rows': rows,
+            'elapsed_ms': round(elapsed_ms, 2),
+            'memory_bytes': analytics.memory_usage(),
+        })
+
+    return render(request, 'invoices/pivot_report.html', {
+        'table_name': table_name,
+        'tables': list(analytics.tables),
+        'dimensions': table.dimensions,
+        'dimension_values': {
+            dim: sorted(((str(value), str(label)) for value, label in labels[dim].items()), key=lambda pair: pair[1])
+            for dim in table.dimensions
+        },
+        'measures': table.measures,
+        'group_by': group_by,
+        'filters': filters,
+        'rows': [
+            {'groups': [labels[dim][row[dim]] for dim in group_by], 'count': row['count'],
+             'measures': [row[measure] for measure in table.measures]}
+            for row in rows
+        ],
+        'row_count': len(table),
+        'elapsed_ms': elapsed_ms,
+        'memory_bytes': sum(analytics.memory_usage().values()),
+    })
+
+
+@login_required
+@read_replica
+def aging_report(request):
+    """Receivables aging per client or company, with invoice drill-down"""
+    group = 'company' if request.GET.get('group') == 'company' else 'client'
+    bucket = request.GET.get('bucket')
+    if bucket not in [key for key, label, min_days, max_days in AGING_BUCKETS]:
+        bucket = None
+    owner_id = request.GET.get('id', '')
+    export = request.GET.get('format') == 'csv'
+    today = date.today()
+    # CSV rows are read after the view returns, outside @read_replica
+    using = router.db_for_read(Invoice)
+
+    if owner_id.isdigit():
+        # Drill down to the invoices behind one row / cell
+        invoices = aging_invoices(today, bucket, **{f'{group}_id': int(owner_id)}).select_related('client', 'company')
+        if export:
+            rows = (
+                (inv.invoice_number, inv.client.name, inv.company.name, inv.invoice_date, inv.due_date,
+                 inv.currency, inv.total, inv.amount_paid, inv.balance, inv.aging_bucket)
+                for inv in invoices.using(using).iterator(chunk_size=2000)
+            )
+            return stream_csv(
+                f'aging_{group}_{owner_id}.csv',
+                ['Invoice', 'Client', 'Company', 'Invoice Date', 'Due Date', 'Currency',
+                 'Total', 'Paid', 'Balance', 'Days Overdue'],
+                rows,
+            )
+        return render(request, 'invoices/aging_report.html', {
+            'group': group,
+            'bucket': bucket,
+            'owner_id': owner_id,
+            'buckets': AGING_BUCKETS,
+            'invoices': invoices[:AGING_DRILLDOWN_LIMIT],
+            'drilldown_limit': AGING_DRILLDOWN_LIMIT,
+        })
+
+    rows = aging_summary(group, today, using=using)
+    if export:
+        return stream_csv(
+            f'aging_by_{group}.csv',
+            [group.title(), 'Currency', 'Invoices']
+            + [label for key, label, min_days, max_days in AGING_BUCKETS] + ['Total'],
+            ([row['name'], row['currency'], row['invoice_count']] + row['buckets'] + [row['outstanding']] for row in rows),
+        )
+    return render(request, 'invoices/aging_report.html', {
+        'group': group,
+        'buckets': AGING_BUCKETS,
+        'rows': list(rows),
+    })
+
+
+@login_required
+@read_replica
+def gst_report(request):
+    """GST summary by month, tax rate and client GSTIN"""
+    today = date.today()
+    start, end = fiscal_year_start(today), today
+    try:
+        if request.GET.get('start'):
+            start = date.fromisoformat(request.GET['start'])
+        if request.GET.get('end'):
+            end = date.fromisoformat(request.GET['end'])
+    except ValueError:
+        messages.error(request, 'Invalid date range.')
+    company_id = request.GET.get('company')
+    company_id = int(company_id) if company_id and company_id.isdigit() else None
+
+    # CSV and JSON rows are read after the view returns, outside @read_replica
+    rows = gst_summary(start, end, company_id, using=router.db_for_read(Invoice))
+    export = request.GET.get('format')
+    filename = f'gst_summary_{start:%Y%m%d}_{end:%Y%m%d}'
+    if export == 'csv':
+        return stream_csv(
+            f'{filename}.csv',
+            [label for field, label in GST_COLUMNS],
+            ([row[field] for field, label in GST_COLUMNS] for row in rows),
+        )
+    if export == 'json':
+        return stream_json(
+            f'{filename}.json',
+            ({field: row[field] for field, label in GST_COLUMNS} for row in rows),
+        )
+
+    rows = list(rows)
+    totals = {
+        field: sum((row[field] for row in rows), Decimal('0.00'))
+        for field in ('taxable_value', 'cgst', 'sgst', 'igst', 'tax_amount')
+    }
+    return render(request, 'invoices/gst_report.html', {
+        'rows': rows,
+        'totals': totals,
+        'start': start,
+        'end': end,
+        'companies': all_companies(),
+    })
+
+
+@login_required
+def cache_stats(request):
+    """This worker's reference-data cache counters, for staff"""
+    if not request.user.is_staff:
+        return JsonResponse({'error': 'Staff only'}, status=403)
+    return JsonResponse({'pid': os.getpid(), 'companies': company_cache_stats()})
+
+
 # Company Views
 @login_required
 def company_list(request):
     """List all companies"""
-    companies = Company.objects.all()
+    companies = all_companies()
     return render(request, 'invoices/company_list.html', {'companies': companies})
 
 
@@ -132,6 +358,7 @@ def company_delete(request, pk):
 
 # Client Views
 @login_required
+@read_replica
 def client_list(request):
     """List all clients"""
     clients = Client.objects.all()
@@ -173,6 +400,69 @@ def client_edit(request, pk):
     return render(request, 'invoices/client_form.html', {'form': form, 'action': 'Edit', 'client': client})
 
 
+def client_statement_context(request, client):
+    """Ledger and options of a client statement from the query string"""
+    today = date.today()
+    start, end = fiscal_year_start(today), today
+    try:
+        if request.GET.get('start'):
+            start = date.fromisoformat(request.GET['start'])
+        if request.GET.get('end'):
+            end = date.fromisoformat(request.GET['end'])
+    except ValueError:
+        messages.error(request, 'Invalid date range.')
+    currencies = client_currencies(client.pk) or ['INR']
+    currency = request.GET.get('currency')
+    if currency not in currencies:
+        currency = currencies[0]
+    company_id = request.GET.get('company')
+    company_id = int(company_id) if company_id and company_id.isdigit() else None
+
+    rows = statement_ledger(client.pk, currency, start, end, company_id)
+    return {
+        'client': client,
+        'company': get_company(company_id) if company_id else None,
+        'companies': all_companies(),
+        'currencies': currencies,
+        'currency': currency,
+        'start': start,
+        'end': end,
+        'rows': rows,
+        'summary': statement_summary(rows),
+    }
+
+
+@login_required
+@read_replica
+def client_statement(request, pk):
+    """Statement of account: a client's invoices and payments with running balance"""
+    client = get_object_or_404(Client, pk=pk)
+    return render(request, 'invoices/client_statement.html', client_statement_context(request, client))
+
+
+@login_required
+@read_replica
+def client_statement_pdf(request, pk):
+    """Statement of account as a PDF, one small table per page"""
+    client = get_object_or_404(Client, pk=pk)
+    context = client_statement_context(request, client)
+    context['pages'] = statement_pages(context['rows'])
+    html = get_template('invoices/client_statement_pdf.html').render(context)
+    try:
+        content = html_to_pdf(html)
+    except ImportError:
+        messages.error(request, 'xhtml2pdf is not installed. Please install it to generate PDFs.')
+    except PdfError:
+        messages.error(request, 'Error generating PDF.')
+    else:
+        response = HttpResponse(content, content_type='application/pdf')
+        disposition = 'attachment' if request.GET.get('download') else 'inline'
+        filename = f"statement_{client.pk}_{context['start']:%Y%m%d}_{context['end']:%Y%m%d}.pdf"
+        response['Content-Disposition'] = f'{disposition}; filename="{filename}"'
+        return response
+    return redirect(f"{reverse('client_statement', args=[pk])}?{request.GET.urlencode()}")
+
+
 @login_required
 def client_delete(request, pk):
     """Delete client"""
@@ -187,26 +477,66 @@ def client_delete(request, pk):
     return render(request, 'invoices/client_confirm_delete.html', {'client': client})
 
 
+@login_required
+@read_replica
+def client_duplicates(request):
+    """Likely duplicate clients, the most likely first"""
+    candidates = find_duplicates(limit=CLIENT_DUPLICATES_LIMIT)
+    return render(request, 'invoices/client_duplicates.html', {
+        'candidates': candidates,
+        'limit': CLIENT_DUPLICATES_LIMIT,
+    })
+
+
+@login_required
+def client_merge(request):
+    """Merge duplicate clients into the one kept (POST keep=<pk>, merge=<pk>...)"""
+    if request.method == 'POST':
+        try:
+            keep_id = int(request.POST.get('keep', ''))
+            duplicate_ids = {int(pk) for pk in request.POST.getlist('merge')} - {keep_id}
+        except ValueError:
+            raise Http404
+        clients = Client.objects.in_bulk([keep_id, *duplicate_ids])
+        if keep_id not in clients or len(clients) != len(duplicate_ids) + 1:
+            messages.error(request, 'Those clients no longer exist; they may have been merged already.')
+        elif duplicate_ids:
+            target = clients.pop(keep_id)
+            names = ', '.join(f'"{client.name}"' for client in clients.values())
+            moved = merge_clients(target, list(clients.values()))
+            messages.success(request, f'Merged {names} into "{target.name}", moving {moved} invoices.')
+
+    return redirect('client_duplicates')
+
+
 # Invoice Views
 @login_required
+@read_replica
 def invoice_list(request):
     """List all invoices"""
-    invoices = Invoice.objects.select_related('client', 'company').all()
-    
-    # Filter by status
-    status_filter = request.GET.get('status')
-    if status_filter:
-        invoices = invoices.filter(status=status_filter)
-    
-    # Search
-    search_query = request.GET.get('q')
-    if search_query:
-        invoices = invoices.filter(
-            Q(invoice_number__icontains=search_query) |
-            Q(client__name__icontains=search_query)
-        )
-    
-    return render(request, 'invoices/invoice_list.html', {'invoices': invoices})
+    invoices = filter_invoices(Invoice.objects.select_related('client', 'company').all(), request.GET)
+    filters = active_filters(request.GET)
+
+    return render(request, 'invoices/invoice_list.html', {
+        'invoices': invoices,
+        'companies': all_companies(),
+        'clients': Client.objects.only('pk', 'name'),
+        'active_filters': filters,
+        'export_query': urlencode(filters),
+        'export_datasets': EXPORT_LABELS.items(),
+    })
+
+
+@login_required
+@read_replica
+def invoice_export(request, dataset):
+    """Stream the filtered invoices, their line items or payments as CSV or XLSX"""
+    export_format = request.GET.get('format', 'csv')
+    if dataset not in EXPORTS or export_format not in EXPORT_FORMATS:
+        raise Http404('Unknown export')
+    invoices = filter_invoices(Invoice.objects.all(), request.GET)
+    # Rows are read while streaming, after @read_replica has returned
+    return export_response(dataset, invoices, export_format, using=router.db_for_read(Invoice))
 
 
 @login_required
@@ -283,26 +613,44 @@ def invoice_edit(request, pk):
     })
 
 
+def get_archived_invoice(pk):
+    """Archived invoice by its original primary key, or 404"""
+    archived = get_object_or_404(ArchivedInvoice.objects.select_related('client'), original_id=pk)
+    archived.company = get_company(archived.company_id)
+    return archived
+
+
 @login_required
+@read_replica
 def invoice_detail(request, pk):
     """View invoice details in printable format"""
-    invoice = get_object_or_404(
-        Invoice.objects.select_related('company', 'client').prefetch_related('items'),
-        pk=pk
-    )
+    invoice = Invoice.objects.select_related('client').filter(pk=pk).first()
     
-    # Get or create payment info
-    payment_info, created = PaymentInfo.objects.get_or_create(invoice=invoice)
-    payments = invoice.payments.all()
+    if invoice is None:
+        # Archived invoices are shown read-only from their snapshot
+        archived = get_archived_invoice(pk)
+        invoice, items, payments, payment_info = archived.unpack()
+    else:
+        archived = None
+        invoice.company = get_company(invoice.company_id)
+        # Lazy: only queried when the item table fragment is not cached
+        items = invoice.items.all()
+        # Get or create payment info
+        payment_info, created = PaymentInfo.objects.get_or_create(invoice=invoice)
+        payments = invoice.payments.all()
     
     # Build PDF URL for sharing
     pdf_url = request.build_absolute_uri(f'/invoices/{pk}/pdf/')
     
     context = {
         'invoice': invoice,
+        'items': items,
         'payment_info': payment_info,
         'payments': payments,
         'pdf_url': pdf_url,
+        'archived': archived,
+        'fragments': fragment_versions(invoice, archived),
+        'deliveries': archived.email_deliveries()[:5] if archived else invoice.email_deliveries.all()[:5],
     }
     
     return render(request, 'invoices/invoice_detail.html', context)
@@ -314,14 +662,57 @@ def invoice_mark_paid(request, pk):
     invoice = get_object_or_404(Invoice, pk=pk)
     
     if request.method == 'POST':
+        balance = invoice.total - invoice.amount_paid
+        if balance > 0:
+            # Recorded as a payment so statements and rollups see the money
+            Payment.objects.create(invoice=invoice, amount=balance, is_advance=False, note='Marked as paid')
+            invoice.refresh_from_db()
         invoice.status = 'paid'
-        invoice.amount_paid = invoice.total
         invoice.save()
         messages.success(request, f'Invoice "{invoice.invoice_number}" marked as paid.')
     
     return redirect('invoice_detail', pk=pk)
 
 
+@login_required
+def invoice_send(request, pk):
+    """Email the invoice PDF to the client (sent by the background worker)"""
+    invoice = get_object_or_404(Invoice.objects.select_related('client'), pk=pk)
+
+    if request.method == 'POST':
+        deliveries, skipped = queue_invoice_emails([invoice], request.user)
+        if deliveries:
+            messages.success(request, f'Invoice "{invoice.invoice_number}" will be emailed to {invoice.client.email}.')
+        else:
+            messages.error(request, f'{invoice.client.name} has no email address.')
+
+    return redirect('invoice_detail', pk=pk)
+
+
+@login_required
+def invoice_bulk_send(request):
+    """Email every invoice matching the list filters to its client.
+
+    Cancelled invoices are never sent; paid invoices and quotations only
+    when the filters ask for them.
+    """
+    filters = active_filters(request.POST)
+    if request.method == 'POST':
+        invoices = Invoice.objects.select_related('client').exclude(status='cancelled')
+        if not filters.get('status'):
+            invoices = invoices.exclude(status='paid')
+        if not filters.get('kind'):
+            invoices = invoices.filter(is_quotation=False)
+        invoices = filter_invoices(invoices, request.POST)
+        deliveries, skipped = queue_invoice_emails(invoices, request.user)
+        if deliveries:
+            messages.success(request, f'{len(deliveries)} invoices will be emailed.')
+        if skipped:
+            messages.warning(request, f'{len(skipped)} invoices were skipped: their clients have no email address.')
+
+    return redirect(f"{reverse('invoice_list')}?{urlencode(filters)}" if filters else 'invoice_list')
+
+
 @login_required
 def invoice_delete(request, pk):
     """Delete invoice"""
@@ -337,15 +728,18 @@ def invoice_delete(request, pk):
 
 
 @login_required
+@read_replica
 def invoice_pdf(request, pk):
     """Generate PDF from invoice"""
-    invoice = get_object_or_404(
-        Invoice.objects.select_related('company', 'client').prefetch_related('items'),
-        pk=pk
-    )
+    invoice = Invoice.objects.select_related('client').prefetch_related('items').filter(pk=pk).first()
     
-    # Get or create payment info
-    payment_info, created = PaymentInfo.objects.get_or_create(invoice=invoice)
+    if invoice is None:
+        invoice, items, payments, payment_info = get_archived_invoice(pk).unpack()
+    else:
+        invoice.company = get_company(invoice.company_id)
+        items = invoice.items.all()
+        # Get or create payment info
+        payment_info, created = PaymentInfo.objects.get_or_create(invoice=invoice)
     
     try:
         from xhtml2pdf import pisa
@@ -355,6 +749,7 @@ def invoice_pdf(request, pk):
         template = get_template('invoices/invoice_pdf.html')
         context = {
             'invoice': invoice,
+            'items': items,
             'payment_info': payment_info,
         }
         html_string = template.render(context)
@@ -407,10 +802,12 @@ def payment_create(request, invoice_pk):
 
 
 @login_required
+@read_replica
 def payment_receipt_pdf(request, pk):
     """Generate PDF receipt for a specific payment"""
-    payment = get_object_or_404(Payment.objects.select_related('invoice__client', 'invoice__company'), pk=pk)
+    payment = get_object_or_404(Payment.objects.select_related('invoice__client'), pk=pk)
     invoice = payment.invoice
+    invoice.company = get_company(invoice.company_id)
 
     try:
         from xhtml2pdf import pisa
@@ -439,3 +836,123 @@ def payment_receipt_pdf(request, pk):
         messages.error(request, 'xhtml2pdf is not installed. Please install it to generate PDFs.')
 
     return redirect('invoice_detail', pk=invoice.pk)
+
+
+@login_required
+def payment_send_receipt(request, pk):
+    """Email a payment receipt to the client (sent by the background worker)"""
+    payment = get_object_or_404(Payment.objects.select_related('invoice__client'), pk=pk)
+
+    if request.method == 'POST':
+        if queue_receipt_email(payment, request.user):
+            messages.success(request, f'The receipt will be emailed to {payment.invoice.client.email}.')
+        else:
+            messages.error(request, f'{payment.invoice.client.name} has no email address.')
+
+    return redirect('invoice_detail', pk=payment.invoice_id)
+
+
+# Recurring Invoice Views
+@login_required
+def recurring_list(request):
+    """List recurring invoice schedules"""
+    schedules = RecurringInvoice.objects.select_related('client').annotate(invoice_count=Count('runs'))
+    return render(request, 'invoices/recurring_list.html', {'schedules': schedules})
+
+
+@login_required
+def recurring_create(request):
+    """Create a recurring schedule, prefilled from an invoice with ?invoice=<pk>"""
+    initial, items = {}, []
+    invoice_pk = request.GET.get('invoice')
+    if invoice_pk:
+        invoice = get_object_or_404(Invoice.objects.select_related('client'), pk=invoice_pk)
+        initial, items = schedule_initial(invoice)
+    # One form per item copied from the invoice
+    formset_class = recurring_item_formset(extra=max(1, len(items)))
+
+    if request.method == 'POST':
+        form = RecurringInvoiceForm(request.POST)
+        formset = formset_class(request.POST, instance=RecurringInvoice(), prefix='items')
+
+        if form.is_valid() and formset.is_valid():
+            schedule = form.save(commit=False)
+            schedule.next_run = schedule.start_date
+            schedule.created_by = request.user
+            schedule.save()
+            formset.instance = schedule
+            formset.save()
+            messages.success(request, f'Recurring invoice "{schedule.name}" created. First invoice on {schedule.next_run:%d %b %Y}.')
+            return redirect('recurring_list')
+        else:
+            messages.error(request, 'Please correct the errors below.')
+    else:
+        form = RecurringInvoiceForm(initial=initial)
+        formset = formset_class(instance=RecurringInvoice(), prefix='items', initial=items)
+
+    return render(request, 'invoices/recurring_form.html', {
+        'form': form,
+        'formset': formset,
+        'action': 'Create',
+    })
+
+
+@login_required
+def recurring_edit(request, pk):
+    """Edit a recurring schedule and its items"""
+    schedule = get_object_or_404(RecurringInvoice, pk=pk)
+
+    if request.method == 'POST':
+        form = RecurringInvoiceForm(request.POST, instance=schedule)
+        formset = RecurringInvoiceItemFormSet(request.POST, instance=schedule, prefix='items')
+
+        if form.is_valid() and formset.is_valid():
+            schedule = form.save()
+            formset.save()
+            messages.success(request, f'Recurring invoice "{schedule.name}" updated successfully.')
+            return redirect('recurring_list')
+        else:
+            messages.error(request, 'Please correct the errors below.')
+    else:
+        form = RecurringInvoiceForm(instance=schedule)
+        formset = RecurringInvoiceItemFormSet(instance=schedule, prefix='items')
+
+    return render(request, 'invoices/recurring_form.html', {
+        'form': form,
+        'formset': formset,
+        'action': 'Edit',
+        'schedule': schedule,
+        'runs': schedule.runs.all()[:12],
+    })
+
+
+@login_required
+def recurring_toggle(request, pk):
+    """Pause or resume a recurring schedule"""
+    schedule = get_object_or_404(RecurringInvoice, pk=pk)
+
+    if request.method == 'POST':
+        if schedule.is_active:
+            schedule.is_active = False
+            schedule.save(update_fields=['is_active', 'updated_at'])
+            messages.success(request, f'Recurring invoice "{schedule.name}" paused.')
+        elif schedule.end_date and schedule.next_run > schedule.end_date:
+            messages.error(request, f'Recurring invoice "{schedule.name}" has ended. Change its end date to resume it.')
+        else:
+            resume(schedule)
+            messages.success(request, f'Recurring invoice "{schedule.name}" resumed. Next invoice on {schedule.next_run:%d %b %Y}.')
+
+    return redirect('recurring_list')
+
+
+@login_required
+def recurring_delete(request, pk):
+    """Delete a recurring schedule; the invoices it generated are kept"""
+    schedule = get_object_or_404(RecurringInvoice, pk=pk)
+
+    if request.method == 'POST':
+        name = schedule.name
+        schedule.delete()
+        messages.success(request, f'Recurring invoice "{name}" deleted successfully.')
+
+    return redirect('recurring_list')
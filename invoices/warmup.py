@@ -0,0 +1,84 @@
+"""
+Worker warm-up.
+
+PDF generation (xhtml2pdf/reportlab), QR codes (qrcode/PIL) and amounts in
+words (num2words) are imported lazily so management commands and migrations
+do not pay for them. A web worker, however, should not make its first user
+wait for them either: ``warm_up()`` loads those libraries, compiles the main
+templates and the URLconf, and renders a throwaway PDF, so it can be run by
+gunicorn (see ``gunicorn.conf.py``) before a worker takes traffic.
+"""
+import time
+from io import BytesIO
+
+WARMUP_TEMPLATES = [
+    'invoices/base.html',
+    'invoices/dashboard.html',
+    'invoices/invoice_list.html',
+    'invoices/invoice_detail.html',
+    'invoices/invoice_pdf.html',
+    'invoices/payment_receipt_pdf.html',
+]
+
+
+def _import_libraries():
+    import num2words  # noqa: F401
+    import qrcode  # noqa: F401
+    from PIL import Image, PngImagePlugin  # noqa: F401
+    from xhtml2pdf import pisa  # noqa: F401
+
+
+def _load_number_words():
+    from num2words import num2words
+    # Each language module is imported on first use
+    num2words(1234, lang='en_IN')
+
+
+def _load_templates():
+    from django.template.loader import get_template
+    for name in WARMUP_TEMPLATES:
+        get_template(name)
+
+
+def _load_urls():
+    from django.urls import get_resolver
+    # Resolving once imports every view module
+    get_resolver().resolve('/')
+
+
+def _render_pdf():
+    from xhtml2pdf import pisa
+    pisa.pisaDocument(BytesIO(b'<html><body><p>warm-up</p></body></html>'), BytesIO())
+
+
+def _render_qr_code():
+    import qrcode
+    qrcode.make('upi://pay?pa=warmup').save(BytesIO(), format='PNG')
+
+
+STEPS = [
+    ('libraries', _import_libraries),
+    ('num2words', _load_number_words),
+    ('templates', _load_templates),
+    ('urls', _load_urls),
+    ('pdf', _render_pdf),
+    ('qr_code', _render_qr_code),
+]
+
+
+def warm_up():
+    """Run every warm-up step; returns ``{step: seconds}`` (None if it failed)
+
+    A missing optional library only skips its step: the matching views already
+    tell the user when it is not installed.
+    """
+    timings = {}
+    for name, step in STEPS:
+        started = time.perf_counter()
+        try:
+            step()
+        except ImportError:
+            timings[name] = None
+            continue
+        timings[name] = time.perf_counter() - started
+    return timings